@@ -0,0 +1,191 @@
+"""
+Audio preprocessing for Pawscribed
+Probes uploaded audio for its real container, codec, sample rate and duration,
+and normalizes it to 16 kHz mono before it is sent to the speech backend.
+
+ffprobe/ffmpeg are used when installed. Without them only PCM WAV can be
+handled: it is probed from its header and downmixed/resampled in-process.
+"""
+
+import os
+import json
+import wave
+import shutil
+import logging
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+from audio_segmentation import WavAudio
+
+try:
+    import audioop  # Deprecated in 3.13; only used when ffmpeg is unavailable
+except ImportError:  # pragma: no cover
+    audioop = None
+
+logger = logging.getLogger(__name__)
+
+TARGET_SAMPLE_RATE = int(os.getenv("AUDIO_TARGET_SAMPLE_RATE", "16000"))
+FFMPEG_BINARY = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_PATH") or shutil.which("ffprobe")
+FFMPEG_TIMEOUT_SECONDS = 300
+
+
+class AudioPreprocessingError(Exception):
+    """Raised when audio cannot be probed or converted"""
+
+
+class AudioPreprocessor:
+    def __init__(
+        self,
+        work_dir: str = "uploads/normalized",
+        target_sample_rate: int = TARGET_SAMPLE_RATE,
+        ffmpeg: Optional[str] = FFMPEG_BINARY,
+        ffprobe: Optional[str] = FFPROBE_BINARY
+    ):
+        self.work_dir = Path(work_dir)
+        self.target_sample_rate = target_sample_rate
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+
+    def probe(self, path: str) -> Dict[str, Any]:
+        """
+        Describe an audio file: {"container", "codec", "sample_rate", "channels", "duration"}.
+        Raises AudioPreprocessingError if the file cannot be read as audio.
+        """
+        if self.ffprobe:
+            return self._probe_ffprobe(path)
+        return self._probe_wav(path)
+
+    def _probe_ffprobe(self, path: str) -> Dict[str, Any]:
+        result = self._run([
+            self.ffprobe, "-v", "error", "-print_format", "json",
+            "-show_format", "-show_streams", "-select_streams", "a:0", path
+        ])
+        info = json.loads(result.stdout or b"{}")
+        streams = info.get("streams") or []
+        if not streams:
+            raise AudioPreprocessingError("File contains no audio stream")
+
+        stream = streams[0]
+        fmt = info.get("format") or {}
+        duration = stream.get("duration") or fmt.get("duration")
+        return {
+            "container": fmt.get("format_name"),
+            "codec": stream.get("codec_name"),
+            "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+            "channels": stream.get("channels"),
+            "duration": float(duration) if duration else None
+        }
+
+    def _probe_wav(self, path: str) -> Dict[str, Any]:
+        try:
+            with WavAudio(path) as wav_audio:
+                return {
+                    "container": "wav",
+                    "codec": "pcm_s16le",
+                    "sample_rate": wav_audio.sample_rate,
+                    "channels": wav_audio.channels,
+                    "duration": wav_audio.duration
+                }
+        except ValueError as e:
+            raise AudioPreprocessingError(f"ffprobe is required to read this audio ({str(e)})")
+
+    def normalize(self, path: str) -> str:
+        """
+        Convert audio to 16-bit PCM WAV at the target rate, mono.
+        Returns the path of the normalized file, which is the input path itself
+        when it is already in that form; otherwise the caller removes it with discard().
+        """
+        try:
+            with WavAudio(path) as wav_audio:
+                if wav_audio.sample_rate == self.target_sample_rate and wav_audio.channels == 1:
+                    return path
+        except ValueError:
+            pass
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        fd, output_path = tempfile.mkstemp(suffix=".wav", dir=self.work_dir)
+        os.close(fd)
+
+        try:
+            if self.ffmpeg:
+                self._run([
+                    self.ffmpeg, "-nostdin", "-v", "error", "-y", "-i", path,
+                    "-vn", "-ac", "1", "-ar", str(self.target_sample_rate),
+                    "-c:a", "pcm_s16le", "-f", "wav", output_path
+                ])
+            else:
+                self._normalize_wav_in_process(path, output_path)
+        except Exception:
+            self.discard(output_path, path)
+            raise
+
+        return output_path
+
+    def _normalize_wav_in_process(self, path: str, output_path: str) -> None:
+        """Downmix and resample PCM WAV without ffmpeg"""
+        if audioop is None:
+            raise AudioPreprocessingError("ffmpeg is required to normalize audio")
+        try:
+            wav_audio = WavAudio(path)
+        except ValueError:
+            raise AudioPreprocessingError(f"ffmpeg is required to convert {Path(path).suffix or 'this'} audio")
+
+        with wav_audio, wave.open(output_path, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self.target_sample_rate)
+
+            # Convert a minute at a time, carrying resampler state across blocks
+            state = None
+            block = 60.0
+            start = 0.0
+            while start < wav_audio.duration:
+                pcm = wav_audio.segment_bytes(start, start + block)[44:]
+                if wav_audio.channels == 2:
+                    pcm = audioop.tomono(pcm, 2, 0.5, 0.5)
+                elif wav_audio.channels > 2:
+                    raise AudioPreprocessingError("ffmpeg is required to downmix multichannel audio")
+                if wav_audio.sample_rate != self.target_sample_rate:
+                    pcm, state = audioop.ratecv(pcm, 2, 1, wav_audio.sample_rate, self.target_sample_rate, state)
+                out.writeframes(pcm)
+                start += block
+
+    def encode_payload(self, wav_content: bytes) -> Tuple[bytes, str]:
+        """
+        Compress a WAV payload for the speech backend.
+        Returns (content, encoding); FLAC when ffmpeg is available, else the WAV as LINEAR16.
+        """
+        if not self.ffmpeg:
+            return wav_content, "LINEAR16"
+        result = self._run(
+            [self.ffmpeg, "-nostdin", "-v", "error", "-f", "wav", "-i", "pipe:0", "-c:a", "flac", "-f", "flac", "pipe:1"],
+            input=wav_content
+        )
+        return result.stdout, "FLAC"
+
+    def discard(self, normalized_path: str, source_path: str) -> None:
+        """Remove a normalized file created by normalize()"""
+        if normalized_path == source_path:
+            return
+        try:
+            if os.path.exists(normalized_path):
+                os.remove(normalized_path)
+        except OSError as e:
+            logger.error(f"Failed to remove normalized audio {normalized_path}: {str(e)}")
+
+    def _run(self, command, input: Optional[bytes] = None) -> subprocess.CompletedProcess:
+        try:
+            return subprocess.run(
+                command, input=input, capture_output=True, check=True, timeout=FFMPEG_TIMEOUT_SECONDS
+            )
+        except subprocess.CalledProcessError as e:
+            error = (e.stderr or b"").decode(errors="replace").strip()
+            raise AudioPreprocessingError(f"{Path(command[0]).name} failed: {error[:500]}")
+        except subprocess.TimeoutExpired:
+            raise AudioPreprocessingError(f"{Path(command[0]).name} timed out")
+
+# Global instance
+audio_preprocessor = AudioPreprocessor()
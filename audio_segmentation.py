@@ -0,0 +1,212 @@
+"""
+Audio segmentation for long recordings
+Splits PCM WAV audio into overlapping windows without loading the whole file,
+and stitches per-window transcripts back into a single transcript
+"""
+
+import os
+import re
+import mmap
+import struct
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavAudio:
+    """
+    Memory-mapped view over a PCM WAV file.
+    Segments are sliced straight out of the mapping, so only the bytes of the
+    segment currently being sent are ever copied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse_header(self) -> None:
+        data = self._mmap
+        if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("Not a RIFF/WAVE file")
+
+        fmt = None
+        offset = 12
+        while offset + 8 <= len(data):
+            chunk_id = data[offset:offset + 4]
+            chunk_size = struct.unpack("<I", data[offset + 4:offset + 8])[0]
+            body = offset + 8
+
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", data[body:body + 16])
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError("WAV data chunk precedes fmt chunk")
+                # Streamed WAVs often carry a placeholder size; clamp to the file
+                self.data_offset = body
+                self.data_size = min(chunk_size, len(data) - body)
+                break
+
+            offset = body + chunk_size + (chunk_size & 1)  # Chunks are word aligned
+        else:
+            raise ValueError("WAV file has no data chunk")
+
+        format_tag, channels, sample_rate, _, block_align, bits_per_sample = fmt
+        if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE) or bits_per_sample != 16:
+            raise ValueError("Only 16-bit PCM WAV audio can be segmented")
+
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_width = bits_per_sample // 8
+        self.block_align = block_align
+        self.frame_count = self.data_size // block_align
+
+    @property
+    def duration(self) -> float:
+        return self.frame_count / float(self.sample_rate)
+
+    def segment_bytes(self, start_seconds: float, end_seconds: float) -> bytes:
+        """Return a standalone WAV file covering [start_seconds, end_seconds)"""
+        start_frame = max(0, int(start_seconds * self.sample_rate))
+        end_frame = min(self.frame_count, int(end_seconds * self.sample_rate))
+        start = self.data_offset + start_frame * self.block_align
+        end = self.data_offset + end_frame * self.block_align
+
+        pcm_size = end - start
+        header = struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + pcm_size, b"WAVE",
+            b"fmt ", 16, WAVE_FORMAT_PCM, self.channels, self.sample_rate,
+            self.sample_rate * self.block_align, self.block_align, self.sample_width * 8,
+            b"data", pcm_size
+        )
+        return header + self._mmap[start:end]
+
+    def close(self) -> None:
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def plan_segments(duration: float, window_seconds: float, overlap_seconds: float) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration) into windows of window_seconds that overlap their
+    neighbour by overlap_seconds.
+    """
+    if duration <= window_seconds:
+        return [(0.0, duration)]
+
+    step = window_seconds - overlap_seconds
+    if step <= 0:
+        raise ValueError("Segment overlap must be shorter than the segment window")
+
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(start + window_seconds, duration)
+        segments.append((start, end))
+        if end >= duration:
+            break
+        start += step
+    return segments
+
+
+_TOKEN_STRIP = re.compile(r"[^\w']+")
+
+
+def _normalize_token(token: str) -> str:
+    return _TOKEN_STRIP.sub("", token.lower())
+
+
+def _drop_repeated_prefix(previous: List[str], current: List[str], max_overlap: int = 30) -> List[str]:
+    """Drop the longest prefix of current that repeats the tail of previous"""
+    prev_norm = [_normalize_token(t) for t in previous[-max_overlap:]]
+    curr_norm = [_normalize_token(t) for t in current[:max_overlap]]
+    for size in range(min(len(prev_norm), len(curr_norm)), 0, -1):
+        if prev_norm[-size:] == curr_norm[:size]:
+            return current[size:]
+    return current
+
+
+def stitch_segments(segment_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-segment recognition results into one transcript.
+
+    Each segment result carries its window ("start", "end" in seconds), the
+    recognised "transcript", a "confidence" and, when available, "words" with
+    start times relative to the window. Words are kept only if they begin in
+    the half of the overlap closest to their own window, so speech in an
+    overlap is emitted exactly once. Segments without word timings fall back
+    to token-level de-duplication against the preceding text.
+    """
+    ordered = sorted(segment_results, key=lambda s: s["start"])
+
+    tokens: List[str] = []
+    weighted_confidence = 0.0
+    total_weight = 0.0
+
+    for i, segment in enumerate(ordered):
+        previous = ordered[i - 1] if i > 0 else None
+        following = ordered[i + 1] if i + 1 < len(ordered) else None
+        left_cut = (segment["start"] + previous["end"]) / 2 if previous and previous["end"] > segment["start"] else segment["start"]
+        right_cut = (following["start"] + segment["end"]) / 2 if following and following["start"] < segment["end"] else float("inf")
+
+        words = segment.get("words") or []
+        if words:
+            kept = [
+                w for w in words
+                if left_cut <= segment["start"] + w["start"] < right_cut
+            ]
+            tokens.extend(w["word"] for w in kept)
+
+            word_confidences = [w["confidence"] for w in kept if w.get("confidence")]
+            if word_confidences:
+                weighted_confidence += sum(word_confidences)
+                total_weight += len(word_confidences)
+            elif kept:
+                weighted_confidence += segment.get("confidence", 0.0) * len(kept)
+                total_weight += len(kept)
+        else:
+            segment_tokens = (segment.get("transcript") or "").split()
+            if tokens and previous is not None:
+                segment_tokens = _drop_repeated_prefix(tokens, segment_tokens)
+            tokens.extend(segment_tokens)
+
+            if segment_tokens:
+                weighted_confidence += segment.get("confidence", 0.0) * len(segment_tokens)
+                total_weight += len(segment_tokens)
+
+    return {
+        "transcript": " ".join(tokens).strip(),
+        "confidence": weighted_confidence / total_weight if total_weight > 0 else 0.0,
+        "segments": len(ordered)
+    }
+
+
+def open_segmentable_audio(path: str) -> Optional[WavAudio]:
+    """Open a file for segmentation, or return None if it is not PCM WAV"""
+    if os.path.splitext(path)[1].lower() != ".wav":
+        return None
+    try:
+        return WavAudio(path)
+    except ValueError as e:
+        logger.info(f"Audio file {path} cannot be segmented: {str(e)}")
+        return None
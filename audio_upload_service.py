@@ -0,0 +1,295 @@
+"""
+Streaming audio upload service for Pawscribed
+Writes uploaded audio to disk in fixed-size chunks, hashing and size-checking as it goes.
+Audio is stored content-addressed by SHA-256, so identical uploads share one file on disk.
+"""
+
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import AudioFile, AudioBlob
+from audio_preprocessing import audio_preprocessor, AudioPreprocessingError
+
+logger = logging.getLogger(__name__)
+
+# Upload limits
+CHUNK_SIZE = 1024 * 1024  # 1MB
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100MB
+
+ALLOWED_AUDIO_TYPES = ["audio/wav", "audio/mpeg", "audio/mp3", "audio/m4a", "audio/x-m4a"]
+
+
+class AudioUploadService:
+    def __init__(self, upload_dir: str = "uploads/audio", chunk_size: int = CHUNK_SIZE, max_size: int = MAX_UPLOAD_SIZE):
+        self.upload_dir = Path(upload_dir)
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+
+    def sniff_audio_format(self, header: bytes) -> Optional[str]:
+        """
+        Identify the audio container from its leading bytes.
+        Returns None when the data does not look like a supported audio file.
+        """
+        if len(header) >= 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+            return "wav"
+        if header[:3] == b"ID3":
+            return "mp3"
+        if len(header) >= 2 and header[0] == 0xFF and (header[1] & 0xE0) == 0xE0:
+            return "mp3"  # Bare MPEG audio frame sync
+        if len(header) >= 8 and header[4:8] == b"ftyp":
+            return "m4a"
+        if header[:4] == b"\x1a\x45\xdf\xa3":
+            return "webm"
+        return None
+
+    async def save_upload(self, file: UploadFile, user_id: int) -> Dict[str, Any]:
+        """
+        Stream an uploaded audio file to disk.
+        The file is never held in memory as a whole: each chunk is written, hashed
+        and counted in a single pass, and the upload is aborted as soon as the size
+        limit is exceeded or the content does not look like audio.
+        """
+        if file.content_type not in ALLOWED_AUDIO_TYPES:
+            return {
+                "success": False,
+                "error": f"Invalid file type. Allowed types: {', '.join(ALLOWED_AUDIO_TYPES)}"
+            }
+
+        # Reject early if the multipart parser already knows the size
+        if getattr(file, "size", None) is not None and file.size > self.max_size:
+            return {"success": False, "error": "File size exceeds 100MB limit"}
+
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+
+        # The final name depends on the content hash, so stream to a unique temporary file first
+        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        partial_path = self.upload_dir / f"{user_id}_{timestamp}_{uuid.uuid4().hex}.part"
+
+        sha256 = hashlib.sha256()
+        file_size = 0
+        audio_format = None
+
+        try:
+            async with aiofiles.open(partial_path, "wb") as out:
+                while True:
+                    chunk = await file.read(self.chunk_size)
+                    if not chunk:
+                        break
+
+                    if file_size == 0:
+                        audio_format = self.sniff_audio_format(chunk[:16])
+                        if audio_format is None:
+                            raise ValueError("File content is not a supported audio format")
+
+                    file_size += len(chunk)
+                    if file_size > self.max_size:
+                        raise ValueError("File size exceeds 100MB limit")
+
+                    sha256.update(chunk)
+                    await out.write(chunk)
+
+            if file_size == 0:
+                raise ValueError("Uploaded file is empty")
+
+            content_hash = sha256.hexdigest()
+            file_path, deduplicated = self._store_content(partial_path, content_hash, audio_format)
+
+        except ValueError as e:
+            self._discard(partial_path)
+            logger.warning(f"Rejected audio upload from user {user_id}: {str(e)}")
+            return {"success": False, "error": str(e)}
+        except Exception:
+            self._discard(partial_path)
+            raise
+
+        if deduplicated:
+            logger.info(f"Audio upload from user {user_id} matches stored content {file_path}")
+        else:
+            logger.info(f"Stored audio upload {file_path} ({file_size} bytes, {audio_format}, sha256={content_hash[:12]})")
+
+        return {
+            "success": True,
+            "file_path": str(file_path),
+            "file_size": file_size,
+            "content_hash": content_hash,
+            "audio_format": audio_format,
+            "deduplicated": deduplicated,
+            "spare_path": str(partial_path) if deduplicated else None
+        }
+
+    async def store_file(self, path: str, user_id: int, audio_format: str = "wav") -> Dict[str, Any]:
+        """
+        Move an audio file written on the server (e.g. a live recording) into
+        content-addressed storage. Returns the same result shape as save_upload().
+        """
+        loop = asyncio.get_running_loop()
+        content_hash, file_size = await loop.run_in_executor(None, self._hash_file, path)
+        file_path, deduplicated = self._store_content(Path(path), content_hash, audio_format)
+        logger.info(f"Stored recording from user {user_id} as {file_path} ({file_size} bytes)")
+
+        return {
+            "success": True,
+            "file_path": str(file_path),
+            "file_size": file_size,
+            "content_hash": content_hash,
+            "audio_format": audio_format,
+            "deduplicated": deduplicated,
+            "spare_path": path if deduplicated else None
+        }
+
+    def _hash_file(self, path: str) -> Tuple[str, int]:
+        sha256 = hashlib.sha256()
+        file_size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                sha256.update(chunk)
+                file_size += len(chunk)
+        return sha256.hexdigest(), file_size
+
+    def _store_content(self, source_path: Path, content_hash: str, audio_format: str) -> Tuple[Path, bool]:
+        """
+        Move a fully written file to its content path; returns (path, already_stored).
+        If the bytes are already stored the source is left in place as a spare:
+        register_upload discards it, or uses it should that copy be released first.
+        """
+        file_path = self.content_path(content_hash, audio_format)
+        if file_path.exists():
+            return file_path, True
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source_path, file_path)
+        return file_path, False
+
+    def content_path(self, content_hash: str, audio_format: str) -> Path:
+        """Location of stored audio content, fanned out by the first two hex digits of its hash"""
+        return self.upload_dir / content_hash[:2] / f"{content_hash}.{audio_format}"
+
+    def register_upload(
+        self,
+        upload_result: Dict[str, Any],
+        user_id: int,
+        filename: str,
+        mime_type: str,
+        db: Session
+    ) -> Tuple[AudioFile, bool]:
+        """
+        Record a stored upload for a user.
+        The content is recorded once in audio_blobs; each user gets one AudioFile
+        per distinct content. Returns (audio_file, is_existing_file) where
+        is_existing_file means the user had already uploaded these bytes.
+        """
+        content_hash = upload_result["content_hash"]
+        spare_path = upload_result.get("spare_path")
+
+        try:
+            # Locked so a concurrent release_content of this content finishes first or waits for us
+            blob = db.query(AudioBlob).filter(AudioBlob.content_hash == content_hash).with_for_update().first()
+            if not blob:
+                try:
+                    db.add(AudioBlob(
+                        content_hash=content_hash,
+                        file_path=upload_result["file_path"],
+                        file_size=upload_result["file_size"],
+                        audio_format=upload_result["audio_format"]
+                    ))
+                    db.commit()
+                except IntegrityError:
+                    # A concurrent upload of the same content registered it first
+                    db.rollback()
+
+            # With no blob row there was nothing to lock: a release that deleted the row
+            # before our insert may have removed the file since, so put our copy back
+            file_path = Path(upload_result["file_path"])
+            if spare_path and not file_path.exists():
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(spare_path, file_path)
+                logger.warning(f"Stored content {content_hash[:12]} was released during upload; restored it")
+        finally:
+            if spare_path:
+                self._discard(Path(spare_path))
+
+        audio_file = db.query(AudioFile).filter(
+            AudioFile.user_id == user_id,
+            AudioFile.content_hash == content_hash
+        ).order_by(AudioFile.uploaded_at.desc()).first()
+
+        if audio_file:
+            # Re-uploading counts as fresh use, so retention cleanup starts over
+            audio_file.uploaded_at = datetime.utcnow()
+            db.commit()
+            db.refresh(audio_file)
+            return audio_file, True
+
+        audio_file = AudioFile(
+            user_id=user_id,
+            filename=filename,
+            file_path=upload_result["file_path"],
+            file_size=upload_result["file_size"],
+            mime_type=mime_type,
+            content_hash=content_hash
+        )
+        db.add(audio_file)
+        db.commit()
+        db.refresh(audio_file)
+        return audio_file, False
+
+    async def record_audio_properties(self, audio_file: AudioFile, db: Session) -> None:
+        """Probe a stored upload and record its duration, sample rate and channels"""
+        if audio_file.duration is not None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            probe = await loop.run_in_executor(None, audio_preprocessor.probe, audio_file.file_path)
+        except AudioPreprocessingError as e:
+            # Transcription fills in the duration once the audio is normalized
+            logger.warning(f"Could not probe audio file {audio_file.id}: {str(e)}")
+            return
+
+        audio_file.duration = probe["duration"]
+        audio_file.sample_rate = probe["sample_rate"]
+        audio_file.channels = probe["channels"]
+        audio_file.codec = probe["codec"]
+        db.commit()
+
+    def release_content(self, content_hash: str, db: Session) -> bool:
+        """
+        Delete stored content once no AudioFile references it. Commits the
+        session (with the caller's pending changes) before the file is
+        removed, so a failed commit never leaves a blob row without its file.
+        Returns True if the content was removed.
+        """
+        blob = db.query(AudioBlob).filter(AudioBlob.content_hash == content_hash).with_for_update().first()
+        # References are checked under the blob's lock; register_upload takes the same lock
+        if db.query(AudioFile.id).filter(AudioFile.content_hash == content_hash).first():
+            return False
+        if not blob:
+            return True
+
+        file_path = Path(blob.file_path)
+        db.delete(blob)
+        db.commit()
+        # An upload may have registered the content again since the commit; it keeps the file
+        if not db.query(AudioBlob.content_hash).filter(AudioBlob.content_hash == content_hash).first():
+            self._discard(file_path)
+        return True
+
+    def _discard(self, path: Path) -> None:
+        """Remove a partially written upload"""
+        try:
+            if path.exists():
+                path.unlink()
+        except OSError as e:
+            logger.error(f"Failed to remove partial upload {path}: {str(e)}")
+
+# Global instance
+audio_upload_service = AudioUploadService()
@@ -2,11 +2,14 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models import User, UserRole
-from database import get_db
+from database import AsyncSessionLocal
+from llm_metrics import tag_llm_caller
 import os
 from dotenv import load_dotenv
 
@@ -49,16 +52,17 @@ def verify_token(token: str) -> Optional[dict]:
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
 
+async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
 def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
     user = get_user_by_email(db, email)
     if not user or not verify_password(password, user.hashed_password):
         return None
     return user
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -69,7 +73,10 @@ async def get_current_user(
     if token_data is None:
         raise credentials_exception
     
-    user = get_user_by_email(db, token_data["email"])
+    # Own short-lived session, closed before the handler runs: nothing is held
+    # through slow handlers, and sync handlers don't take a second connection
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_email_async(db, token_data["email"])
     if user is None:
         raise credentials_exception
     
@@ -87,8 +94,28 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
                 detail="Trial period has expired. Please upgrade your plan."
             )
     
+    # LLM calls made for this request count against the user's team
+    tag_llm_caller(user=current_user)
     return current_user
 
+def get_user_from_token(db: Session, token: str) -> Optional[User]:
+    """
+    Resolve an access token to an active user, or None.
+    For connections that cannot send an Authorization header (WebSocket, EventSource).
+    """
+    token_data = verify_token(token) if token else None
+    if token_data is None:
+        return None
+    
+    user = get_user_by_email(db, token_data["email"])
+    if user is None or not user.is_active:
+        return None
+    
+    if user.role == UserRole.TRIAL and user.trial_expires_at and datetime.utcnow() > user.trial_expires_at:
+        return None
+    
+    return user
+
 def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -3,20 +3,27 @@ Background task processing for Pawscribed
 Handles transcription queue processing and other async tasks
 """
 
+import os
 import asyncio
 import logging
 from datetime import datetime, timedelta
 from sqlalchemy.orm import sessionmaker
 from database import engine
-from transcription_service import transcription_service
+from transcription_service import transcription_service, TranscriptionDispatcher, default_worker_id
+from audio_upload_service import audio_upload_service
 
 logger = logging.getLogger(__name__)
 
+# "inline" processes transcriptions inside the API process; "worker" leaves them
+# to dedicated worker processes (see worker.py)
+TRANSCRIPTION_MODE = os.getenv("TRANSCRIPTION_MODE", "inline").lower()
+
 class BackgroundTaskManager:
     def __init__(self):
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
         self.running = False
         self.tasks = []
+        self.transcription_dispatcher = None
     
     async def start(self):
         """Start background task processing"""
@@ -27,8 +34,11 @@ class BackgroundTaskManager:
         logger.info("Starting background task manager")
         
         # Start transcription queue processor
-        transcription_task = asyncio.create_task(self._transcription_processor())
-        self.tasks.append(transcription_task)
+        if TRANSCRIPTION_MODE == "worker":
+            logger.info("Transcription runs in dedicated worker processes; not processing queue in API")
+        else:
+            transcription_task = asyncio.create_task(self._transcription_processor())
+            self.tasks.append(transcription_task)
         
         # Start cleanup task
         cleanup_task = asyncio.create_task(self._cleanup_processor())
@@ -55,18 +65,22 @@ class BackgroundTaskManager:
         self.tasks.clear()
         logger.info("Background task manager stopped")
     
+    def notify_transcription_job(self):
+        """Wake the transcription processor right after a job is committed"""
+        if self.transcription_dispatcher:
+            self.transcription_dispatcher.notify()
+    
     async def _transcription_processor(self):
-        """Process transcription queue every 10 seconds"""
+        """Process transcription jobs as they arrive (polling as a fallback)"""
+        self.transcription_dispatcher = TranscriptionDispatcher(
+            transcription_service,
+            self.SessionLocal,
+            default_worker_id("api"),
+            engine=engine
+        )
         while self.running:
             try:
-                db = self.SessionLocal()
-                try:
-                    await transcription_service.process_transcription_queue(db)
-                finally:
-                    db.close()
-                
-                # Wait 10 seconds before next check
-                await asyncio.sleep(10)
+                await self.transcription_dispatcher.run()
                 
             except asyncio.CancelledError:
                 logger.info("Transcription processor cancelled")
@@ -107,10 +121,13 @@ class BackgroundTaskManager:
                 ).all()
                 
                 files_deleted = 0
+                released_hashes = set()
                 for audio_file in old_files:
                     try:
-                        # Delete physical file
-                        if os.path.exists(audio_file.file_path):
+                        # Content-addressed files may be shared; they are released below
+                        if audio_file.content_hash:
+                            released_hashes.add(audio_file.content_hash)
+                        elif os.path.exists(audio_file.file_path):
                             os.remove(audio_file.file_path)
                         
                         # Delete database record
@@ -120,6 +137,11 @@ class BackgroundTaskManager:
                     except Exception as e:
                         logger.error(f"Failed to delete audio file {audio_file.id}: {str(e)}")
                 
+                # Remove stored content no remaining upload refers to (each release commits)
+                db.flush()
+                for content_hash in released_hashes:
+                    audio_upload_service.release_content(content_hash, db)
+                
                 # Clean up old completed transcription jobs (keep for 30 days)
                 old_job_cutoff = datetime.utcnow() - timedelta(days=30)
                 
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Database concurrency benchmark
+Runs a concurrent load of the hot read endpoints (auth lookup plus pets,
+notes, transcription status and workflow stats) against a seeded database
+and reports request throughput, latency percentiles per endpoint and event
+loop lag. Lag is how late a 10 ms timer fires while the load runs; a handler
+that blocks on a sync query shows up there and in every concurrent request.
+--mix mixed adds endpoints still on the sync session (visits, owners, audio
+files) and an authenticated handler that waits --llm-wait seconds, standing
+in for one blocked on the model (/generate-chart and the like). Peak and mean
+checked-out connections of the sync and async pools show what requests hold
+while they run.
+
+With --baseline REF the same load also runs against a checkout of REF (a
+temporary git worktree), e.g. the commit before the async database layer, and
+the report shows both runs and the throughput ratio. Each run gets its own
+scratch directory and SQLite database (or the database given by
+--database-url, shared by both runs; each seeds its own benchmark user).
+Results are printed as JSON and, with --output, appended as one line to a
+JSONL file for tracking over time.
+
+Usage: python benchmarks/db_concurrency.py [--requests 2000] [--concurrency 12]
+           [--pets 2000] [--notes 20000] [--transcriptions 500]
+           [--mix hot | mixed] [--llm-wait 1.0] [--baseline HEAD~1] [--output results.jsonl]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAG_INTERVAL_SECONDS = 0.01
+
+# Endpoint mixes: (name, weight)
+HOT_ENDPOINTS = [
+    ("GET /pets", 3),
+    ("GET /pets/{id}", 3),
+    ("GET /notes", 2),
+    ("GET /notes/{id}", 3),
+    ("GET /workflow/stats", 2),
+    ("GET /transcriptions/{id}", 2)
+]
+# Endpoints that still use the sync session, mixed in with the hot ones
+SYNC_ENDPOINTS = [
+    ("GET /visits", 2),
+    ("GET /owners", 2),
+    ("GET /audio/files", 2),
+    ("GET /bench/llm-wait", 2)
+]
+MIXES = {"hot": HOT_ENDPOINTS, "mixed": HOT_ENDPOINTS + SYNC_ENDPOINTS}
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0, "avg": None, "p50": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "avg": round(sum(values) / len(values), 3),
+        "p50": round(values[int(0.50 * (len(values) - 1))], 3),
+        "p95": round(values[int(0.95 * (len(values) - 1))], 3),
+        "p99": round(values[int(0.99 * (len(values) - 1))], 3),
+        "max": round(values[-1], 3)
+    }
+
+
+def git_commit(cwd: str) -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=cwd, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed(args) -> dict:
+    """Benchmark user and its records; returns the ids requests are drawn from"""
+    from database import SessionLocal, create_database
+    from models import User, Owner, Pet, Note, NoteStatus, AudioFile, TranscriptionJob, TranscriptionStatus
+    from auth import create_access_token
+
+    rng = random.Random(args.seed)
+    create_database()
+    db = SessionLocal()
+    try:
+        user = User(email=f"bench-{os.getpid()}@example.com", full_name="Benchmark", role="vet", is_active=True)
+        db.add(user)
+        db.flush()
+        owners = [Owner(first_name=f"Owner{i}", last_name="Bench", email=f"owner{i}@example.com") for i in range(max(1, args.pets // 4))]
+        db.add_all(owners)
+        db.flush()
+        species = ["dog", "cat", "rabbit", "bird"]
+        pets = [
+            Pet(name=f"Pet{i}", species=rng.choice(species), owner_id=rng.choice(owners).id, is_active=True)
+            for i in range(args.pets)
+        ]
+        db.add_all(pets)
+        db.flush()
+        statuses = list(NoteStatus)
+        notes = [
+            Note(title=f"Visit {i}", user_id=user.id, patient_id=rng.choice(pets).id, status=rng.choice(statuses),
+                 generated_content=json.dumps({"subjective": "Bench note " * 20}))
+            for i in range(args.notes)
+        ]
+        db.add_all(notes)
+        audio_files = [
+            AudioFile(user_id=user.id, filename=f"consult_{i}.wav", file_path=f"uploads/consult_{i}.wav",
+                      file_size=1920044, mime_type="audio/wav", duration=60.0)
+            for i in range(args.transcriptions)
+        ]
+        db.add_all(audio_files)
+        db.flush()
+        jobs = [
+            TranscriptionJob(audio_file_id=audio_file.id, status=TranscriptionStatus.COMPLETED, transcript="Bench transcript")
+            for audio_file in audio_files
+        ]
+        db.add_all(jobs)
+        db.commit()
+        return {
+            "token": create_access_token({"sub": user.email}),
+            "pet_ids": [pet.id for pet in pets],
+            "note_ids": [note.id for note in notes],
+            "job_ids": [job.id for job in jobs],
+            "species": species
+        }
+    finally:
+        db.close()
+
+
+def request_path(endpoint: str, ids: dict, rng: random.Random) -> str:
+    if endpoint == "GET /pets":
+        return f"/pets?species={rng.choice(ids['species'])}&limit=50"
+    if endpoint == "GET /pets/{id}":
+        return f"/pets/{rng.choice(ids['pet_ids'])}"
+    if endpoint == "GET /notes":
+        return "/notes?limit=50"
+    if endpoint == "GET /notes/{id}":
+        return f"/notes/{rng.choice(ids['note_ids'])}"
+    if endpoint == "GET /workflow/stats":
+        return "/workflow/stats"
+    if endpoint == "GET /transcriptions/{id}":
+        return f"/transcriptions/{rng.choice(ids['job_ids'])}"
+    if endpoint == "GET /bench/llm-wait":
+        return "/bench/llm-wait"
+    return endpoint.split(" ", 1)[1] + "?limit=50"
+
+
+async def run_benchmark(args) -> dict:
+    # Imported here: the environment must be configured before the app modules load
+    import httpx
+    from main import app
+
+    # The app logs at DEBUG, which would otherwise be most of what this measures
+    logging.getLogger().setLevel(logging.WARNING)
+    from database import engine
+    try:
+        from database import async_engine
+    except ImportError:
+        async_engine = None  # tree from before the async database layer
+    if args.mix == "mixed":
+        from fastapi import Depends
+        from auth import get_current_active_user
+
+        async def llm_wait(current_user=Depends(get_current_active_user)):
+            await asyncio.sleep(args.llm_wait)
+            return {"user_id": current_user.id}
+
+        app.add_api_route("/bench/llm-wait", llm_wait, methods=["GET"])
+
+    ids = seed(args)
+    rng = random.Random(args.seed)
+    endpoints = MIXES[args.mix]
+    names = [name for name, _ in endpoints]
+    plan = rng.choices(names, weights=[weight for _, weight in endpoints], k=args.requests)
+    paths = [(name, request_path(name, ids, rng)) for name in plan]
+
+    latencies = {name: [] for name in names}
+    errors = {}
+    lag = []
+    pool_peak = {"sync": 0, "async": 0}
+    pool_samples = {"sync": [], "async": []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    headers = {"Authorization": f"Bearer {ids['token']}"}
+    done = asyncio.Event()
+
+    async def measure_lag() -> None:
+        while not done.is_set():
+            expected = time.perf_counter() + LAG_INTERVAL_SECONDS
+            await asyncio.sleep(LAG_INTERVAL_SECONDS)
+            lag.append(max(0.0, time.perf_counter() - expected) * 1000)
+            checked_out = {"sync": engine.pool.checkedout()}
+            if async_engine is not None:
+                checked_out["async"] = async_engine.pool.checkedout()
+            for kind, count in checked_out.items():
+                pool_peak[kind] = max(pool_peak[kind], count)
+                pool_samples[kind].append(count)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        # One request per endpoint first, so connection pools and imports are warm
+        for name in names:
+            await client.get(request_path(name, ids, rng), headers=headers)
+
+        async def call(name: str, path: str) -> None:
+            async with semaphore:
+                request_started = time.perf_counter()
+                try:
+                    response = await client.get(path, headers=headers)
+                except Exception as e:
+                    # A sync handler waiting for a pooled connection blocks the loop that would free one
+                    key = f"{name}: {type(e).__name__}"
+                    errors[key] = errors.get(key, 0) + 1
+                    return
+                if response.status_code != 200:
+                    key = f"{name}: {response.status_code}"
+                    errors[key] = errors.get(key, 0) + 1
+                    return
+                latencies[name].append(time.perf_counter() - request_started)
+
+        lag_task = asyncio.create_task(measure_lag())
+        started = time.perf_counter()
+        await asyncio.gather(*(call(name, path) for name, path in paths))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await lag_task
+
+    if async_engine is not None:
+        await async_engine.dispose()
+
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "commit": git_commit(args.app_dir),
+        "elapsed_seconds": round(elapsed, 3),
+        "completed": completed,
+        "errors": errors,
+        "requests_per_second": round(completed / elapsed, 1) if elapsed else 0.0,
+        "latency_seconds": percentiles([value for values in latencies.values() for value in values]),
+        "endpoint_latency_seconds": {name: percentiles(values) for name, values in latencies.items()},
+        "event_loop_lag_ms": percentiles(lag),
+        "peak_checked_out_connections": pool_peak,
+        # Peaks hit the pool size once hot endpoints saturate it; the mean shows what is held between queries
+        "mean_checked_out_connections": {
+            kind: round(sum(samples) / len(samples), 2) if samples else 0.0 for kind, samples in pool_samples.items()
+        }
+    }
+
+
+def run_tree(args, app_dir: str) -> dict:
+    """One run in a fresh interpreter against the tree at app_dir"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--app-dir", app_dir, "--run-only",
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--pets", str(args.pets), "--notes", str(args.notes),
+        "--transcriptions", str(args.transcriptions), "--mix", args.mix, "--llm-wait", str(args.llm_wait), "--seed", str(args.seed)
+    ]
+    if args.database_url:
+        command += ["--database-url", args.database_url]
+    # The report is the last line; the app may print to stdout while it loads
+    return json.loads(subprocess.check_output(command, cwd=app_dir).decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database concurrency benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=12,
+                        help="Requests in flight at once (past 15, the default pool size, sync handlers stall on checkout)")
+    parser.add_argument("--pets", type=int, default=2000)
+    parser.add_argument("--notes", type=int, default=20000, help="Notes of the benchmark user (workflow stats counts them all)")
+    parser.add_argument("--transcriptions", type=int, default=500)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="hot",
+                        help="hot: endpoints on the async session; mixed: plus endpoints on the sync session")
+    parser.add_argument("--llm-wait", type=float, default=1.0, help="Seconds the stand-in model handler waits (--mix mixed)")
+    parser.add_argument("--baseline", default=None, help="Git ref to run the same load against for comparison")
+    parser.add_argument("--database-url", default=None, help="Defaults to a SQLite file in the scratch directory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="Append the result as a JSON line to this file")
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help=argparse.SUPPRESS)
+    parser.add_argument("--run-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_only:
+        sys.path.insert(0, args.app_dir)
+        with tempfile.TemporaryDirectory(prefix="pawscribed-bench-") as scratch:
+            os.chdir(scratch)
+            os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+            print(json.dumps(asyncio.run(run_benchmark(args))))
+        return
+
+    output = os.path.abspath(args.output) if args.output else None
+    report = {
+        "benchmark": "db_concurrency",
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "pets": args.pets,
+            "notes": args.notes,
+            "transcriptions": args.transcriptions,
+            "mix": args.mix,
+            "llm_wait": args.llm_wait if args.mix == "mixed" else None,
+            "database": args.database_url.split(":", 1)[0] if args.database_url else "sqlite"
+        },
+        "results": {"current": run_tree(args, BACKEND_DIR)}
+    }
+
+    if args.baseline:
+        with tempfile.TemporaryDirectory(prefix="pawscribed-baseline-") as scratch:
+            worktree = os.path.join(scratch, "tree")
+            subprocess.check_call(
+                ["git", "worktree", "add", "--detach", worktree, args.baseline],
+                cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                baseline = run_tree(args, worktree)
+            finally:
+                subprocess.call(["git", "worktree", "remove", "--force", worktree], cwd=BACKEND_DIR)
+        current = report["results"]["current"]
+        report["config"]["baseline"] = args.baseline
+        report["results"]["baseline"] = baseline
+        report["results"]["throughput_ratio"] = (
+            round(current["requests_per_second"] / baseline["requests_per_second"], 2)
+            if baseline["requests_per_second"] else None
+        )
+
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
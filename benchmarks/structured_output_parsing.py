@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Structured output parsing benchmark
+Runs every response in malformed_responses.json (real malformed model output:
+code fences, preamble, trailing text, trailing commas, answers cut off at the
+output limit, headed text instead of JSON) through structured_output and
+checks the recovered fields against the expectations recorded with it. The
+same responses are timed through structured_output and through the parsing
+this module replaced, and the extractor is timed on growing inputs to show it
+stays linear where the old greedy regex did not.
+
+Exits non-zero when a corpus expectation fails, so it doubles as the
+regression check for the parser: python benchmarks/structured_output_parsing.py --check
+
+Usage: python benchmarks/structured_output_parsing.py [--iterations 2000] [--check] [--output results.jsonl]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from structured_output import (  # noqa: E402
+    parse_soap_response, parse_json_response, extract_json_object,
+    VALIDATION_SCHEMA, FACTS_SCHEMA
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "malformed_responses.json")
+
+
+def parse(kind: str, response: str):
+    if kind == "soap":
+        return parse_soap_response(response)
+    if kind == "validation":
+        return parse_json_response(response, VALIDATION_SCHEMA, required=["completeness_score"])
+    return parse_json_response(response, FACTS_SCHEMA)
+
+
+# The parsing structured_output replaced, kept here for comparison
+
+def legacy_strip_code_fence(text: str) -> str:
+    clean_text = text.strip()
+    if clean_text.startswith('```json'):
+        clean_text = clean_text[7:]
+        if clean_text.endswith('```'):
+            clean_text = clean_text[:-3]
+        clean_text = clean_text.strip()
+    elif clean_text.startswith('```'):
+        clean_text = clean_text[3:]
+        if clean_text.endswith('```'):
+            clean_text = clean_text[:-3]
+        clean_text = clean_text.strip()
+    return clean_text
+
+
+def legacy_structured_text(response: str) -> dict:
+    section_patterns = {
+        "subjective": ["SUBJECTIVE", "S:", "History", "Chief Complaint"],
+        "objective": ["OBJECTIVE", "O:", "Physical Exam", "Examination"],
+        "assessment": ["ASSESSMENT", "A:", "Diagnosis", "Assessment"],
+        "plan": ["PLAN", "P:", "Treatment", "Recommendations"]
+    }
+    sections = {}
+    current_section = None
+    for line in response.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        section_found = None
+        for section_type, patterns in section_patterns.items():
+            for pattern in patterns:
+                if pattern.lower() in line.lower():
+                    section_found = section_type
+                    break
+            if section_found:
+                break
+        if section_found:
+            current_section = section_found
+            sections.setdefault(current_section, "")
+        elif current_section:
+            sections[current_section] = (sections[current_section] + "\n" + line).strip()
+    return sections
+
+
+def legacy_parse(kind: str, response: str):
+    try:
+        data = json.loads(legacy_strip_code_fence(response))
+        return data if isinstance(data, dict) else None
+    except json.JSONDecodeError:
+        pass
+    try:
+        match = re.search(r'{.*}', response, re.DOTALL)
+        if match:
+            return json.loads(match.group())
+    except json.JSONDecodeError:
+        pass
+    if kind == "soap":
+        return legacy_structured_text(response) or None
+    return None
+
+
+def check_case(case: dict) -> list:
+    result = parse(case["kind"], case["response"])
+    expect = case["expect"]
+    problems = []
+    if result.method != expect["method"]:
+        problems.append(f"method {result.method!r}, expected {expect['method']!r}")
+    if expect["method"] is None:
+        if result.ok:
+            problems.append("parsed data from a response that has none")
+        return problems
+    if not result.ok:
+        return problems + [f"no data ({'; '.join(result.errors)})"]
+    for field, value in expect.get("fields", {}).items():
+        if result.data.get(field) != value:
+            problems.append(f"{field} = {result.data.get(field)!r}, expected {value!r}")
+    return problems
+
+
+def legacy_matches(case: dict) -> bool:
+    data = legacy_parse(case["kind"], case["response"])
+    if case["expect"]["method"] is None:
+        return data is None
+    return data is not None and all(
+        data.get(field) == value for field, value in case["expect"].get("fields", {}).items()
+    )
+
+
+def time_per_call(function, cases: list, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for case in cases:
+            function(case["kind"], case["response"])
+    return (time.perf_counter() - started) / (iterations * len(cases))
+
+
+def scaling(sizes: list) -> list:
+    """Extraction time for a response padded with brace-heavy text before and after the object"""
+    answer = json.dumps({"subjective": "x", "objective": "y", "assessment": "z", "plan": "w"})
+    rows = []
+    for size in sizes:
+        padding = "Template {field} with {placeholder} text. " * (size // 84 + 1)
+        response = padding[:size // 2] + answer + padding[:size // 2]
+        started = time.perf_counter()
+        data, _ = extract_json_object(response)
+        new_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        legacy = legacy_parse("soap", response)
+        legacy_seconds = time.perf_counter() - started
+        rows.append({
+            "chars": len(response),
+            "found": data is not None and data.get("plan") == "w",
+            "legacy_found": legacy is not None and legacy.get("plan") == "w",
+            "structured_output_ms": round(new_seconds * 1000, 3),
+            "legacy_ms": round(legacy_seconds * 1000, 3)
+        })
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Structured output parsing benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--check", action="store_true", help="only check the corpus expectations")
+    parser.add_argument("--output", help="append results as one JSON line to this file")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        cases = json.load(f)
+
+    failures = {case["name"]: problems for case in cases for problems in [check_case(case)] if problems}
+    for name, problems in failures.items():
+        print(f"FAIL {name}: {'; '.join(problems)}", file=sys.stderr)
+    if args.check:
+        print(f"{len(cases) - len(failures)}/{len(cases)} corpus responses parsed as expected")
+        return 1 if failures else 0
+
+    legacy_correct = sum(1 for case in cases if legacy_matches(case))
+    results = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "corpus": {
+            "responses": len(cases),
+            "passed": len(cases) - len(failures),
+            "failed": sorted(failures),
+            "recoverable": sum(1 for case in cases if case["expect"]["method"] is not None),
+            "legacy_parsed_as_expected": legacy_correct
+        },
+        "per_response_us": {
+            "structured_output": round(time_per_call(lambda kind, text: parse(kind, text), cases, args.iterations) * 1e6, 2),
+            "legacy": round(time_per_call(legacy_parse, cases, args.iterations) * 1e6, 2)
+        },
+        "scaling": scaling([10_000, 100_000, 1_000_000])
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(results) + "\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
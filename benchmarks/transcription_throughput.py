@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Transcription throughput benchmark
+Uploads synthetic recordings through /audio/upload and lets the transcription
+pipeline (BackgroundTaskManager in the API process, or worker.py processes)
+transcribe them with the simulated speech backend. Reports throughput,
+upload-to-transcript latency, queue wait and processing time percentiles, and
+CPU and memory of the processes doing the transcription.
+
+Everything runs in a scratch directory with its own SQLite database (or the
+database given by --database-url). Results are printed as JSON and, with
+--output, appended as one line to a JSONL file for tracking over time.
+
+Usage: python benchmarks/transcription_throughput.py [--jobs 50] [--audio-seconds 30 | 20:90]
+           [--latency 0.5] [--realtime-factor 0.02] [--error-rate 0] [--workers 0]
+           [--max-concurrent 5] [--upload-concurrency 8] [--output results.jsonl]
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0, "avg": None, "p50": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "avg": round(sum(values) / len(values), 3),
+        "p50": round(values[int(0.50 * (len(values) - 1))], 3),
+        "p95": round(values[int(0.95 * (len(values) - 1))], 3),
+        "p99": round(values[int(0.99 * (len(values) - 1))], 3),
+        "max": round(values[-1], 3)
+    }
+
+
+def parse_seconds_range(spec: str) -> tuple:
+    if ":" in spec:
+        low, high = spec.split(":", 1)
+        return float(low), float(high)
+    return float(spec), float(spec)
+
+
+def write_recording(path: str, seconds: float, sample_rate: int, channels: int, seed: int) -> None:
+    """Low-level noise, different for every seed so uploads are never deduplicated"""
+    rng = random.Random(seed)
+    frames = int(seconds * sample_rate)
+    block = bytes(rng.getrandbits(8) & 0x0F for _ in range(sample_rate * channels * 2 // 10))
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        written = 0
+        step = len(block) // (2 * channels)
+        while written < frames:
+            count = min(step, frames - written)
+            wav.writeframes(block[:count * 2 * channels])
+            written += count
+        # Unique tail so identical lengths still hash differently
+        wav.writeframes(seed.to_bytes(8, "little") * channels)
+
+
+class ProcessSampler:
+    """Samples CPU time and RSS of a set of processes (and their children) from /proc"""
+
+    def __init__(self, root_pids: list, include_children: bool = True, interval: float = 0.1):
+        self.root_pids = root_pids
+        self.include_children = include_children
+        self.interval = interval
+        self.rss_samples = []
+        self._cpu_start = None
+        self._cpu_last = {}
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _read_stat(pid: int):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # Fields after the command: state(0) ppid(1) ... utime(11) stime(12)
+            return int(fields[1]), (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _read_rss_mb(pid: int) -> float:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def _pids(self) -> list:
+        pids = set(self.root_pids)
+        if not self.include_children:
+            return list(pids)
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                stat = self._read_stat(int(entry))
+                if stat:
+                    parents[int(entry)] = stat[0]
+        grew = True
+        while grew:
+            children = {pid for pid, ppid in parents.items() if ppid in pids} - pids
+            grew = bool(children)
+            pids |= children
+        return list(pids)
+
+    def _sample(self) -> None:
+        rss = 0.0
+        for pid in self._pids():
+            stat = self._read_stat(pid)
+            if stat:
+                self._cpu_last[pid] = stat[1]
+                rss += self._read_rss_mb(pid)
+        self.rss_samples.append(rss)
+
+    def _run(self) -> None:
+        while not self._done.is_set():
+            self._sample()
+            self._done.wait(self.interval)
+
+    def start(self) -> None:
+        self._sample()
+        self._cpu_start = dict(self._cpu_last)
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._done.set()
+        self._thread.join()
+        self._sample()
+        elapsed = time.perf_counter() - self._started
+        cpu_seconds = sum(cpu - self._cpu_start.get(pid, 0.0) for pid, cpu in self._cpu_last.items())
+        return {
+            "processes": len(self._cpu_last),
+            "cpu_seconds": round(cpu_seconds, 2),
+            "cpu_percent": round(100 * cpu_seconds / elapsed, 1) if elapsed else 0.0,
+            "rss_mb_avg": round(sum(self.rss_samples) / len(self.rss_samples), 1) if self.rss_samples else None,
+            "rss_mb_peak": round(max(self.rss_samples), 1) if self.rss_samples else None
+        }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args) -> dict:
+    # Imported here: the environment must be configured before the app modules load
+    import httpx
+    from main import app
+    from database import SessionLocal, create_database
+    from models import User, TranscriptionJob, TranscriptionStatus
+    from auth import create_access_token
+    from background_tasks import task_manager
+
+    create_database()
+    db = SessionLocal()
+    user = User(email=f"bench-{os.getpid()}@example.com", full_name="Benchmark", role="vet", is_active=True)
+    db.add(user)
+    db.commit()
+    token = create_access_token({"sub": user.email})
+    db.close()
+
+    low, high = parse_seconds_range(args.audio_seconds)
+    rng = random.Random(args.seed)
+    recordings = []
+    os.makedirs("recordings", exist_ok=True)
+    for i in range(args.jobs):
+        seconds = rng.uniform(low, high)
+        path = os.path.join("recordings", f"consult_{i}.wav")
+        write_recording(path, seconds, args.sample_rate, args.channels, args.seed * 100000 + i)
+        recordings.append((path, seconds))
+
+    worker_processes = []
+    if args.workers:
+        worker_processes.append(subprocess.Popen(
+            [sys.executable, os.path.join(BACKEND_DIR, "worker.py"), "--processes", str(args.workers),
+             "--max-concurrent", str(args.max_concurrent), "--poll-interval", str(args.poll_interval),
+             "--backend", "simulated"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        sampler = ProcessSampler([p.pid for p in worker_processes])
+    else:
+        sampler = ProcessSampler([os.getpid()], include_children=False)
+
+    await task_manager.start()
+    sampler.start()
+    started = time.perf_counter()
+    upload_seconds = {}
+    upload_errors = 0
+    semaphore = asyncio.Semaphore(args.upload_concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        async def upload(path: str) -> None:
+            nonlocal upload_errors
+            async with semaphore:
+                request_started = time.perf_counter()
+                with open(path, "rb") as f:
+                    response = await client.post(
+                        "/audio/upload",
+                        files={"file": (os.path.basename(path), f, "audio/wav")},
+                        data={"priority": "normal"},
+                        headers={"Authorization": f"Bearer {token}"}
+                    )
+                if response.status_code != 200:
+                    upload_errors += 1
+                    return
+                upload_seconds[response.json()["transcription_job_id"]] = time.perf_counter() - request_started
+
+        await asyncio.gather(*(upload(path) for path, _ in recordings))
+
+    # Wait for every job to finish (or the timeout)
+    terminal = [TranscriptionStatus.COMPLETED, TranscriptionStatus.FAILED]
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        db = SessionLocal()
+        try:
+            done = db.query(TranscriptionJob).filter(
+                TranscriptionJob.id.in_(list(upload_seconds)),
+                TranscriptionJob.status.in_(terminal)
+            ).count()
+        finally:
+            db.close()
+        if done == len(upload_seconds):
+            break
+        await asyncio.sleep(0.2)
+
+    elapsed = time.perf_counter() - started
+    resources = sampler.stop()
+    await task_manager.stop()
+    for process in worker_processes:
+        process.terminate()
+        process.wait(timeout=30)
+
+    db = SessionLocal()
+    try:
+        jobs = db.query(TranscriptionJob).filter(TranscriptionJob.id.in_(list(upload_seconds))).all()
+        completed = [j for j in jobs if j.status == TranscriptionStatus.COMPLETED]
+        failed = [j for j in jobs if j.status == TranscriptionStatus.FAILED]
+        queue_wait = [(j.started_at - j.created_at).total_seconds() for j in completed if j.started_at]
+        processing = [(j.completed_at - j.started_at).total_seconds() for j in completed if j.started_at]
+        end_to_end = [upload_seconds[j.id] + (j.completed_at - j.created_at).total_seconds() for j in completed]
+        retried = sum(1 for j in jobs if (j.attempts or 0) > 1)
+    finally:
+        db.close()
+
+    audio_minutes = sum(seconds for _, seconds in recordings) / 60
+    return {
+        "benchmark": "transcription_throughput",
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "config": {
+            "jobs": args.jobs,
+            "audio_seconds": args.audio_seconds,
+            "sample_rate": args.sample_rate,
+            "channels": args.channels,
+            "latency": args.latency,
+            "realtime_factor": args.realtime_factor,
+            "error_rate": args.error_rate,
+            "workers": args.workers,
+            "max_concurrent": args.max_concurrent,
+            "upload_concurrency": args.upload_concurrency,
+            "database": "sqlite" if args.database_url.startswith("sqlite") else args.database_url.split(":", 1)[0]
+        },
+        "results": {
+            "elapsed_seconds": round(elapsed, 3),
+            "completed": len(completed),
+            "failed": len(failed),
+            "unfinished": len(jobs) - len(completed) - len(failed),
+            "upload_errors": upload_errors,
+            "retried": retried,
+            "jobs_per_minute": round(60 * len(completed) / elapsed, 2) if elapsed else 0.0,
+            "audio_minutes_per_minute": round(audio_minutes * len(completed) / max(1, args.jobs) / (elapsed / 60), 2) if elapsed else 0.0,
+            "upload_seconds": percentiles(list(upload_seconds.values())),
+            "queue_wait_seconds": percentiles(queue_wait),
+            "processing_seconds": percentiles(processing),
+            "upload_to_transcript_seconds": percentiles(end_to_end),
+            "transcription_resources": resources,
+            "benchmark_process_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcription throughput benchmark")
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--audio-seconds", default="30", help="Recording length, or min:max for a uniform spread")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="Upload sample rate (other than 16000 exercises resampling)")
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated recognizer latency per request (s)")
+    parser.add_argument("--realtime-factor", type=float, default=0.02, help="Simulated seconds of latency per second of audio")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of recognize calls that fail (retryable)")
+    parser.add_argument("--workers", type=int, default=0, help="worker.py processes (0 = transcribe inside the API process)")
+    parser.add_argument("--max-concurrent", type=int, default=5, help="Jobs each transcribing process runs at once")
+    parser.add_argument("--upload-concurrency", type=int, default=8)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=600, help="Give up waiting for jobs after this many seconds")
+    parser.add_argument("--database-url", default=None, help="Defaults to a SQLite file in the scratch directory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory(prefix="pawscribed-bench-") as scratch:
+        os.chdir(scratch)
+        args.database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        os.environ.update({
+            "DATABASE_URL": args.database_url,
+            "SPEECH_BACKEND": "simulated",
+            "SIMULATED_SPEECH_LATENCY": str(args.latency),
+            "SIMULATED_SPEECH_REALTIME_FACTOR": str(args.realtime_factor),
+            "SIMULATED_SPEECH_ERROR_RATE": str(args.error_rate),
+            "TRANSCRIPTION_MODE": "worker" if args.workers else "inline",
+            "TRANSCRIPTION_MAX_CONCURRENT_JOBS": str(args.max_concurrent),
+            "TRANSCRIPTION_POLL_INTERVAL": str(args.poll_interval),
+            # Keep simulated failures from stretching the run
+            "TRANSCRIPTION_RETRY_BASE_SECONDS": os.getenv("TRANSCRIPTION_RETRY_BASE_SECONDS", "1"),
+            "TRANSCRIPTION_RETRY_MAX_SECONDS": os.getenv("TRANSCRIPTION_RETRY_MAX_SECONDS", "10")
+        })
+        report = asyncio.run(run_benchmark(args))
+
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
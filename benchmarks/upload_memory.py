@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for audio uploads
+Runs concurrent 100MB uploads through the streaming upload path and the old
+read-everything path, sampling process RSS while they run.
+
+Usage: python benchmarks/upload_memory.py [--concurrency 4] [--size-mb 100]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_upload_service import AudioUploadService, CHUNK_SIZE
+
+WAV_HEADER = b"RIFF\x00\x00\x00\x00WAVEfmt "
+
+
+class SyntheticUpload:
+    """Minimal stand-in for UploadFile that produces data lazily"""
+
+    def __init__(self, size: int, filename: str = "consult.wav", content_type: str = "audio/wav"):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self._position = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        remaining = self.size - self._position
+        if remaining <= 0:
+            return b""
+        if size < 0 or size > remaining:
+            size = remaining
+        if self._position == 0:
+            chunk = WAV_HEADER + b"\x00" * (size - len(WAV_HEADER))
+        else:
+            chunk = b"\x00" * size
+        self._position += size
+        await asyncio.sleep(0)  # Yield like a real spooled file read would
+        return chunk
+
+    async def seek(self, offset: int) -> None:
+        self._position = offset
+        await asyncio.sleep(0)
+
+
+def current_rss_mb() -> float:
+    """Current resident set size in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Fallback: peak RSS (kilobytes on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def legacy_upload(file: SyntheticUpload, upload_dir: str, user_id: int) -> int:
+    """The previous implementation: buffer the whole file, then write it out"""
+    contents = await file.read()
+    await file.seek(0)
+    path = os.path.join(upload_dir, f"{user_id}_legacy_{file.filename}")
+    with open(path, "wb") as f:
+        f.write(contents)
+    return len(contents)
+
+
+async def run_mode(mode: str, concurrency: int, size: int, upload_dir: str) -> dict:
+    service = AudioUploadService(upload_dir=upload_dir, max_size=size)
+    samples = []
+    done = threading.Event()
+
+    # Sample from a thread so synchronous sections of the upload are observed too
+    def sampler():
+        while not done.is_set():
+            samples.append(current_rss_mb())
+            done.wait(0.005)
+
+    baseline = current_rss_mb()
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+    start = time.perf_counter()
+
+    uploads = [SyntheticUpload(size, filename=f"consult_{i}.wav") for i in range(concurrency)]
+    if mode == "streaming":
+        results = await asyncio.gather(*(service.save_upload(u, i) for i, u in enumerate(uploads)))
+        assert all(r["success"] for r in results), results
+    else:
+        await asyncio.gather(*(legacy_upload(u, upload_dir, i) for i, u in enumerate(uploads)))
+
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler_thread.join()
+
+    peak = max(samples) if samples else current_rss_mb()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "upload_size_mb": size / (1024 * 1024),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "rss_growth_mb": round(peak - baseline, 1),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_mb_s": round(concurrency * size / (1024 * 1024) / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio upload memory benchmark")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--modes", default="streaming,legacy", help="Comma separated: streaming,legacy")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    results = []
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as upload_dir:
+            results.append(asyncio.run(run_mode(mode, args.concurrency, size, upload_dir)))
+
+    print(json.dumps({"benchmark": "upload_memory", "chunk_size": CHUNK_SIZE, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
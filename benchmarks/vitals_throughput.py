@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Vitals extraction benchmark
+Runs every objective section in objective_sections.json (Fahrenheit and
+Celsius temperatures with and without units, kg/lb/g weights, prose and
+abbreviated labels, words like "error" that contain a label, and values that
+are impossible for the species) through vitals_extraction and checks the
+vitals and rejections against the expectations recorded with it. The same
+sections are timed through vitals_extraction and through the per-vital
+regex search it replaced, as sections per second and MB/s, and the ratio of
+the two. The ratio stays below 1: the one pattern handles more phrasings,
+units and label checks than the legacy searches, which trade correctness on
+most of the corpus for speed (see legacy_extracted_as_expected).
+
+Exits non-zero when a corpus expectation fails, so it doubles as the
+regression check for the extractor: python benchmarks/vitals_throughput.py --check
+
+Usage: python benchmarks/vitals_throughput.py [--iterations 2000] [--check] [--output results.jsonl]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from vitals_extraction import vitals_extractor  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "objective_sections.json")
+
+
+# The extraction vitals_extraction replaced, kept here for comparison
+
+def legacy_extract(text: str) -> dict:
+    vitals = {}
+
+    # Temperature patterns
+    temp_patterns = [
+        r'temperature[^\d]*([0-9.]+)(?:\s*[°f])',
+        r'temp[^\d]*([0-9.]+)(?:\s*[°f])',
+        r'([0-9.]+)\s*[°f]'
+    ]
+
+    for pattern in temp_patterns:
+        match = re.search(pattern, text.lower())
+        if match:
+            try:
+                vitals["temperature"] = float(match.group(1))
+                break
+            except ValueError:
+                continue
+
+    # Heart rate patterns
+    hr_patterns = [
+        r'heart\s+rate[^\d]*([0-9]+)',
+        r'hr[^\d]*([0-9]+)',
+        r'pulse[^\d]*([0-9]+)'
+    ]
+
+    for pattern in hr_patterns:
+        match = re.search(pattern, text.lower())
+        if match:
+            try:
+                vitals["heart_rate"] = int(match.group(1))
+                break
+            except ValueError:
+                continue
+
+    # Respiratory rate patterns
+    rr_patterns = [
+        r'respiratory\s+rate[^\d]*([0-9]+)',
+        r'respiration[^\d]*([0-9]+)',
+        r'rr[^\d]*([0-9]+)',
+        r'breathing[^\d]*([0-9]+)'
+    ]
+
+    for pattern in rr_patterns:
+        match = re.search(pattern, text.lower())
+        if match:
+            try:
+                vitals["respiratory_rate"] = int(match.group(1))
+                break
+            except ValueError:
+                continue
+
+    # Weight patterns
+    weight_patterns = [
+        r'weight[^\d]*([0-9.]+)(?:\s*(?:lbs?|pounds?))?',
+        r'weighs[^\d]*([0-9.]+)(?:\s*(?:lbs?|pounds?))?',
+        r'([0-9.]+)\s*(?:lbs?|pounds?)'
+    ]
+
+    for pattern in weight_patterns:
+        match = re.search(pattern, text.lower())
+        if match:
+            try:
+                vitals["weight"] = float(match.group(1))
+                break
+            except ValueError:
+                continue
+
+    return vitals
+
+
+def check_case(case: dict) -> list:
+    vitals, rejected = vitals_extractor.extract_detailed(case["text"], case["species"])
+    expect = case["expect"]
+    problems = []
+    for vital in sorted(set(vitals) | set(expect["vitals"])):
+        if vitals.get(vital) != expect["vitals"].get(vital):
+            problems.append(f"{vital} = {vitals.get(vital)!r}, expected {expect['vitals'].get(vital)!r}")
+    rejected_vitals = sorted(item["vital"] for item in rejected)
+    if rejected_vitals != sorted(expect["rejected"]):
+        problems.append(f"rejected {rejected_vitals}, expected {sorted(expect['rejected'])}")
+    return problems
+
+
+def legacy_matches(case: dict) -> bool:
+    return legacy_extract(case["text"]) == case["expect"]["vitals"]
+
+
+def throughput(function, cases: list, iterations: int) -> dict:
+    size = sum(len(case["text"].encode("utf-8")) for case in cases)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for case in cases:
+            function(case)
+    seconds = time.perf_counter() - started
+    return {
+        "sections_per_second": round(iterations * len(cases) / seconds),
+        "mb_per_second": round(iterations * size / seconds / 1e6, 2),
+        "per_section_us": round(seconds / (iterations * len(cases)) * 1e6, 2)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Vitals extraction benchmark")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--check", action="store_true", help="only check the corpus expectations")
+    parser.add_argument("--output", help="append results as one JSON line to this file")
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        cases = json.load(f)
+
+    failures = {case["name"]: problems for case in cases for problems in [check_case(case)] if problems}
+    for name, problems in failures.items():
+        print(f"FAIL {name}: {'; '.join(problems)}", file=sys.stderr)
+    if args.check:
+        print(f"{len(cases) - len(failures)}/{len(cases)} objective sections extracted as expected")
+        return 1 if failures else 0
+
+    results = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "corpus": {
+            "sections": len(cases),
+            "passed": len(cases) - len(failures),
+            "failed": sorted(failures),
+            "legacy_extracted_as_expected": sum(1 for case in cases if legacy_matches(case))
+        },
+        "vitals_extraction": throughput(lambda case: vitals_extractor.extract(case["text"], case["species"]), cases, args.iterations),
+        "legacy": throughput(lambda case: legacy_extract(case["text"]), cases, args.iterations)
+    }
+    results["throughput_ratio"] = round(
+        results["vitals_extraction"]["sections_per_second"] / results["legacy"]["sections_per_second"], 2
+    )
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(results) + "\n")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
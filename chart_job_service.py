@@ -0,0 +1,284 @@
+"""
+Chart generation jobs for Pawscribed
+POST /generate-chart holds its connection (and a database session) open for
+the whole multi-call model pipeline, which mobile clients time out on and
+retry. A chart job instead records the request and returns at once; the
+pipeline runs in the background, bounded by CHART_JOB_CONCURRENCY, and the
+Visit is saved when it finishes. Clients poll the job or listen for
+"chart_job.updated" events. A submission repeated with the same idempotency
+key gets the existing job instead of paying for a second generation.
+Jobs interrupted by a restart are run again on startup.
+Also holds the visit-building helpers the synchronous endpoints share.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ChartJob, ChartJobStatus, Pet, Visit, User
+from schemas import ChartGenerationRequest, ChartGenerationResponse
+from chart_pipeline import chart_pipeline
+from gemini_service import gemini_service
+from llm_metrics import tag_llm_caller
+from event_hub import event_hub
+
+logger = logging.getLogger(__name__)
+
+# Chart jobs generated at once in this process
+CHART_JOB_CONCURRENCY = int(os.getenv("CHART_JOB_CONCURRENCY", "8"))
+# Requests with more clinical text than this are only accepted as jobs (0 = no limit)
+CHART_SYNC_MAX_CHARS = int(os.getenv("CHART_SYNC_MAX_CHARS", "20000"))
+
+CHART_TEXT_FIELDS = ("clinical_notes", "chief_complaint", "symptoms", "physical_exam", "diagnostic_findings")
+
+
+def clinical_text_length(request: ChartGenerationRequest) -> int:
+    return sum(len(getattr(request, field) or "") for field in CHART_TEXT_FIELDS)
+
+
+def chart_clinical_data(request: ChartGenerationRequest, pet: Pet) -> dict:
+    """Clinical data for AI processing"""
+    return {
+        "age": pet.age,
+        "species": pet.species,
+        "sex": pet.sex,
+        "weight": pet.weight,
+        "chief_complaint": request.chief_complaint,
+        "symptoms": request.symptoms,
+        "physical_exam": request.physical_exam,
+        "diagnostic_findings": request.diagnostic_findings,
+        "clinical_notes": request.clinical_notes
+    }
+
+
+def save_generated_chart(request: ChartGenerationRequest, pet: Pet, chart_result: dict, current_user: User, db: Session) -> ChartGenerationResponse:
+    """Create the visit for a generated chart and build the response"""
+    pipeline_info = {"mode": chart_result["mode"], "timings": chart_result["timings"], "fallback": chart_result.get("fallback")}
+    
+    logger.debug(f"SOAP generation result: success={chart_result['success']}")
+    
+    if not chart_result["success"]:
+        logger.error(f"SOAP generation failed: {chart_result['error']}")
+        return ChartGenerationResponse(
+            success=False,
+            error=chart_result["error"],
+            pipeline=pipeline_info,
+            soap={
+                "subjective": "Error generating SOAP note. Please try again.",
+                "objective": "",
+                "assessment": "",
+                "plan": ""
+            }
+        )
+    
+    soap_data = chart_result["soap"]
+    logger.debug(f"Generated SOAP sections: {list(soap_data.keys())}")
+    
+    # Create visit record in database
+    db_visit = Visit(
+        pet_id=request.pet_id,
+        veterinarian_id=current_user.id,
+        visit_type=request.visit_type,
+        chief_complaint=request.chief_complaint,
+        subjective=soap_data.get("subjective"),
+        objective=soap_data.get("objective"),
+        assessment=soap_data.get("assessment"),
+        plan=soap_data.get("plan"),
+        original_notes=request.clinical_notes
+    )
+    
+    db.add(db_visit)
+    
+    client_summary_result = chart_result["summary"]
+    if client_summary_result["success"]:
+        db_visit.client_summary = client_summary_result["summary"]
+        logger.debug("Client summary generated successfully")
+    else:
+        logger.warning(f"Client summary generation failed: {client_summary_result['error']}")
+        # Provide a default summary
+        db_visit.client_summary = f"Visit summary for {pet.name}: {soap_data.get('assessment', 'Assessment pending')}. Please see the detailed SOAP note for complete information."
+    
+    validation_result = chart_result["validation"]
+    if validation_result["success"]:
+        validation_data = validation_result["validation"]
+        db_visit.completeness_score = validation_data.get("completeness_score")
+        db_visit.missing_elements = json.dumps(validation_data.get("missing_elements", []))
+    
+    db.commit()
+    db.refresh(db_visit)
+    
+    # Ensure we always return valid data
+    response_data = ChartGenerationResponse(
+        success=True,
+        visit_id=db_visit.id,
+        soap=soap_data,
+        client_summary=db_visit.client_summary or client_summary_result.get("summary", ""),
+        validation=validation_result.get("validation", {
+            "completeness_score": 0.8,
+            "missing_elements": [],
+            "suggestions": []
+        }),
+        pipeline=pipeline_info
+    )
+    
+    logger.debug(f"Returning response with SOAP sections: {list(soap_data.keys())}")
+    logger.debug(f"Client summary length: {len(response_data.client_summary)}")
+    
+    return response_data
+
+
+class ChartJobService:
+    def __init__(self, concurrency: int = CHART_JOB_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def create_job(self, user: User, request: ChartGenerationRequest, idempotency_key: Optional[str], db: Session) -> ChartJob:
+        """Record a job, or return the user's existing job for the same idempotency key"""
+        if idempotency_key:
+            existing = self._job_for_key(user.id, idempotency_key, db)
+            if existing:
+                logger.info(f"Chart job {existing.id} resubmitted with the same idempotency key")
+                return existing
+
+        job = ChartJob(
+            user_id=user.id,
+            pet_id=request.pet_id,
+            status=ChartJobStatus.PENDING,
+            idempotency_key=idempotency_key,
+            request_payload=request.model_dump_json()
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent retry created it first
+            db.rollback()
+            return self._job_for_key(user.id, idempotency_key, db)
+        db.refresh(job)
+        logger.info(f"Created chart job {job.id} for user {user.id}")
+        return job
+
+    def _job_for_key(self, user_id: int, idempotency_key: str, db: Session) -> Optional[ChartJob]:
+        return db.query(ChartJob).filter(
+            ChartJob.user_id == user_id,
+            ChartJob.idempotency_key == idempotency_key
+        ).first()
+
+    def start(self, job_id: int) -> None:
+        """Run a job in the background on the current event loop"""
+        if job_id in self.tasks:
+            return
+        task = asyncio.create_task(self._run_job(job_id))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    async def resume_incomplete(self) -> None:
+        """Restart jobs interrupted by a restart"""
+        db = SessionLocal()
+        try:
+            job_ids = [job_id for (job_id,) in db.query(ChartJob.id).filter(
+                ChartJob.status.in_([ChartJobStatus.PENDING, ChartJobStatus.PROCESSING])
+            )]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self.start(job_id)
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} chart jobs")
+
+    async def _run_job(self, job_id: int) -> None:
+        async with self.semaphore:
+            # No session is held while the model pipeline runs
+            db = SessionLocal()
+            try:
+                job = db.get(ChartJob, job_id)
+                if job is None or job.status in (ChartJobStatus.COMPLETED, ChartJobStatus.FAILED):
+                    return
+                job.status = ChartJobStatus.PROCESSING
+                job.started_at = datetime.utcnow()
+                db.commit()
+                self._publish(job)
+                request = ChartGenerationRequest.model_validate_json(job.request_payload)
+                user_id = job.user_id
+                pet = db.query(Pet).filter(Pet.id == request.pet_id).first()
+                clinical_data = chart_clinical_data(request, pet) if pet else None
+                pet_name = pet.name if pet else None
+                # Resumed jobs have no request context to inherit the caller from
+                tag_llm_caller(endpoint="POST /generate-chart/jobs", user=db.get(User, user_id))
+            finally:
+                db.close()
+
+            if clinical_data is None:
+                self._finish(job_id, None, "Pet not found")
+                return
+
+            try:
+                chart_result = await chart_pipeline.run(
+                    gemini_service, clinical_data, request.style or "detailed", pet_name, request.pipeline_mode,
+                    deep_validation=bool(request.deep_validation)
+                )
+            except Exception as e:
+                logger.error(f"Chart job {job_id} failed: {str(e)}", exc_info=True)
+                self._finish(job_id, None, str(e))
+                return
+
+            db = SessionLocal()
+            try:
+                response = save_generated_chart(request, db.get(Pet, request.pet_id), chart_result, db.get(User, user_id), db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Chart job {job_id} could not save its visit: {str(e)}", exc_info=True)
+                self._finish(job_id, None, str(e))
+                return
+            finally:
+                db.close()
+            self._finish(job_id, response, response.error)
+
+    def _finish(self, job_id: int, response: Optional[ChartGenerationResponse], error: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            job = db.get(ChartJob, job_id)
+            succeeded = response is not None and response.success
+            job.status = ChartJobStatus.COMPLETED if succeeded else ChartJobStatus.FAILED
+            job.visit_id = response.visit_id if response is not None else None
+            job.result = response.model_dump_json() if response is not None else None
+            job.error_message = None if succeeded else error
+            job.completed_at = datetime.utcnow()
+            db.commit()
+            self._publish(job)
+            logger.info(f"Chart job {job_id} {job.status.value}")
+        finally:
+            db.close()
+
+    def job_summary(self, job: ChartJob) -> Dict[str, Any]:
+        """Status of a job; the chart itself once it is done"""
+        status = job.status.value if isinstance(job.status, ChartJobStatus) else job.status
+        summary = {
+            "job_id": job.id,
+            "status": status,
+            "pet_id": job.pet_id,
+            "visit_id": job.visit_id,
+            "error": job.error_message,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+            "status_url": f"/generate-chart/jobs/{job.id}"
+        }
+        if job.result:
+            summary["result"] = json.loads(job.result)
+        return summary
+
+    def _publish(self, job: ChartJob) -> None:
+        data = self.job_summary(job)
+        data.pop("result", None)
+        event_hub.publish("chart_job.updated", data, user_id=job.user_id)
+
+# Global instance
+chart_job_service = ChartJobService()
@@ -0,0 +1,176 @@
+"""
+Chart generation pipeline for Pawscribed
+Produces the SOAP note, client summary and completeness review behind
+/generate-chart in one of three modes:
+  sequential - SOAP, then summary, then validation (three round trips in series)
+  concurrent - SOAP, then summary and validation at the same time (two round trips)
+  combined   - one structured call returning all three, falling back to
+               concurrent if the combined response is unusable
+stream() is the concurrent pipeline with the SOAP note streamed section by
+section; its latencies (including time to first section) are recorded
+under "streaming". Stage and total latency are recorded per mode.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_MODES = ("sequential", "concurrent", "combined")
+DEFAULT_PIPELINE_MODE = os.getenv("CHART_PIPELINE_MODE", "concurrent")
+
+# Latency samples kept per mode for the metrics endpoint
+LATENCY_SAMPLES = 500
+
+
+class ChartGenerationPipeline:
+    def __init__(self, default_mode: str = DEFAULT_PIPELINE_MODE):
+        if default_mode not in PIPELINE_MODES:
+            logger.warning(f"Unknown CHART_PIPELINE_MODE '{default_mode}', using concurrent")
+            default_mode = "concurrent"
+        self.default_mode = default_mode
+        self.latencies: Dict[str, Dict[str, deque]] = {mode: {} for mode in PIPELINE_MODES + ("streaming",)}
+        self.fallbacks = 0
+
+    def _record(self, mode: str, timings: Dict[str, float]) -> None:
+        for stage, seconds in timings.items():
+            self.latencies[mode].setdefault(stage, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    async def run(
+        self,
+        gemini_service,
+        clinical_data: Dict[str, Any],
+        style: str,
+        pet_name: str,
+        mode: Optional[str] = None,
+        deep_validation: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Returns {"success", "mode", "soap", "summary", "validation", "timings", "error"}
+        where summary and validation are the GeminiService result dicts.
+        """
+        mode = mode or self.default_mode
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}'. Use one of: {', '.join(PIPELINE_MODES)}")
+
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        result = None
+
+        if mode == "combined":
+            result = await self._run_combined(gemini_service, clinical_data, style, pet_name, timings)
+            if result is None:
+                # Unusable combined response: produce the chart the two-step way
+                self.fallbacks += 1
+                logger.warning("Combined chart generation failed; falling back to concurrent pipeline")
+                result = await self._run_staged(gemini_service, clinical_data, style, pet_name, True, timings, deep_validation)
+                result["fallback"] = "concurrent"
+        else:
+            result = await self._run_staged(gemini_service, clinical_data, style, pet_name, mode == "concurrent", timings, deep_validation)
+
+        timings["total"] = time.perf_counter() - started
+        self._record(mode, timings)
+        result.update({"mode": mode, "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}})
+        logger.info(f"Chart generated in {mode} mode: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+        return result
+
+    async def stream(
+        self,
+        gemini_service,
+        clinical_data: Dict[str, Any],
+        style: str,
+        pet_name: str,
+        deep_validation: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields {"type": "section", "section", "content"} as SOAP sections
+        complete, then {"type": "result", "result"} shaped like run()'s result
+        """
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        soap_result = None
+        
+        async for event in gemini_service.stream_soap_note(clinical_data, style):
+            if event["type"] == "section":
+                timings.setdefault("first_section", time.perf_counter() - started)
+                yield event
+            else:
+                soap_result = event["result"]
+        timings["soap"] = time.perf_counter() - started
+        
+        if soap_result and soap_result["success"]:
+            soap_data = soap_result["soap"]
+            summary_result, validation_result = await asyncio.gather(
+                self._timed(timings, "summary", gemini_service.generate_client_summary(soap_data, pet_name)),
+                self._timed(timings, "validation", gemini_service.validate_completeness(soap_data, deep=deep_validation))
+            )
+            result = {"success": True, "soap": soap_data, "summary": summary_result, "validation": validation_result}
+        else:
+            soap_result = soap_result or {"error": "No response from model"}
+            result = {"success": False, "error": soap_result.get("error"), "soap": soap_result.get("soap")}
+        
+        timings["total"] = time.perf_counter() - started
+        self._record("streaming", timings)
+        result.update({"mode": "streaming", "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()}})
+        yield {"type": "result", "result": result}
+
+    async def _timed(self, timings: Dict[str, float], stage: str, coroutine):
+        started = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            timings[stage] = time.perf_counter() - started
+
+    async def _run_staged(self, gemini_service, clinical_data, style, pet_name, concurrent: bool, timings, deep_validation: bool = False) -> Dict[str, Any]:
+        soap_result = await self._timed(timings, "soap", gemini_service.generate_soap_note(clinical_data, style))
+        if not soap_result["success"]:
+            return {"success": False, "error": soap_result.get("error"), "soap": soap_result.get("soap")}
+        soap_data = soap_result["soap"]
+
+        # Summary and validation only depend on the SOAP note
+        summary_call = self._timed(timings, "summary", gemini_service.generate_client_summary(soap_data, pet_name))
+        validation_call = self._timed(timings, "validation", gemini_service.validate_completeness(soap_data, deep=deep_validation))
+        if concurrent:
+            summary_result, validation_result = await asyncio.gather(summary_call, validation_call)
+        else:
+            summary_result = await summary_call
+            validation_result = await validation_call
+
+        return {"success": True, "soap": soap_data, "summary": summary_result, "validation": validation_result}
+
+    async def _run_combined(self, gemini_service, clinical_data, style, pet_name, timings) -> Optional[Dict[str, Any]]:
+        bundle = await self._timed(timings, "combined", gemini_service.generate_chart_bundle(clinical_data, style, pet_name))
+        if not bundle["success"]:
+            return None
+
+        summary = bundle.get("client_summary")
+        validation = bundle.get("validation")
+        return {
+            "success": True,
+            "soap": bundle["soap"],
+            "summary": {"success": bool(summary), "summary": summary, "error": None if summary else "No summary in combined response"},
+            "validation": {"success": validation is not None, "validation": validation}
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Latency percentiles per mode and stage over the most recent requests"""
+        report = {}
+        for mode, stages in self.latencies.items():
+            report[mode] = {}
+            for stage, samples in stages.items():
+                values = sorted(samples)
+                report[mode][stage] = {
+                    "count": len(values),
+                    "avg": round(sum(values) / len(values), 3),
+                    "p50": round(values[int(0.50 * (len(values) - 1))], 3),
+                    "p95": round(values[int(0.95 * (len(values) - 1))], 3),
+                    "max": round(values[-1], 3)
+                }
+        return {"default_mode": self.default_mode, "combined_fallbacks": self.fallbacks, "modes": report}
+
+# Global instance
+chart_pipeline = ChartGenerationPipeline()
@@ -1,11 +1,25 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { MicrophoneIcon, StopIcon, PauseIcon, PlayIcon } from '@heroicons/react/24/solid';
 import { CloudArrowUpIcon } from '@heroicons/react/24/outline';
+import Cookies from 'js-cookie';
+
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+const LIVE_SAMPLE_RATE = 16000;
+
+export interface LiveTranscriptionResult {
+  transcriptionJobId: number;
+  audioFileId: number;
+  transcript: string | null;
+  confidence: number | null;
+}
 
 interface AudioRecorderProps {
   onRecordingComplete: (audioBlob: Blob, duration: number) => void;
   onError?: (error: string) => void;
   patientId?: number;
+  // Stream audio to /ws/transcribe while recording and show the transcript as it is recognized
+  liveTranscription?: boolean;
+  onLiveTranscriptionComplete?: (result: LiveTranscriptionResult) => void;
 }
 
 type RecordingState = 'idle' | 'requesting-permission' | 'recording' | 'paused' | 'stopped';
@@ -13,13 +27,17 @@ type RecordingState = 'idle' | 'requesting-permission' | 'recording' | 'paused'
 export const AudioRecorder: React.FC<AudioRecorderProps> = ({
   onRecordingComplete,
   onError,
-  patientId
+  patientId,
+  liveTranscription = false,
+  onLiveTranscriptionComplete
 }) => {
   const [recordingState, setRecordingState] = useState<RecordingState>('idle');
   const [duration, setDuration] = useState(0);
   const [audioLevel, setAudioLevel] = useState(0);
   const [audioBlob, setAudioBlob] = useState<Blob | null>(null);
   const [audioUrl, setAudioUrl] = useState<string | null>(null);
+  const [finalTranscript, setFinalTranscript] = useState('');
+  const [interimTranscript, setInterimTranscript] = useState('');
   
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
   const streamRef = useRef<MediaStream | null>(null);
@@ -28,6 +46,9 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
   const intervalRef = useRef<NodeJS.Timeout | null>(null);
   const animationRef = useRef<number | null>(null);
   const chunksRef = useRef<Blob[]>([]);
+  const socketRef = useRef<WebSocket | null>(null);
+  const processorRef = useRef<ScriptProcessorNode | null>(null);
+  const streamingRef = useRef(false);
 
   // Cleanup function
   const cleanup = () => {
@@ -39,6 +60,11 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
       cancelAnimationFrame(animationRef.current);
       animationRef.current = null;
     }
+    streamingRef.current = false;
+    if (processorRef.current) {
+      processorRef.current.disconnect();
+      processorRef.current = null;
+    }
     if (streamRef.current) {
       streamRef.current.getTracks().forEach(track => track.stop());
       streamRef.current = null;
@@ -85,6 +111,95 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
     updateLevel();
   };
 
+  // Open the live transcription socket; resolves once the server is ready for audio
+  const openLiveSocket = (sampleRate: number): Promise<WebSocket> => {
+    return new Promise((resolve, reject) => {
+      const token = Cookies.get('auth_token') || '';
+      const socket = new WebSocket(
+        `${API_BASE_URL.replace(/^http/, 'ws')}/ws/transcribe?token=${encodeURIComponent(token)}`
+      );
+      socket.binaryType = 'arraybuffer';
+
+      socket.onopen = () => {
+        socket.send(JSON.stringify({ type: 'start', sample_rate: sampleRate }));
+      };
+
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        switch (message.type) {
+          case 'ready':
+            resolve(socket);
+            break;
+          case 'interim':
+            setInterimTranscript(message.transcript);
+            break;
+          case 'final':
+            setFinalTranscript(prev => (prev ? `${prev} ${message.transcript}` : message.transcript));
+            setInterimTranscript('');
+            break;
+          case 'completed':
+            onLiveTranscriptionComplete?.({
+              transcriptionJobId: message.transcription_job_id,
+              audioFileId: message.audio_file_id,
+              transcript: message.transcript,
+              confidence: message.confidence
+            });
+            socket.close();
+            break;
+          case 'error':
+            onError?.(message.error);
+            reject(new Error(message.error));
+            break;
+        }
+      };
+
+      socket.onerror = () => reject(new Error('Live transcription connection failed'));
+      socket.onclose = () => {
+        socketRef.current = null;
+      };
+    });
+  };
+
+  // Convert microphone audio to 16-bit PCM and stream it while recording
+  const startLiveStreaming = async (audioContext: AudioContext, source: MediaStreamAudioSourceNode) => {
+    setFinalTranscript('');
+    setInterimTranscript('');
+
+    try {
+      socketRef.current = await openLiveSocket(audioContext.sampleRate);
+    } catch (error) {
+      // The recording is still uploaded when it stops
+      console.error('Live transcription unavailable:', error);
+      return;
+    }
+
+    const processor = audioContext.createScriptProcessor(4096, 1, 1);
+    processor.onaudioprocess = (event) => {
+      const socket = socketRef.current;
+      if (!streamingRef.current || !socket || socket.readyState !== WebSocket.OPEN) return;
+
+      const samples = event.inputBuffer.getChannelData(0);
+      const pcm = new Int16Array(samples.length);
+      for (let i = 0; i < samples.length; i++) {
+        const s = Math.max(-1, Math.min(1, samples[i]));
+        pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+      }
+      socket.send(pcm.buffer);
+    };
+    source.connect(processor);
+    processor.connect(audioContext.destination); // Output stays silent; needed for processing to run
+    processorRef.current = processor;
+    streamingRef.current = true;
+  };
+
+  const stopLiveStreaming = () => {
+    streamingRef.current = false;
+    const socket = socketRef.current;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({ type: 'stop' }));
+    }
+  };
+
   // Start recording
   const startRecording = async () => {
     try {
@@ -101,13 +216,19 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
 
       streamRef.current = stream;
 
-      // Set up audio context for level monitoring
-      audioContextRef.current = new AudioContext();
+      // Set up audio context for level monitoring (and 16 kHz capture for live transcription)
+      audioContextRef.current = liveTranscription
+        ? new AudioContext({ sampleRate: LIVE_SAMPLE_RATE })
+        : new AudioContext();
       const source = audioContextRef.current.createMediaStreamSource(stream);
       analyserRef.current = audioContextRef.current.createAnalyser();
       analyserRef.current.fftSize = 256;
       source.connect(analyserRef.current);
 
+      if (liveTranscription) {
+        await startLiveStreaming(audioContextRef.current, source);
+      }
+
       // Set up MediaRecorder
       const mediaRecorder = new MediaRecorder(stream, {
         mimeType: 'audio/webm;codecs=opus'
@@ -125,7 +246,10 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
         const blob = new Blob(chunksRef.current, { type: 'audio/webm' });
         setAudioBlob(blob);
         setAudioUrl(URL.createObjectURL(blob));
-        onRecordingComplete(blob, duration);
+        // A live session already has the audio on the server; otherwise upload it
+        if (!socketRef.current) {
+          onRecordingComplete(blob, duration);
+        }
         setRecordingState('stopped');
       };
 
@@ -167,6 +291,7 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
   const stopRecording = () => {
     if (mediaRecorderRef.current && recordingState === 'recording') {
       mediaRecorderRef.current.stop();
+      stopLiveStreaming();
       cleanup();
     }
   };
@@ -175,6 +300,7 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
   const pauseRecording = () => {
     if (mediaRecorderRef.current && recordingState === 'recording') {
       mediaRecorderRef.current.pause();
+      streamingRef.current = false;
       setRecordingState('paused');
       
       if (intervalRef.current) {
@@ -188,6 +314,7 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
   const resumeRecording = () => {
     if (mediaRecorderRef.current && recordingState === 'paused') {
       mediaRecorderRef.current.resume();
+      streamingRef.current = processorRef.current !== null;
       setRecordingState('recording');
       
       // Restart timer
@@ -207,6 +334,8 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
     setDuration(0);
     setAudioLevel(0);
     setAudioBlob(null);
+    setFinalTranscript('');
+    setInterimTranscript('');
     if (audioUrl) {
       URL.revokeObjectURL(audioUrl);
       setAudioUrl(null);
@@ -215,7 +344,10 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
 
   // Cleanup on unmount
   useEffect(() => {
-    return cleanup;
+    return () => {
+      cleanup();
+      socketRef.current?.close();
+    };
   }, []);
 
   // Recording button styling based on state
@@ -330,6 +462,19 @@ export const AudioRecorder: React.FC<AudioRecorderProps> = ({
         </div>
       )}
 
+      {/* Live Transcript */}
+      {liveTranscription && (finalTranscript || interimTranscript) && (
+        <div className="w-full max-w-md">
+          <div className="bg-gray-50 p-4 rounded-lg max-h-48 overflow-y-auto">
+            <p className="text-sm text-gray-600 mb-2">Live Transcript:</p>
+            <p className="text-sm text-gray-800">
+              {finalTranscript}
+              {interimTranscript && <span className="text-gray-400"> {interimTranscript}</span>}
+            </p>
+          </div>
+        </div>
+      )}
+
       {/* Audio Playback */}
       {audioUrl && recordingState === 'stopped' && (
         <div className="w-full max-w-md">
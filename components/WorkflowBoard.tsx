@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { DragDropContext, Droppable, Draggable, DropResult } from 'react-beautiful-dnd';
-import { notesAPI, workflowAPI } from '../lib/api';
+import { notesAPI, workflowAPI, eventsAPI, ServerEvent } from '../lib/api';
 import { ExportModal } from './ExportModal';
 import toast from 'react-hot-toast';
 
@@ -97,6 +97,7 @@ export const WorkflowBoard: React.FC<WorkflowBoardProps> = ({
   const [loading, setLoading] = useState(true);
   const [selectedNotes, setSelectedNotes] = useState<Set<number>>(new Set());
   const [showExportModal, setShowExportModal] = useState(false);
+  const userIdRef = useRef<number | null>(null);
 
   // Load notes and stats
   const loadWorkflowData = async () => {
@@ -129,12 +130,42 @@ export const WorkflowBoard: React.FC<WorkflowBoardProps> = ({
     }
   };
 
+  // Apply a pushed note change for this user's board (note events are only sent to their owner)
+  const applyNoteEvent = (event: ServerEvent) => {
+    if (event.data.user_id !== userIdRef.current) return;
+    const changedIds = new Set<number>(event.data.note_ids);
+
+    setNotes(current => {
+      const next: { [key: string]: Note[] } = {};
+      Object.keys(current).forEach(stageId => {
+        next[stageId] = current[stageId].filter(note => !changedIds.has(note.id));
+      });
+      event.data.notes.forEach((note: Note) => {
+        if (!next[note.status]) return;
+        next[note.status] = [note, ...next[note.status]]
+          .sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime())
+          .slice(0, 50);
+      });
+      return next;
+    });
+    setStats(event.data.stats);
+  };
+
   useEffect(() => {
     loadWorkflowData();
-    
-    // Refresh every 30 seconds
-    const interval = setInterval(loadWorkflowData, 30000);
-    return () => clearInterval(interval);
+
+    // Changes are pushed by the server; reload fully only on (re)connect or when events were missed
+    return eventsAPI.subscribe({
+      connected: (event) => {
+        userIdRef.current = event.data.user_id;
+        loadWorkflowData();
+      },
+      resync: () => loadWorkflowData(),
+      'note.created': applyNoteEvent,
+      'note.updated': applyNoteEvent,
+      'note.deleted': applyNoteEvent,
+      'soap.generated': applyNoteEvent
+    });
   }, []);
 
   // Filter notes based on search and filters
@@ -250,7 +281,6 @@ export const WorkflowBoard: React.FC<WorkflowBoardProps> = ({
       const result = await notesAPI.batchDelete(noteIds);
       toast.success(result.message);
       clearSelection();
-      loadWorkflowData(); // Refresh data
     } catch (error) {
       console.error('Batch delete failed:', error);
       toast.error('Failed to delete selected notes');
@@ -265,7 +295,6 @@ export const WorkflowBoard: React.FC<WorkflowBoardProps> = ({
       const result = await notesAPI.batchUpdateStatus(noteIds, newStatus);
       toast.success(result.message);
       clearSelection();
-      loadWorkflowData(); // Refresh data
     } catch (error) {
       console.error('Batch status update failed:', error);
       toast.error('Failed to update selected notes');
@@ -1,5 +1,8 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from models import Base
 import os
 from dotenv import load_dotenv
@@ -11,6 +14,37 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pawscribed.db")
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def async_database_url(url: str) -> tuple:
+    """
+    The async driver URL (asyncpg for Postgres, aiosqlite for SQLite) and
+    connect args for a sync DATABASE_URL. asyncpg takes ssl instead of sslmode.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    connect_args = {}
+    if backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    elif backend in ("postgresql", "postgres"):
+        query = dict(parsed.query)
+        sslmode = query.pop("sslmode", None)
+        if sslmode:
+            connect_args["ssl"] = sslmode
+        parsed = parsed.set(drivername="postgresql+asyncpg", query=query)
+    return parsed.render_as_string(hide_password=False), connect_args
+
+ASYNC_DATABASE_URL, _async_connect_args = async_database_url(os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL)
+
+# Request handlers use this engine so a slow query waits on the driver, not on the event loop
+# (aiosqlite otherwise opens a connection, and a thread, per session)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=_async_connect_args,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_pre_ping=not ASYNC_DATABASE_URL.startswith("sqlite")
+)
+# Objects stay readable after commit; lazy loads are not possible on an async session
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def create_database():
     Base.metadata.create_all(bind=engine)
 
@@ -19,4 +53,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,215 @@
+"""
+Event hub for Pawscribed
+Publishes job and note state changes to the users (and teams) they concern, so
+clients can subscribe once over SSE or WebSocket instead of polling.
+
+Events are small deltas: {"id", "type", "data", "at"}. Types published:
+  transcription.updated  - a transcription job changed status
+  soap.generated         - a SOAP note was generated from a transcript
+  note.created / note.updated / note.deleted - workflow board changes
+  export.completed       - a PDF or email export finished (or failed)
+
+On Postgres, events go through NOTIFY so that publishers in other processes
+(transcription workers) reach subscribers connected to any API process. On
+other databases delivery is limited to the publishing process. Event ids are
+"<pid>-<n>", unique across the processes publishing to one channel.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "pawscribed_events"
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+NOTIFY_PAYLOAD_LIMIT = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+
+class Subscription:
+    """Events for one connected client"""
+
+    def __init__(self, channels: List[str]):
+        self.channels = channels
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        if self.queue.full():
+            # The client is not keeping up; drop its backlog and tell it to reload
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = {"id": event["id"], "type": "resync", "data": {}, "at": event["at"]}
+        self.queue.put_nowait(event)
+
+    async def next_event(self, timeout: float = HEARTBEAT_SECONDS) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within timeout (time for a heartbeat)"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._sequence = itertools.count(1)
+        # One thread, so NOTIFYs from the event loop go out in publish order without blocking it
+        self._notify_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-notify")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._engine = None
+        self._listen_connection = None
+
+    @staticmethod
+    def channels_for(user_id: Optional[int] = None, team_id: Optional[str] = None) -> List[str]:
+        channels = []
+        if user_id is not None:
+            channels.append(f"user:{user_id}")
+        if team_id:
+            channels.append(f"team:{team_id}")
+        return channels
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from database import engine
+            self._engine = engine
+        return self._engine
+
+    def _uses_notify(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    async def start(self) -> None:
+        """Begin receiving events published by other processes (Postgres only)"""
+        self._loop = asyncio.get_running_loop()
+        if not self._uses_notify() or self._listen_connection is not None:
+            return
+        try:
+            pool_connection = self.engine.raw_connection()
+            pool_connection.detach()  # Never hand a LISTENing connection back to the pool
+            connection = pool_connection.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+            self._loop.add_reader(connection.fileno(), self._on_notification, connection)
+            self._listen_connection = connection
+        except Exception as e:
+            logger.error(f"Event hub could not LISTEN for events: {str(e)}")
+
+    async def stop(self) -> None:
+        if self._listen_connection is not None:
+            try:
+                self._loop.remove_reader(self._listen_connection.fileno())
+                self._listen_connection.close()
+            except Exception:
+                pass
+            self._listen_connection = None
+
+    def subscribe(self, user_id: int, team_id: Optional[str] = None) -> Subscription:
+        self._loop = self._loop or asyncio.get_running_loop()
+        subscription = Subscription(self.channels_for(user_id, team_id))
+        for channel in subscription.channels:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for channel in subscription.channels:
+            subscribers = self._subscriptions.get(channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[channel]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({s for subscribers in self._subscriptions.values() for s in subscribers})
+
+    def publish(self, event_type: str, data: Dict[str, Any], user_id: Optional[int] = None, team_id: Optional[str] = None) -> None:
+        """
+        Publish an event to a user and/or their team. Call after the change is
+        committed. Safe to call from any thread or process; never raises.
+        """
+        targets = self.channels_for(user_id, team_id)
+        if not targets:
+            return
+        event = {
+            "id": f"{os.getpid()}-{next(self._sequence)}",
+            "type": event_type,
+            "data": data,
+            "at": datetime.utcnow().isoformat(),
+            "targets": targets
+        }
+        try:
+            if self._uses_notify():
+                if self._on_event_loop():
+                    self._notify_executor.submit(self._notify_logged, event)
+                else:
+                    self._notify(event)
+            else:
+                self._dispatch_threadsafe(event)
+        except Exception as e:
+            logger.error(f"Failed to publish {event_type} event: {str(e)}")
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def _notify_logged(self, event: Dict[str, Any]) -> None:
+        try:
+            self._notify(event)
+        except Exception as e:
+            logger.error(f"Failed to publish {event['type']} event: {str(e)}")
+
+    def _notify(self, event: Dict[str, Any]) -> None:
+        payload = json.dumps(event, default=str)
+        if len(payload) > NOTIFY_PAYLOAD_LIMIT:
+            logger.warning(f"{event['type']} event too large for NOTIFY; sending resync instead")
+            payload = json.dumps({**event, "type": "resync", "data": {}})
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_CHANNEL, "payload": payload})
+            conn.commit()
+
+    def _on_notification(self, connection) -> None:
+        connection.poll()
+        while connection.notifies:
+            notification = connection.notifies.pop(0)
+            try:
+                self._dispatch(json.loads(notification.payload))
+            except ValueError:
+                logger.warning("Ignoring malformed event notification")
+
+    def _dispatch_threadsafe(self, event: Dict[str, Any]) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # Nobody has subscribed in this process
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        delivered = set()
+        targets = event.pop("targets", [])
+        for channel in targets:
+            for subscription in self._subscriptions.get(channel, ()):
+                if subscription not in delivered:
+                    delivered.add(subscription)
+                    subscription.deliver(event)
+
+# Global instance
+event_hub = EventHub()
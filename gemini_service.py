@@ -1,24 +1,148 @@
-import json
 import os
-from typing import Dict, Any
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from dotenv import load_dotenv
 import logging
 
+from llm_client import llm_registry
+from llm_governor import llm_governor, estimate_call_tokens
+from llm_cache import llm_cache, CachedResponse
+from llm_metrics import llm_metrics
+from soap_stream import SOAPStreamParser, SOAP_SECTIONS
+from long_transcript import needs_map_reduce, estimate_tokens, chunk_transcript, merge_section_facts, SOAP_MAP_CONCURRENCY
+from soap_validator import soap_validator
+from template_service import template_service
+from prompt_compiler import prompt_compiler, CompiledPrompt
+from structured_output import parse_json_response, parse_soap_response, extract_json_object, validate, SOAP_SCHEMA, VALIDATION_SCHEMA, FACTS_SCHEMA
+
 load_dotenv()
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+SOAP_NOTE_CONFIG = {
+    "temperature": 0.2,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+# Map step of long-transcript generation: short, literal fact lists
+FACT_EXTRACTION_CONFIG = {
+    "temperature": 0.1,
+    "max_output_tokens": 2048,
+}
+
+# Template used for transcript SOAP generation when the caller doesn't pass one
+DEFAULT_TEMPLATE_ID = "soap_standard"
+
+# Model handles created at startup so the first request doesn't pay for them
+WARM_MODELS = [
+    ("gemini-2.5-flash", SOAP_NOTE_CONFIG),
+    ("gemini-2.5-flash", {"temperature": 0.3, "top_p": 0.8, "top_k": 40, "max_output_tokens": 2048}),
+    ("gemini-2.5-flash", {"temperature": 0.1, "top_p": 0.8, "top_k": 40, "max_output_tokens": 1024}),
+    ("gemini-2.5-flash-002", None),
+    ("gemini-2.5-flash-002", FACT_EXTRACTION_CONFIG),
+]
+
 class GeminiService:
     def __init__(self):
         self.project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
         self.location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
+
+    async def _generate(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        cache_scope: Optional[str] = None,
+        use_cache: bool = True,
+        prefix: Optional[Tuple[str, str]] = None
+    ):
+        """
+        Generate through the shared client, reusing the warm model handle for
+        this config. Responses are served from and stored in the LLM cache;
+        cache_scope ties the entry to the record the prompt was built from.
+        Calls that miss the cache wait for admission from the LLM governor.
+        Every call, cached or not, is recorded in the LLM metrics. prefix is
+        the (key, text) of a static start of the prompt the provider may cache.
+        """
+        key = llm_cache.key_for(model_name, generation_config, prompt)
+        if use_cache:
+            cached_text = await llm_cache.get(key)
+            if cached_text is not None:
+                logger.debug(f"LLM cache hit for {model_name} ({key[:12]})")
+                llm_metrics.record_cache_hit(model_name)
+                return CachedResponse(cached_text)
         
-        # Initialize Vertex AI once
-        import vertexai
-        vertexai.init(project=self.project_id, location=self.location)
+        trace: Dict[str, Any] = {}
+        started = time.perf_counter()
+        try:
+            response = await llm_governor.call(
+                model_name,
+                estimate_call_tokens(prompt, generation_config),
+                lambda: llm_registry.generate(model_name, prompt, generation_config, prefix=prefix),
+                trace=trace
+            )
+        except Exception as e:
+            llm_metrics.record_call(model_name, prompt, None, time.perf_counter() - started, trace, error=e)
+            raise
+        try:
+            response_text = response.text
+        except Exception:
+            # Blocked or empty candidates; let the caller handle it, don't cache
+            llm_metrics.record_call(model_name, prompt, None, time.perf_counter() - started, trace, response=response)
+            return response
+        llm_metrics.record_call(model_name, prompt, response_text, time.perf_counter() - started, trace, response=response)
+        if use_cache:
+            await llm_cache.set(key, model_name, response_text, cache_scope)
+        return response
+
+    async def _stream(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        cache_scope: Optional[str] = None,
+        use_cache: bool = True,
+        prefix: Optional[Tuple[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """Stream response text; a cache hit arrives as one chunk, a completed stream is cached"""
+        key = llm_cache.key_for(model_name, generation_config, prompt)
+        if use_cache:
+            cached_text = await llm_cache.get(key)
+            if cached_text is not None:
+                llm_metrics.record_cache_hit(model_name)
+                yield cached_text
+                return
         
+        chunks = []
+        trace: Dict[str, Any] = {}
+        started = time.perf_counter()
+        error = None
+        try:
+            async for chunk in llm_governor.stream(
+                model_name,
+                estimate_call_tokens(prompt, generation_config),
+                lambda: llm_registry.stream(model_name, prompt, generation_config, trace=trace, prefix=prefix),
+                trace=trace
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also recorded when the consumer stops reading part way
+            llm_metrics.record_call(model_name, prompt, "".join(chunks), time.perf_counter() - started, trace, error=error)
+        if use_cache:
+            await llm_cache.set(key, model_name, "".join(chunks), cache_scope)
+
+    def warm_up(self) -> None:
+        llm_registry.warm_up(WARM_MODELS)
+
     def sanitize_clinical_data(self, data: Dict[str, Any]) -> str:
         """
         Remove PII/PHI and create a sanitized clinical summary for Gemini.
@@ -55,41 +179,15 @@ class GeminiService:
         logger.debug(f"Sanitized clinical info: '{sanitized_data}'")
         return sanitized_data
     
-    async def generate_soap_note(self, clinical_data: Dict[str, Any], style: str = "detailed") -> Dict[str, Any]:
-        """
-        Generate a structured SOAP note from clinical data.
-        Only anonymized clinical information is sent to Gemini.
-        """
-        try:
-            logger.debug(f"Generating SOAP note with clinical data: {clinical_data}")
-            logger.debug(f"Style: {style}")
-            
-            # Sanitize data - remove all PII/PHI
-            sanitized_clinical_info = self.sanitize_clinical_data(clinical_data)
-            logger.debug(f"Sanitized clinical info: {sanitized_clinical_info}")
-            
-            # Create style-specific prompt
-            style_instructions = {
-                "concise": "Generate a concise, bullet-point style SOAP note.",
-                "detailed": "Generate a detailed, comprehensive SOAP note.",
-                "legal-ready": "Generate a detailed SOAP note suitable for legal documentation with precise medical terminology."
-            }
-            
-            # Check if we have enough clinical information
-            if not sanitized_clinical_info or len(sanitized_clinical_info.strip()) < 10:
-                logger.error(f"Insufficient clinical data provided: '{sanitized_clinical_info}'")
-                return {
-                    "success": False,
-                    "error": "Insufficient clinical information provided. Please fill in clinical notes and other relevant fields.",
-                    "soap": {
-                        "subjective": "Insufficient clinical information provided.",
-                        "objective": "No examination findings documented.", 
-                        "assessment": "Unable to assess without clinical information.",
-                        "plan": "Please provide complete clinical information."
-                    }
-                }
-
-            prompt = f"""
+    def _soap_note_prompt(self, sanitized_clinical_info: str, style: str) -> str:
+        # Create style-specific prompt
+        style_instructions = {
+            "concise": "Generate a concise, bullet-point style SOAP note.",
+            "detailed": "Generate a detailed, comprehensive SOAP note.",
+            "legal-ready": "Generate a detailed SOAP note suitable for legal documentation with precise medical terminology."
+        }
+        
+        return f"""
 You are a veterinary assistant helping to structure clinical notes into a professional SOAP format.
 
 Clinical Information: {sanitized_clinical_info}
@@ -117,61 +215,66 @@ Respond with a JSON object containing the four SOAP sections as separate fields:
     "plan": "..."
 }}
 """
-
-            # Call Vertex AI Gemini 2.5 Flash
-            from vertexai import generative_models
+    
+    def _insufficient_clinical_data(self, sanitized_clinical_info: str) -> Optional[Dict[str, Any]]:
+        """The failure result when there is too little clinical information to chart, else None"""
+        if sanitized_clinical_info and len(sanitized_clinical_info.strip()) >= 10:
+            return None
+        logger.error(f"Insufficient clinical data provided: '{sanitized_clinical_info}'")
+        return {
+            "success": False,
+            "error": "Insufficient clinical information provided. Please fill in clinical notes and other relevant fields.",
+            "soap": {
+                "subjective": "Insufficient clinical information provided.",
+                "objective": "No examination findings documented.", 
+                "assessment": "Unable to assess without clinical information.",
+                "plan": "Please provide complete clinical information."
+            }
+        }
+    
+    def _soap_note_result(self, response_text: str, style: str) -> Dict[str, Any]:
+        logger.debug(f"Received response from Gemini: {response_text[:200]}...")  # Log first 200 chars
+        
+        parsed = parse_soap_response(response_text)
+        if not parsed.ok:
+            logger.error(f"Could not parse SOAP note from response: {'; '.join(parsed.errors)}")
+            return {
+                "success": False,
+                "error": "Could not parse a SOAP note from the AI response"
+            }
+        
+        logger.debug(f"Parsed SOAP data ({parsed.method}): {list(parsed.data.keys())}")
+        return {
+            "success": True,
+            "soap": parsed.data,
+            "style": style
+        }
+    
+    async def generate_soap_note(self, clinical_data: Dict[str, Any], style: str = "detailed", use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Generate a structured SOAP note from clinical data.
+        Only anonymized clinical information is sent to Gemini.
+        """
+        try:
+            logger.debug(f"Generating SOAP note with clinical data: {clinical_data}")
+            logger.debug(f"Style: {style}")
             
-            # Use Gemini 2.5 Flash model
-            model = generative_models.GenerativeModel("gemini-2.5-flash")
+            # Sanitize data - remove all PII/PHI
+            sanitized_clinical_info = self.sanitize_clinical_data(clinical_data)
+            logger.debug(f"Sanitized clinical info: {sanitized_clinical_info}")
             
-            # Generate content
+            # Check if we have enough clinical information
+            insufficient = self._insufficient_clinical_data(sanitized_clinical_info)
+            if insufficient:
+                return insufficient
+
+            prompt = self._soap_note_prompt(sanitized_clinical_info, style)
+
+            # Call Vertex AI Gemini 2.5 Flash
             logger.debug(f"Sending prompt to Gemini: {prompt[:200]}...")  # Log first 200 chars
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.2,
-                    "top_p": 0.8,
-                    "top_k": 40,
-                    "max_output_tokens": 2048,
-                }
-            )
+            response = await self._generate("gemini-2.5-flash", prompt, generation_config=SOAP_NOTE_CONFIG, use_cache=use_cache)
             
-            response_text = response.text
-            logger.debug(f"Received response from Gemini: {response_text[:200]}...")  # Log first 200 chars
-            
-            # Parse the response
-            try:
-                # Clean response text - remove markdown code blocks if present
-                clean_text = response_text.strip()
-                if clean_text.startswith('```json'):
-                    # Remove ```json at start and ``` at end
-                    clean_text = clean_text[7:]  # Remove ```json
-                    if clean_text.endswith('```'):
-                        clean_text = clean_text[:-3]  # Remove ending ```
-                    clean_text = clean_text.strip()
-                elif clean_text.startswith('```'):
-                    # Remove generic code blocks
-                    clean_text = clean_text[3:]
-                    if clean_text.endswith('```'):
-                        clean_text = clean_text[:-3]
-                    clean_text = clean_text.strip()
-                
-                soap_data = json.loads(clean_text)
-                
-                # Validate that we have actual content in the SOAP sections
-                if not any(soap_data.get(section, '').strip() for section in ['subjective', 'objective', 'assessment', 'plan']):
-                    logger.error("Generated SOAP note has empty sections")
-                    return self._parse_soap_from_text(response_text, style)
-                
-                logger.debug(f"Successfully parsed SOAP data: {list(soap_data.keys())}")
-                return {
-                    "success": True,
-                    "soap": soap_data,
-                    "style": style
-                }
-            except json.JSONDecodeError as e:
-                # Fallback: try to extract SOAP sections from text
-                return self._parse_soap_from_text(response_text, style)
+            return self._soap_note_result(response.text, style)
                 
         except Exception as e:
             logger.error(f"Error generating SOAP note: {str(e)}", exc_info=True)
@@ -181,111 +284,176 @@ Respond with a JSON object containing the four SOAP sections as separate fields:
                 "soap": None
             }
     
-    async def generate_soap_from_transcript(self, transcript: str, patient_info: Dict[str, Any], template: Dict[str, Any]) -> Dict[str, Any]:
+    async def stream_soap_note(self, clinical_data: Dict[str, Any], style: str = "detailed", use_cache: bool = True) -> AsyncIterator[Dict[str, Any]]:
         """
-        Generate SOAP note from transcription using template structure
+        Streaming generate_soap_note: yields {"type": "section", "section", "content"}
+        as each SOAP section completes, then {"type": "result", "result"} with
+        exactly what generate_soap_note would have returned.
         """
         try:
-            from vertexai.generative_models import GenerativeModel
+            sanitized_clinical_info = self.sanitize_clinical_data(clinical_data)
+            insufficient = self._insufficient_clinical_data(sanitized_clinical_info)
+            if insufficient:
+                yield {"type": "result", "result": insufficient}
+                return
             
-            # Create specialized prompt for transcription-based SOAP generation
-            prompt = f"""
-You are a veterinary AI assistant. Create a structured SOAP note from this voice transcription.
+            prompt = self._soap_note_prompt(sanitized_clinical_info, style)
+            parser = SOAPStreamParser()
+            async for chunk in self._stream("gemini-2.5-flash", prompt, generation_config=SOAP_NOTE_CONFIG, use_cache=use_cache):
+                for section, content in parser.feed(chunk):
+                    yield {"type": "section", "section": section, "content": content}
+            
+            yield {"type": "result", "result": self._soap_note_result(parser.text, style)}
+            
+        except Exception as e:
+            logger.error(f"Error streaming SOAP note: {str(e)}", exc_info=True)
+            yield {"type": "result", "result": {"success": False, "error": str(e), "soap": None}}
+    
+    def _patient_line(self, patient_info: Dict[str, Any]) -> str:
+        return f"{patient_info.get('species', 'Unknown')} ({patient_info.get('breed', 'Mixed')}, {patient_info.get('age', 'Unknown')} years, {patient_info.get('sex', 'Unknown')}, {patient_info.get('weight', 'Unknown')} lbs)"
+    
+    def _chunk_facts_prompt(self, chunk: str, index: int, total: int, patient_info: Dict[str, Any]) -> str:
+        return f"""
+You are a veterinary AI assistant. Below is part {index + 1} of {total} of a voice transcription of a veterinary visit.
 
-PATIENT: {patient_info.get('species', 'Unknown')} ({patient_info.get('breed', 'Mixed')}, {patient_info.get('age', 'Unknown')} years, {patient_info.get('sex', 'Unknown')}, {patient_info.get('weight', 'Unknown')} lbs)
+PATIENT: {self._patient_line(patient_info)}
 
-TRANSCRIPT:
-{transcript}
+TRANSCRIPT PART:
+{chunk}
 
 INSTRUCTIONS:
-1. Extract information ONLY from the transcript
-2. If information is not mentioned, write "Not enough data provided"
-3. Do NOT hallucinate or infer information
-4. Use proper veterinary terminology
-5. Structure according to SOAP format
+1. List the clinical facts stated in this part, grouped by SOAP section
+2. Only include facts explicitly stated in this part; do NOT infer
+3. Keep each fact to a short phrase or sentence, with exact values (doses, vitals, durations)
+4. Leave a section's list empty if nothing in this part belongs there
 
 Return ONLY a JSON object with this structure:
 {{
-  "subjective": "Patient history and owner observations from transcript...",
-  "objective": "Physical examination findings from transcript...", 
-  "assessment": "Clinical assessment and diagnosis from transcript...",
-  "plan": "Treatment plan and follow-up from transcript..."
+  "subjective": ["..."],
+  "objective": ["..."],
+  "assessment": ["..."],
+  "plan": ["..."]
 }}
 """
-            
-            model = GenerativeModel("gemini-2.5-flash-002")
-            response = model.generate_content(prompt)
-            response_text = response.text
-            
-            logger.debug(f"Gemini transcript SOAP response: {response_text}")
-            
-            # Parse JSON response
-            try:
-                # Clean response text
-                clean_text = response_text.strip()
-                if clean_text.startswith('```json'):
-                    clean_text = clean_text[7:]
-                    if clean_text.endswith('```'):
-                        clean_text = clean_text[:-3]
-                    clean_text = clean_text.strip()
-                elif clean_text.startswith('```'):
-                    clean_text = clean_text[3:]
-                    if clean_text.endswith('```'):
-                        clean_text = clean_text[:-3]
-                    clean_text = clean_text.strip()
-                
-                soap_data = json.loads(clean_text)
-                
-                return {
-                    "success": True,
-                    "soap_content": soap_data
-                }
-                
-            except json.JSONDecodeError:
-                # Fallback to text parsing
-                return {
-                    "success": True,
-                    "soap_content": response_text
-                }
-                
-        except Exception as e:
-            logger.error(f"Error generating SOAP from transcript: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "error": str(e)
-            }
     
-    def _parse_soap_from_text(self, text: str, style: str) -> Dict[str, Any]:
+    def _facts_text(self, facts: Dict[str, List[str]]) -> str:
+        fact_lines = []
+        for section in SOAP_SECTIONS:
+            fact_lines.append(f"{section.upper()}:")
+            section_facts = facts.get(section) or ["(none)"]
+            fact_lines.extend(f"- {fact}" for fact in section_facts)
+        return "\n".join(fact_lines)
+    
+    def _compiled_template(self, template: Optional[Dict[str, Any]]) -> CompiledPrompt:
+        """The compiled prompt for a template (as from template_service.get_template), or the standard SOAP one"""
+        if not template:
+            template = template_service.get_template(DEFAULT_TEMPLATE_ID)
+        elif not template.get("version"):
+            # A bare template structure: version it by content so edits recompile
+            template = {**template, "id": template.get("id", "inline"), "version": template_service.template_version(template)}
+        return prompt_compiler.compile(template)
+    
+    async def _extract_transcript_facts(self, transcript: str, patient_info: Dict[str, Any], cache_scope: Optional[str]) -> Tuple[Dict[str, List[str]], int]:
+        """Map step: section facts from each chunk of a long transcript, extracted concurrently and merged"""
+        chunks = chunk_transcript(transcript)
+        semaphore = asyncio.Semaphore(SOAP_MAP_CONCURRENCY)
+        
+        async def extract(index: int, chunk: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                response = await self._generate(
+                    "gemini-2.5-flash-002",
+                    self._chunk_facts_prompt(chunk, index, len(chunks), patient_info),
+                    generation_config=FACT_EXTRACTION_CONFIG,
+                    cache_scope=cache_scope
+                )
+            parsed = parse_json_response(response.text, FACTS_SCHEMA)
+            if not parsed.ok:
+                logger.warning(f"Could not parse facts from transcript chunk {index + 1}/{len(chunks)}: {'; '.join(parsed.errors)}")
+                return None
+            return parsed.data
+        
+        partials = await asyncio.gather(*[extract(index, chunk) for index, chunk in enumerate(chunks)])
+        usable = [facts for facts in partials if facts is not None]
+        if not usable:
+            raise ValueError("No clinical facts could be extracted from the transcript")
+        if len(usable) < len(chunks):
+            logger.warning(f"Facts extracted from {len(usable)} of {len(chunks)} transcript chunks")
+        return merge_section_facts(usable), len(chunks)
+    
+    async def _transcript_generation_prompt(
+        self,
+        transcript: str,
+        patient_info: Dict[str, Any],
+        compiled: CompiledPrompt,
+        cache_scope: Optional[str]
+    ) -> Tuple[str, Dict[str, Any]]:
         """
-        Fallback method to parse SOAP sections from text response.
+        The prompt for the SOAP call: the template's compiled prefix followed by
+        the transcript itself, or for transcripts too long for one prompt the
+        facts extracted from it chunk by chunk
         """
-        sections = {"subjective": "", "objective": "", "assessment": "", "plan": ""}
-        current_section = None
+        patient_line = self._patient_line(patient_info)
+        template_info = {"template": compiled.cache_key}
+        if not needs_map_reduce(transcript):
+            return compiled.for_transcript(patient_line, transcript), {"strategy": "single", **template_info}
         
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if line.upper().startswith('SUBJECTIVE'):
-                current_section = 'subjective'
-                sections[current_section] = line.replace('SUBJECTIVE:', '').strip()
-            elif line.upper().startswith('OBJECTIVE'):
-                current_section = 'objective'
-                sections[current_section] = line.replace('OBJECTIVE:', '').strip()
-            elif line.upper().startswith('ASSESSMENT'):
-                current_section = 'assessment'
-                sections[current_section] = line.replace('ASSESSMENT:', '').strip()
-            elif line.upper().startswith('PLAN'):
-                current_section = 'plan'
-                sections[current_section] = line.replace('PLAN:', '').strip()
-            elif current_section and line:
-                sections[current_section] += " " + line
+        estimated_tokens = estimate_tokens(transcript)
+        facts, chunk_count = await self._extract_transcript_facts(transcript, patient_info, cache_scope)
+        logger.info(f"Map-reduce SOAP generation: ~{estimated_tokens} tokens in {chunk_count} chunks")
+        return compiled.for_facts(patient_line, self._facts_text(facts)), {
+            "strategy": "map_reduce",
+            "chunks": chunk_count,
+            "estimated_tokens": estimated_tokens,
+            **template_info
+        }
+    
+    def _transcript_soap_result(self, response_text: str) -> Dict[str, Any]:
+        logger.debug(f"Gemini transcript SOAP response: {response_text}")
         
+        parsed = parse_soap_response(response_text)
+        # Unparseable text is passed on as-is for the caller's structuring
         return {
             "success": True,
-            "soap": sections,
-            "style": style
+            "soap_content": parsed.data if parsed.ok else response_text
         }
     
+    async def generate_soap_from_transcript(self, transcript: str, patient_info: Dict[str, Any], template: Dict[str, Any], cache_scope: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generate SOAP note from transcription using template structure
+        """
+        try:
+            compiled = self._compiled_template(template)
+            prompt, strategy = await self._transcript_generation_prompt(transcript, patient_info, compiled, cache_scope)
+            response = await self._generate(
+                "gemini-2.5-flash-002", prompt, cache_scope=cache_scope, prefix=(compiled.cache_key, compiled.prefix)
+            )
+            return {**self._transcript_soap_result(response.text), **strategy}
+                
+        except Exception as e:
+            logger.error(f"Error generating SOAP from transcript: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def stream_soap_from_transcript(self, transcript: str, patient_info: Dict[str, Any], template: Dict[str, Any], cache_scope: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming generate_soap_from_transcript; yields events like stream_soap_note"""
+        try:
+            compiled = self._compiled_template(template)
+            prompt, strategy = await self._transcript_generation_prompt(transcript, patient_info, compiled, cache_scope)
+            parser = SOAPStreamParser(compiled.schema)
+            async for chunk in self._stream(
+                "gemini-2.5-flash-002", prompt, cache_scope=cache_scope, prefix=(compiled.cache_key, compiled.prefix)
+            ):
+                for section, content in parser.feed(chunk):
+                    yield {"type": "section", "section": section, "content": content}
+            
+            yield {"type": "result", "result": {**self._transcript_soap_result(parser.text), **strategy}}
+            
+        except Exception as e:
+            logger.error(f"Error streaming SOAP from transcript: {str(e)}", exc_info=True)
+            yield {"type": "result", "result": {"success": False, "error": str(e)}}
+    
     async def generate_client_summary(self, soap_data: Dict[str, str], pet_name: str = "your pet") -> Dict[str, Any]:
         """
         Generate a plain-language summary for pet owners.
@@ -330,13 +498,9 @@ Generate a summary that:
 Do not include the pet's name in your response - it will be added later.
 """
 
-            from vertexai import generative_models
-            
             # Use Gemini 2.5 Flash model
-            model = generative_models.GenerativeModel("gemini-2.5-flash")
-            
-            # Generate content
-            response = model.generate_content(
+            response = await self._generate(
+                "gemini-2.5-flash",
                 prompt,
                 generation_config={
                     "temperature": 0.3,
@@ -385,10 +549,19 @@ Do not include the pet's name in your response - it will be added later.
                 "summary": None
             }
     
-    async def validate_completeness(self, soap_data: Dict[str, str]) -> Dict[str, Any]:
+    async def validate_completeness(self, soap_data: Dict[str, str], cache_scope: Optional[str] = None, deep: bool = False) -> Dict[str, Any]:
         """
-        Check if SOAP note is complete and suggest missing elements.
+        Check if SOAP note is complete and suggest missing elements. The local
+        rule-based review answers unless it is unsure of the note or a deep
+        review is asked for; then Gemini reviews it.
         """
+        local_validation = soap_validator.validate(soap_data)
+        if not deep and not soap_validator.needs_review(local_validation):
+            return {
+                "success": True,
+                "validation": local_validation
+            }
+        
         try:
             prompt = f"""
 Review this veterinary SOAP note for completeness and clinical quality:
@@ -414,44 +587,147 @@ Respond with a JSON object:
 }}
 """
 
-            from vertexai import generative_models
-            
             # Use Gemini 2.5 Flash model
-            model = generative_models.GenerativeModel("gemini-2.5-flash")
-            
-            # Generate content
-            response = model.generate_content(
+            response = await self._generate(
+                "gemini-2.5-flash",
                 prompt,
                 generation_config={
                     "temperature": 0.1,
                     "top_p": 0.8,
                     "top_k": 40,
                     "max_output_tokens": 1024,
-                }
+                },
+                cache_scope=cache_scope
             )
             
-            response_text = response.text
-            
-            try:
-                validation_data = json.loads(response_text)
+            parsed = parse_json_response(response.text, VALIDATION_SCHEMA, required=["completeness_score"])
+            if parsed.ok:
                 return {
                     "success": True,
-                    "validation": validation_data
+                    "validation": self._llm_validation(parsed.data)
                 }
-            except json.JSONDecodeError:
+            else:
+                logger.warning(f"Could not parse completeness review: {'; '.join(parsed.errors)}")
                 # Fallback validation
                 return {
                     "success": True,
-                    "validation": {
-                        "completeness_score": 0.8,
-                        "missing_elements": [],
-                        "suggestions": ["Manual review recommended"]
-                    }
+                    "validation": local_validation
                 }
                 
         except Exception as e:
+            logger.warning(f"Gemini completeness review failed, using local review: {str(e)}")
+            return {
+                "success": True,
+                "validation": local_validation
+            }
+    
+    def _llm_validation(self, validation: Dict[str, Any]) -> Dict[str, Any]:
+        """A Gemini review in the ValidationResult shape the local review uses"""
+        return {
+            "completeness_score": validation.get("completeness_score", 0.0),
+            "missing_elements": [str(item) for item in validation.get("missing_elements", [])],
+            "suggestions": [str(item) for item in validation.get("suggestions", [])],
+            "source": "llm",
+            "confidence": None
+        }
+
+    async def generate_chart_bundle(self, clinical_data: Dict[str, Any], style: str = "detailed", pet_name: str = "your pet") -> Dict[str, Any]:
+        """
+        Generate the SOAP note, client summary and completeness review in one
+        structured call. Only anonymized clinical information is sent; the pet
+        name is added back afterwards.
+        """
+        try:
+            sanitized_clinical_info = self.sanitize_clinical_data(clinical_data)
+            if not sanitized_clinical_info or len(sanitized_clinical_info.strip()) < 10:
+                return {
+                    "success": False,
+                    "error": "Insufficient clinical information provided. Please fill in clinical notes and other relevant fields."
+                }
+            
+            style_instructions = {
+                "concise": "Write the SOAP note in a concise, bullet-point style.",
+                "detailed": "Write a detailed, comprehensive SOAP note.",
+                "legal-ready": "Write a detailed SOAP note suitable for legal documentation with precise medical terminology."
+            }
+            
+            prompt = f"""
+You are a veterinary assistant. From the clinical information below, produce three things:
+a SOAP note, a summary of the visit for the pet owner, and a completeness review of the SOAP note.
+
+Clinical Information: {sanitized_clinical_info}
+
+{style_instructions.get(style, style_instructions["detailed"])}
+
+IMPORTANT CONSTRAINTS:
+1. ONLY use information explicitly provided in the clinical information above
+2. DO NOT add, infer, or assume any information not directly stated
+3. If information for a SOAP section is missing, state "Not documented"
+4. The owner summary uses simple, warm language, only restates the SOAP note, and refers to the animal as "your pet"
+5. The completeness review checks for vital signs, a diagnosis or differentials, a treatment plan with dosages, follow-up instructions and owner communication
+
+Respond with ONLY a JSON object:
+{{
+    "soap": {{
+        "subjective": "...",
+        "objective": "...",
+        "assessment": "...",
+        "plan": "..."
+    }},
+    "client_summary": "...",
+    "validation": {{
+        "completeness_score": 0.85,
+        "missing_elements": ["..."],
+        "suggestions": ["..."]
+    }}
+}}
+"""
+            
+            response = await self._generate(
+                "gemini-2.5-flash",
+                prompt,
+                generation_config={
+                    "temperature": 0.2,
+                    "top_p": 0.8,
+                    "top_k": 40,
+                    "max_output_tokens": 4096,
+                    "response_mime_type": "application/json",
+                }
+            )
+            
+            bundle, _ = extract_json_object(response.text)
+            if bundle is None:
+                return {"success": False, "error": "Combined response was not a JSON object"}
+            
+            soap_data, _ = validate(bundle.get("soap") if isinstance(bundle.get("soap"), dict) else {}, SOAP_SCHEMA)
+            soap_data = {section: soap_data.get(section, "") for section in SOAP_SCHEMA}
+            if not any(value.strip() for value in soap_data.values()):
+                return {"success": False, "error": "Combined response had an empty SOAP note"}
+            
+            validation = None
+            if isinstance(bundle.get("validation"), dict):
+                validation, _ = validate(bundle["validation"], VALIDATION_SCHEMA, required=["completeness_score"])
+            validation = self._llm_validation(validation) if validation else soap_validator.validate(soap_data)
+            
+            summary = bundle.get("client_summary")
+            if not isinstance(summary, str):
+                summary = None
+            if summary:
+                summary = summary.replace("your pet", pet_name).replace("the pet", pet_name)
+            
+            return {
+                "success": True,
+                "soap": soap_data,
+                "client_summary": summary,
+                "validation": validation
+            }
+            
+        except Exception as e:
+            logger.error(f"Error generating combined chart: {str(e)}", exc_info=True)
             return {
                 "success": False,
-                "error": str(e),
-                "validation": None
-            }
\ No newline at end of file
+                "error": str(e)
+            }
+
+# Global instance
+gemini_service = GeminiService()
@@ -200,6 +200,35 @@ export const visitsAPI = {
   }
 };
 
+// Read a server-sent event stream from a fetch response (EventSource can't POST)
+async function readEventStream(body: ReadableStream<Uint8Array>, onEvent: (eventType: string, data: any) => void) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let eventType = 'message';
+      const dataLines: string[] = [];
+      message.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) eventType = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+      });
+      if (dataLines.length) {
+        onEvent(eventType, JSON.parse(dataLines.join('\n')));
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+}
+
 // Chart Generation API
 export const chartAPI = {
   async generateChart(chartData: {
@@ -211,6 +240,7 @@ export const chartAPI = {
     physical_exam?: string;
     diagnostic_findings?: string;
     style?: string;
+    pipeline_mode?: 'sequential' | 'concurrent' | 'combined';
   }) {
     try {
       const response = await api.post('/generate-chart', chartData);
@@ -221,9 +251,54 @@ export const chartAPI = {
     }
   },
 
-  async validateChart(visitId: number) {
+  /**
+   * generateChart with the SOAP note streamed: onSection fires as each section
+   * is generated, and the promise resolves with the same body generateChart
+   * returns once the visit is saved.
+   */
+  async generateChartStream(
+    chartData: {
+      pet_id: number;
+      visit_type: string;
+      clinical_notes: string;
+      chief_complaint?: string;
+      symptoms?: string;
+      physical_exam?: string;
+      diagnostic_findings?: string;
+      style?: string;
+    },
+    onSection: (section: string, content: string) => void
+  ) {
+    const response = await fetch(`${API_BASE_URL}/generate-chart/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Authorization: `Bearer ${Cookies.get('auth_token') || ''}`,
+      },
+      body: JSON.stringify(chartData),
+    });
+    if (!response.ok || !response.body) {
+      toast.error('Failed to generate chart');
+      throw new Error(`Chart generation failed with status ${response.status}`);
+    }
+
+    let result: any = null;
+    await readEventStream(response.body, (eventType, data) => {
+      if (eventType === 'section') {
+        onSection(data.section, data.content);
+      } else if (eventType === 'complete') {
+        result = data;
+      }
+    });
+    if (!result) {
+      throw new Error('Chart stream ended before completion');
+    }
+    return result;
+  },
+
+  async validateChart(visitId: number, deep = false) {
     try {
-      const response = await api.post(`/validate-chart/${visitId}`);
+      const response = await api.post(`/validate-chart/${visitId}`, null, { params: { deep } });
       return response.data;
     } catch (error: any) {
       toast.error(error.response?.data?.detail || 'Failed to validate chart');
@@ -248,12 +323,15 @@ export const templatesAPI = {
 
 // Audio API
 export const audioAPI = {
-  async upload(file: File, patientId?: number) {
+  async upload(file: File, patientId?: number, priority?: 'live' | 'normal' | 'backlog') {
     const formData = new FormData();
     formData.append('file', file);
     if (patientId) {
       formData.append('patient_id', patientId.toString());
     }
+    if (priority) {
+      formData.append('priority', priority);
+    }
 
     const response = await api.post('/audio/upload', formData, {
       headers: {
@@ -271,6 +349,11 @@ export const audioAPI = {
   async getTranscriptionStatus(jobId: number) {
     const response = await api.get(`/transcriptions/${jobId}`);
     return response.data;
+  },
+
+  async getQueueMetrics() {
+    const response = await api.get('/transcriptions/queue/metrics');
+    return response.data;
   }
 };
 
@@ -317,6 +400,70 @@ export const notesAPI = {
   async batchExport(noteIds: number[], format: string = 'pdf') {
     const response = await api.post(`/notes/batch/export?export_format=${format}`, noteIds);
     return response.data;
+  },
+
+  // Bulk SOAP generation; progress also arrives as 'soap_batch.updated' events
+  async batchGenerate(items: { transcription_job_id: number; patient_id: number }[], templateType: string = 'soap_standard') {
+    const response = await api.post('/notes/batch/generate', { items, template_type: templateType });
+    return response.data;
+  },
+
+  async getBatchGeneration(batchId: number) {
+    const response = await api.get(`/notes/batch/generate/${batchId}`);
+    return response.data;
+  }
+};
+
+// Server-pushed events (transcription, note, SOAP and export updates)
+export interface ServerEvent {
+  // "<server process id>-<sequence>", unique across API processes
+  id: string;
+  type: string;
+  data: any;
+  at: string;
+}
+
+export const eventsAPI = {
+  /**
+   * Subscribe to events for the current user and team. Handlers are keyed by
+   * event type; 'connected' fires on every (re)connect and 'resync' when
+   * events may have been missed, so callers should reload their state on both.
+   * Returns a function that closes the subscription.
+   */
+  subscribe(handlers: { [eventType: string]: (event: ServerEvent) => void }) {
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+
+    const connect = () => {
+      // Read the token on every connect: it may have been refreshed since the last one
+      const token = Cookies.get('auth_token') || '';
+      source = new EventSource(`${API_BASE_URL}/events/stream?token=${encodeURIComponent(token)}`);
+
+      Object.keys(handlers).forEach((eventType) => {
+        source!.addEventListener(eventType, (message: MessageEvent) => {
+          const event = eventType === 'connected'
+            ? { id: '', type: 'connected', data: JSON.parse(message.data), at: new Date().toISOString() }
+            : JSON.parse(message.data);
+          handlers[eventType](event);
+        });
+      });
+
+      source.onerror = () => {
+        // Reconnect ourselves so an expired token is replaced with a fresh one
+        source?.close();
+        if (!closed) {
+          retryTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      if (retryTimer) clearTimeout(retryTimer);
+      source?.close();
+    };
   }
 };
 
@@ -0,0 +1,282 @@
+"""
+Live transcription service for Pawscribed
+Streams microphone audio received over a WebSocket to a streaming recognizer,
+pushes interim and final results back as they arrive, and stores the recording
+with a completed TranscriptionJob as soon as recording stops.
+
+Protocol (JSON text frames unless noted):
+  client -> {"type": "start", "sample_rate": 16000}
+  client -> binary frames of 16-bit little-endian mono PCM
+  client -> {"type": "stop"}
+  server -> {"type": "ready"} | {"type": "interim" | "final", "transcript", "confidence"}
+            | {"type": "completed", "transcription_job_id", "audio_file_id", "transcript", "confidence"}
+            | {"type": "error", "error"}
+"""
+
+import os
+import json
+import uuid
+import wave
+import queue
+import asyncio
+import logging
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from database import SessionLocal
+from models import User, TranscriptionJob, TranscriptionStatus, TranscriptionPriority
+from transcription_scheduler import tenant_for_user
+from speech_backends import SpeechBackend
+from audio_upload_service import audio_upload_service
+from transcription_service import transcription_service
+
+logger = logging.getLogger(__name__)
+
+LIVE_MAX_SECONDS = int(os.getenv("LIVE_TRANSCRIPTION_MAX_SECONDS", "3600"))
+MAX_LIVE_SESSIONS = int(os.getenv("LIVE_TRANSCRIPTION_MAX_SESSIONS", "20"))
+ALLOWED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+
+class LiveTranscriptionSession:
+    """
+    One live recording. Audio frames are appended to a WAV file and handed to
+    a recognizer thread; recognizer results are delivered on self.results,
+    followed by None when recognition has finished.
+    """
+
+    def __init__(self, backend: SpeechBackend, user_id: int, sample_rate: int, recording_dir: Path, executor: ThreadPoolExecutor):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.started_at = datetime.utcnow()
+        self.frames = 0
+        self.finals: List[Dict[str, Any]] = []
+        self.results: asyncio.Queue = asyncio.Queue()
+        self.recognition_error: Optional[str] = None
+
+        recording_dir.mkdir(parents=True, exist_ok=True)
+        self.recording_path = recording_dir / f"{user_id}_{uuid.uuid4().hex}.wav"
+        self._wav = wave.open(str(self.recording_path), "wb")
+        self._wav.setnchannels(1)
+        self._wav.setsampwidth(2)
+        self._wav.setframerate(sample_rate)
+
+        self._loop = asyncio.get_running_loop()
+        self._audio: queue.Queue = queue.Queue()
+        self._recognizing = True
+        self._recognizer = self._loop.run_in_executor(executor, self._recognize)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / float(self.sample_rate)
+
+    def _recognize(self) -> None:
+        """Recognizer thread: consume queued audio until None, publishing each result"""
+        try:
+            for result in self.backend.streaming_recognize(iter(self._audio.get, None), self.sample_rate):
+                self._loop.call_soon_threadsafe(self.results.put_nowait, result)
+        except Exception as e:
+            logger.error(f"Live recognition failed: {str(e)}", exc_info=True)
+            self.recognition_error = str(e)
+        finally:
+            self._recognizing = False
+            self._loop.call_soon_threadsafe(self.results.put_nowait, None)
+
+    def add_audio(self, pcm: bytes) -> bool:
+        """Record and recognize a frame of PCM. Returns False once the length limit is reached."""
+        if len(pcm) % 2:
+            pcm = pcm[:-1]
+        self._wav.writeframes(pcm)
+        self.frames += len(pcm) // 2
+        if self._recognizing:
+            self._audio.put(pcm)
+        return self.duration < LIVE_MAX_SECONDS
+
+    def end_audio(self) -> None:
+        """No more audio: close the recording and let the recognizer drain"""
+        if self._wav is None:
+            return
+        self._wav.close()
+        self._wav = None
+        self._audio.put(None)
+
+    async def wait_recognized(self) -> None:
+        await self._recognizer
+
+    def transcript(self) -> Dict[str, Any]:
+        """Final transcript and word-weighted confidence of everything recognized"""
+        texts = [r["transcript"] for r in self.finals if r["transcript"]]
+        weights = [len(text.split()) for text in texts]
+        confidences = [r["confidence"] for r in self.finals if r["transcript"]]
+        total = sum(weights)
+        return {
+            "transcript": " ".join(texts).strip(),
+            "confidence": sum(w * c for w, c in zip(weights, confidences)) / total if total else 0.0
+        }
+
+
+class LiveTranscriptionService:
+    def __init__(self, backend: Optional[SpeechBackend] = None, recording_dir: str = "uploads/live"):
+        self._backend = backend
+        self.recording_dir = Path(recording_dir)
+        # Each live session holds a recognizer thread for its whole duration
+        self.executor = ThreadPoolExecutor(max_workers=MAX_LIVE_SESSIONS, thread_name_prefix="speech-stream")
+        self.active_sessions = 0
+
+    @property
+    def backend(self) -> SpeechBackend:
+        # Share the batch pipeline's backend (and its client) unless overridden
+        return self._backend or transcription_service.backend
+
+    async def handle(self, websocket: WebSocket, user: User) -> None:
+        """
+        Run one live transcription session on an accepted WebSocket. user may be
+        detached; a session is only opened to store the recording at the end.
+        """
+        if self.active_sessions >= MAX_LIVE_SESSIONS:
+            await websocket.send_json({"type": "error", "error": "Live transcription is at capacity. Please upload the recording instead."})
+            await websocket.close()
+            return
+
+        try:
+            start = await websocket.receive_json()
+        except (WebSocketDisconnect, ValueError):
+            return
+        sample_rate = int(start.get("sample_rate") or 16000)
+        if start.get("type") != "start" or sample_rate not in ALLOWED_SAMPLE_RATES:
+            await websocket.send_json({"type": "error", "error": "Expected a start message with a supported sample_rate"})
+            await websocket.close()
+            return
+
+        self.active_sessions += 1
+        try:
+            session = LiveTranscriptionSession(self.backend, user.id, sample_rate, self.recording_dir, self.executor)
+            await websocket.send_json({"type": "ready"})
+            logger.info(f"Live transcription started for user {user.id} at {sample_rate} Hz")
+
+            forwarder = asyncio.create_task(self._forward_results(websocket, session))
+            try:
+                stopped = await self._receive_audio(websocket, session)
+            finally:
+                # Always release the recognizer thread
+                session.end_audio()
+            await session.wait_recognized()
+            await forwarder
+
+            result = await self._persist(session, user, recognized=stopped and session.recognition_error is None)
+            if stopped:
+                if result:
+                    await websocket.send_json({"type": "completed", **result})
+                else:
+                    await websocket.send_json({"type": "error", "error": "No audio received"})
+                await websocket.close()
+        finally:
+            self.active_sessions -= 1
+
+    async def _receive_audio(self, websocket: WebSocket, session: LiveTranscriptionSession) -> bool:
+        """Feed audio frames to the session. Returns True if the client stopped the recording cleanly."""
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return False
+
+                if message.get("bytes") is not None:
+                    if not session.add_audio(message["bytes"]):
+                        await websocket.send_json({"type": "error", "error": "Maximum recording length reached"})
+                        return True
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"]).get("type")
+                    except (ValueError, AttributeError):
+                        # Not a JSON object: report it and keep recording
+                        await websocket.send_json({"type": "error", "error": "Control messages must be JSON objects"})
+                        continue
+                    if control == "stop":
+                        return True
+        except (WebSocketDisconnect, RuntimeError):
+            return False
+
+    async def _forward_results(self, websocket: WebSocket, session: LiveTranscriptionSession) -> None:
+        """Push recognizer results to the client, collecting final ones"""
+        client_connected = True
+        while True:
+            result = await session.results.get()
+            if result is None:
+                return
+            if result["is_final"]:
+                session.finals.append(result)
+
+            if client_connected:
+                try:
+                    await websocket.send_json({
+                        "type": "final" if result["is_final"] else "interim",
+                        "transcript": result["transcript"],
+                        "confidence": result["confidence"]
+                    })
+                except Exception:
+                    # Keep collecting results so the transcript is still stored
+                    client_connected = False
+
+    async def _persist(self, session: LiveTranscriptionSession, user: User, recognized: bool) -> Optional[Dict[str, Any]]:
+        """
+        Store the recording and its transcription job. A cleanly stopped session
+        gets a completed job; if the client dropped or recognition failed the
+        recording is queued for normal transcription instead.
+        """
+        if session.frames == 0:
+            session.recording_path.unlink(missing_ok=True)
+            return None
+
+        upload_result = await audio_upload_service.store_file(str(session.recording_path), user.id, "wav")
+        db = SessionLocal()
+        try:
+            db_audio, _ = audio_upload_service.register_upload(
+                upload_result, user.id, f"live_{session.started_at.strftime('%Y%m%d_%H%M%S')}.wav", "audio/wav", db
+            )
+            await audio_upload_service.record_audio_properties(db_audio, db)
+
+            if not recognized:
+                db_job, reuse = transcription_service.create_job_for_audio(db_audio, db, TranscriptionPriority.LIVE)
+                if reuse is None:
+                    from background_tasks import task_manager
+                    task_manager.notify_transcription_job()
+                logger.info(f"Live session for user {user.id} ended early; queued job {db_job.id}")
+                return {"transcription_job_id": db_job.id, "audio_file_id": db_audio.id, "transcript": None, "confidence": None}
+
+            recognition = session.transcript()
+            now = datetime.utcnow()
+            db_job = TranscriptionJob(
+                audio_file_id=db_audio.id,
+                priority=TranscriptionPriority.LIVE.value,
+                tenant_id=tenant_for_user(user),
+                started_at=session.started_at,
+                completed_at=now
+            )
+            if recognition["transcript"]:
+                db_job.status = TranscriptionStatus.COMPLETED
+                db_job.transcript = recognition["transcript"]
+                db_job.confidence_score = recognition["confidence"]
+            else:
+                db_job.status = TranscriptionStatus.FAILED
+                db_job.error_message = "No speech detected in audio file"
+            db.add(db_job)
+            db.commit()
+            db.refresh(db_job)
+            transcription_service.publish_job_update(db_job)
+
+            logger.info(f"Live session for user {user.id} stored as job {db_job.id} ({session.duration:.1f}s audio)")
+            return {
+                "transcription_job_id": db_job.id,
+                "audio_file_id": db_audio.id,
+                "transcript": db_job.transcript,
+                "confidence": db_job.confidence_score
+            }
+        finally:
+            db.close()
+
+# Global instance
+live_transcription_service = LiveTranscriptionService()
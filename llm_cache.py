@@ -0,0 +1,303 @@
+"""
+LLM response cache for Pawscribed
+Gemini responses are cached under a hash of (model, generation config,
+prompt). Prompts are built from sanitized clinical data, so identical
+clinical input maps to the same entry. Two tiers:
+  memory     - per-process LRU with a short TTL
+  persistent - the llm_cache_entries table, shared by all processes
+Entries can be tagged with a scope ("visit:12", "note:7", "transcription:3");
+edits to the Visit or SOAPSection rows behind a scope invalidate its entries
+(sections created with a generated note don't count as edits).
+Other processes drop their memory copies when the memory TTL runs out.
+get and set are awaited from the event loop; the persistent tier runs on a
+worker thread, and hit counts are written in batches rather than per hit.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Iterable
+
+from sqlalchemy import event, select, delete, update, func, inspect as sa_inspect
+
+from database import SessionLocal
+from models import LLMCacheEntry, Visit, SOAPSection, Note
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1000"))
+LLM_CACHE_MEMORY_TTL_SECONDS = int(os.getenv("LLM_CACHE_MEMORY_TTL_SECONDS", "900"))
+
+# Expired persistent rows are purged once every this many stores
+PURGE_EVERY_STORES = 200
+# Hit counts of persistent entries are written once this many keys have hits
+HIT_FLUSH_KEYS = 50
+
+# Visit columns that feed prompts
+VISIT_PROMPT_FIELDS = ("chief_complaint", "subjective", "objective", "assessment", "plan", "original_notes")
+
+
+class CachedResponse:
+    """Stands in for a model response on a cache hit; callers only read .text"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LLMResponseCache:
+    def __init__(
+        self,
+        enabled: bool = LLM_CACHE_ENABLED,
+        persist: bool = LLM_CACHE_PERSIST,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        memory_ttl_seconds: int = LLM_CACHE_MEMORY_TTL_SECONDS
+    ):
+        self.enabled = enabled
+        self.persist = persist
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.memory_ttl_seconds = min(memory_ttl_seconds, ttl_seconds)
+
+        self._lock = threading.Lock()
+        # key -> (response text, scope, expires at as epoch seconds)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> (hits not yet written, last hit at)
+        self._pending_hits: Dict[str, tuple] = {}
+        self.counts = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "invalidated": 0,
+            "errors": 0
+        }
+
+    @staticmethod
+    def key_for(model_name: str, generation_config: Optional[Dict[str, Any]], prompt: str) -> str:
+        payload = json.dumps({"model": model_name, "config": generation_config or {}, "prompt": prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += amount
+
+    def _remember(self, key: str, text: str, scope: Optional[str]) -> None:
+        with self._lock:
+            self._memory[key] = (text, scope, time.time() + self.memory_ttl_seconds)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        """The cached response text, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and cached[2] > time.time():
+                self._memory.move_to_end(key)
+                self.counts["memory_hits"] += 1
+                return cached[0]
+            if cached:
+                del self._memory[key]
+
+        if self.persist:
+            text = await asyncio.to_thread(self._load, key)
+            if text is not None:
+                return text
+
+        self._count("misses")
+        return None
+
+    def _load(self, key: str) -> Optional[str]:
+        """Persistent lookup; runs on a worker thread"""
+        db = SessionLocal()
+        try:
+            entry = db.get(LLMCacheEntry, key)
+            if entry and entry.expires_at and entry.expires_at > datetime.utcnow():
+                self._remember(key, entry.response_text, entry.scope)
+                self._count("persistent_hits")
+                if self._note_hit(key) >= HIT_FLUSH_KEYS:
+                    self._flush_hits(db)
+                return entry.response_text
+            if entry:
+                db.delete(entry)
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            logger.warning(f"LLM cache lookup failed: {str(e)}")
+        finally:
+            db.close()
+        return None
+
+    def _note_hit(self, key: str) -> int:
+        """Queue a hit for the next batch write; returns the number of keys queued"""
+        with self._lock:
+            hits, _ = self._pending_hits.get(key, (0, None))
+            self._pending_hits[key] = (hits + 1, datetime.utcnow())
+            return len(self._pending_hits)
+
+    def _flush_hits(self, db) -> None:
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, {}
+        if not pending:
+            return
+        try:
+            for key, (hits, last_hit_at) in pending.items():
+                db.execute(
+                    update(LLMCacheEntry).where(LLMCacheEntry.key == key).values(
+                        hit_count=func.coalesce(LLMCacheEntry.hit_count, 0) + hits,
+                        last_hit_at=last_hit_at
+                    )
+                )
+            db.commit()
+        except Exception as e:
+            # Hit counts are statistics; drop the batch rather than fail the lookup
+            db.rollback()
+            self._count("errors")
+            logger.warning(f"LLM cache hit count update failed: {str(e)}")
+
+    async def set(self, key: str, model_name: str, text: str, scope: Optional[str] = None) -> None:
+        if not self.enabled or not text:
+            return
+
+        self._remember(key, text, scope)
+        self._count("stores")
+        if self.persist:
+            await asyncio.to_thread(self._store, key, model_name, text, scope)
+
+    def _store(self, key: str, model_name: str, text: str, scope: Optional[str]) -> None:
+        """Persistent write, along with queued hit counts; runs on a worker thread"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            entry = db.get(LLMCacheEntry, key) or LLMCacheEntry(key=key, hit_count=0)
+            entry.model_name = model_name
+            entry.scope = scope
+            entry.response_text = text
+            entry.created_at = now
+            entry.expires_at = now + timedelta(seconds=self.ttl_seconds)
+            db.add(entry)
+            db.commit()
+            self._flush_hits(db)
+            if self.counts["stores"] % PURGE_EVERY_STORES == 0:
+                self.purge_expired(db)
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            logger.warning(f"LLM cache store failed: {str(e)}")
+        finally:
+            db.close()
+
+    def purge_expired(self, db) -> int:
+        result = db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= datetime.utcnow()))
+        db.commit()
+        if result.rowcount:
+            logger.info(f"Purged {result.rowcount} expired LLM cache entries")
+        return result.rowcount or 0
+
+    def _forget_scopes(self, scopes: Iterable[str]) -> int:
+        scopes = set(scopes)
+        with self._lock:
+            stale = [key for key, (_, scope, _) in self._memory.items() if scope in scopes]
+            for key in stale:
+                del self._memory[key]
+            return len(stale)
+
+    def invalidate_scopes(self, scopes: Iterable[str], connection=None) -> None:
+        """
+        Drop every entry tagged with one of the scopes. Pass the connection
+        when called from inside a flush so the delete joins that transaction;
+        without one it opens a session, so from the event loop use invalidate.
+        """
+        scopes = [scope for scope in set(scopes) if scope]
+        if not scopes or not self.enabled:
+            return
+
+        removed = self._forget_scopes(scopes)
+        if self.persist:
+            statement = delete(LLMCacheEntry).where(LLMCacheEntry.scope.in_(scopes))
+            if connection is not None:
+                removed += connection.execute(statement).rowcount or 0
+            else:
+                db = SessionLocal()
+                try:
+                    removed += db.execute(statement).rowcount or 0
+                    db.commit()
+                finally:
+                    db.close()
+
+        if removed:
+            self._count("invalidated", removed)
+            logger.debug(f"Invalidated {removed} LLM cache entries for {', '.join(scopes)}")
+
+    async def invalidate(self, scopes: Iterable[str]) -> None:
+        await asyncio.to_thread(self.invalidate_scopes, list(scopes))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+            memory_size = len(self._memory)
+        lookups = counts["memory_hits"] + counts["persistent_hits"] + counts["misses"]
+        hits = counts["memory_hits"] + counts["persistent_hits"]
+        return {
+            "enabled": self.enabled,
+            "persistent": self.persist,
+            "memory_entries": memory_size,
+            "memory_capacity": self.memory_entries,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **counts
+        }
+
+# Global instance
+llm_cache = LLMResponseCache()
+
+
+# Invalidate cached responses whose source content changed
+
+def _visit_changed(mapper, connection, target):
+    state = sa_inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in VISIT_PROMPT_FIELDS):
+        llm_cache.invalidate_scopes([f"visit:{target.id}"], connection)
+
+def _visit_deleted(mapper, connection, target):
+    llm_cache.invalidate_scopes([f"visit:{target.id}"], connection)
+
+def _invalidate_note_scopes(connection, note_id):
+    scopes = [f"note:{note_id}"]
+    note = connection.execute(
+        select(Note.visit_id, Note.transcription_job_id).where(Note.id == note_id)
+    ).first()
+    if note:
+        if note.visit_id:
+            scopes.append(f"visit:{note.visit_id}")
+        if note.transcription_job_id:
+            scopes.append(f"transcription:{note.transcription_job_id}")
+    llm_cache.invalidate_scopes(scopes, connection)
+
+def _soap_section_updated(mapper, connection, target):
+    if target.note_id is not None and sa_inspect(target).attrs.content.history.has_changes():
+        _invalidate_note_scopes(connection, target.note_id)
+
+def _soap_section_deleted(mapper, connection, target):
+    if target.note_id is not None:
+        _invalidate_note_scopes(connection, target.note_id)
+
+event.listen(Visit, "after_update", _visit_changed)
+event.listen(Visit, "after_delete", _visit_deleted)
+event.listen(SOAPSection, "after_update", _soap_section_updated)
+event.listen(SOAPSection, "after_delete", _soap_section_deleted)
@@ -0,0 +1,271 @@
+"""
+Shared LLM client for Pawscribed
+One per process: initializes Vertex AI once, keeps a warm GenerativeModel per
+(model name, generation config) so its underlying client and channel are
+reused, and runs generation without blocking the event loop, using the SDK's
+async API when available and a bounded thread pool otherwise.
+A call can name a static leading part of its prompt (a compiled template
+prefix); prefixes long enough for the provider are put in a Vertex AI context
+cache once per model and config, and only the rest of the prompt is sent.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Set, Tuple, AsyncIterator
+
+from long_transcript import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# "auto" uses generate_content_async when the SDK has it; "thread" always uses the pool
+LLM_ASYNC_MODE = os.getenv("LLM_ASYNC_MODE", "auto").lower()
+# Blocking generate_content calls allowed at once when running on the thread pool
+LLM_MAX_THREADS = int(os.getenv("LLM_MAX_THREADS", "16"))
+# "auto" caches long prompt prefixes provider-side; "off" always sends prompts whole
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "auto").lower()
+# The provider's minimum for an explicit cache; shorter prefixes are still reused implicitly
+LLM_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS", "2048"))
+LLM_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("LLM_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# A context cache is replaced this long before it expires, so no call races its expiry
+CONTEXT_CACHE_REFRESH_SECONDS = 60
+
+
+def _generative_models():
+    """The generative_models module (GA in newer SDKs, preview in older ones)"""
+    try:
+        from vertexai import generative_models
+        if hasattr(generative_models, "GenerativeModel"):
+            return generative_models
+    except ImportError:
+        pass
+    from vertexai.preview import generative_models
+    return generative_models
+
+
+def _chunk_text(chunk) -> str:
+    """Text of one streamed chunk; chunks without text (e.g. the final usage chunk) give ''"""
+    try:
+        return chunk.text
+    except (ValueError, AttributeError, IndexError):
+        return ""
+
+
+def _trace_chunk(trace: Optional[Dict[str, Any]], chunk) -> None:
+    """Keep the usage and finish reason a stream reports, usually on its last chunk"""
+    if trace is None:
+        return
+    usage = getattr(chunk, "usage_metadata", None)
+    if usage is not None and getattr(usage, "total_token_count", None):
+        trace["usage_metadata"] = usage
+    try:
+        finish_reason = chunk.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return
+    if finish_reason:
+        trace["finish_reason"] = getattr(finish_reason, "name", str(finish_reason))
+
+
+class LLMClientRegistry:
+    def __init__(self, project_id: Optional[str] = None, location: Optional[str] = None):
+        self.project_id = project_id or os.getenv("GOOGLE_CLOUD_PROJECT")
+        self.location = location or os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
+        self._initialized = False
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # (model name, config, prefix key) -> (model bound to the cached prefix, replace at)
+        self._context_caches: Dict[Tuple[str, str, str], Tuple[Any, float]] = {}
+        self._uncacheable: Set[Tuple[str, str, str]] = set()
+        self._context_cache_lock = asyncio.Lock()
+        self.calls = {"async": 0, "thread": 0, "context_cached": 0}
+
+    def _ensure_initialized(self) -> None:
+        if self._initialized:
+            return
+        with self._lock:
+            if not self._initialized:
+                import vertexai
+                vertexai.init(project=self.project_id, location=self.location)
+                self._initialized = True
+                logger.info(f"Vertex AI initialized for project {self.project_id} in {self.location}")
+
+    @staticmethod
+    def _config_key(generation_config: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(generation_config or {}, sort_keys=True)
+
+    def model(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None):
+        """The warm model handle for this name and generation config, created on first use"""
+        key = (model_name, self._config_key(generation_config))
+        model = self._models.get(key)
+        if model is None:
+            self._ensure_initialized()
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = _generative_models().GenerativeModel(model_name, generation_config=generation_config)
+                    self._models[key] = model
+                    logger.debug(f"Created model handle for {model_name} ({len(self._models)} cached)")
+        return model
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=LLM_MAX_THREADS, thread_name_prefix="llm")
+        return self._executor
+
+    def _create_context_cache(self, model_name: str, generation_config: Optional[Dict[str, Any]], prefix_text: str):
+        """Blocking: cache the prefix with the provider and return a model handle that uses it"""
+        self._ensure_initialized()
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import GenerativeModel
+        cached_content = caching.CachedContent.create(
+            model_name=model_name,
+            contents=[prefix_text],
+            ttl=timedelta(seconds=LLM_CONTEXT_CACHE_TTL_SECONDS)
+        )
+        return GenerativeModel.from_cached_content(cached_content=cached_content, generation_config=generation_config)
+
+    async def _context_cached_model(self, model_name: str, generation_config: Optional[Dict[str, Any]], prefix_key: str, prefix_text: str):
+        """A model handle with the prefix cached provider-side, or None to send the prompt whole"""
+        if LLM_CONTEXT_CACHE == "off" or estimate_tokens(prefix_text) < LLM_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        key = (model_name, self._config_key(generation_config), prefix_key)
+        if key in self._uncacheable:
+            return None
+        cached = self._context_caches.get(key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        async with self._context_cache_lock:
+            cached = self._context_caches.get(key)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+            loop = asyncio.get_running_loop()
+            try:
+                model = await loop.run_in_executor(self.executor, self._create_context_cache, model_name, generation_config, prefix_text)
+            except Exception as e:
+                # Older SDK, unsupported model or prefix refused: don't try this prefix again
+                self._uncacheable.add(key)
+                logger.info(f"Not caching prompt prefix {prefix_key} for {model_name}: {str(e)}")
+                return None
+            replace_at = time.monotonic() + LLM_CONTEXT_CACHE_TTL_SECONDS - CONTEXT_CACHE_REFRESH_SECONDS
+            self._context_caches[key] = (model, replace_at)
+            logger.info(f"Cached prompt prefix {prefix_key} for {model_name} (~{estimate_tokens(prefix_text)} tokens)")
+            return model
+
+    async def _model_for(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]],
+        prefix: Optional[Tuple[str, str]]
+    ) -> Tuple[Any, str]:
+        """(model handle, prompt to send): the context-cached handle and the prompt after the prefix when possible"""
+        if prefix and prompt.startswith(prefix[1]):
+            model = await self._context_cached_model(model_name, generation_config, prefix[0], prefix[1])
+            if model is not None:
+                self.calls["context_cached"] += 1
+                return model, prompt[len(prefix[1]):]
+        return self.model(model_name, generation_config), prompt
+
+    async def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Tuple[str, str]] = None
+    ):
+        """
+        Generate a response without blocking the event loop. prefix is the
+        (cache key, text) of a static leading part of the prompt.
+        """
+        model, prompt = await self._model_for(model_name, prompt, generation_config, prefix)
+        if LLM_ASYNC_MODE != "thread" and hasattr(model, "generate_content_async"):
+            self.calls["async"] += 1
+            return await model.generate_content_async(prompt)
+
+        self.calls["thread"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, model.generate_content, prompt)
+
+    async def stream(
+        self,
+        model_name: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        trace: Optional[Dict[str, Any]] = None,
+        prefix: Optional[Tuple[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """Yield response text as the model produces it; trace, if given, receives usage and finish reason"""
+        model, prompt = await self._model_for(model_name, prompt, generation_config, prefix)
+        if LLM_ASYNC_MODE != "thread" and hasattr(model, "generate_content_async"):
+            self.calls["async"] += 1
+            responses = await model.generate_content_async(prompt, stream=True)
+            async for chunk in responses:
+                _trace_chunk(trace, chunk)
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+            return
+
+        # Drain the blocking stream on the pool and hand chunks over through a queue
+        self.calls["thread"] += 1
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for chunk in model.generate_content(prompt, stream=True):
+                    _trace_chunk(trace, chunk)
+                    loop.call_soon_threadsafe(queue.put_nowait, _chunk_text(chunk))
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        pumping = loop.run_in_executor(self.executor, pump)
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+        await pumping
+
+    def warm_up(self, handles) -> None:
+        """Create model handles ahead of the first request; handles are (model_name, generation_config)"""
+        try:
+            for model_name, generation_config in handles:
+                self.model(model_name, generation_config)
+        except Exception as e:
+            logger.warning(f"Could not warm up LLM model handles: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "initialized": self._initialized,
+            "model_handles": [{"model": name, "generation_config": json.loads(config)} for name, config in self._models],
+            "calls": dict(self.calls),
+            "context_caches": len(self._context_caches),
+            "context_cache_mode": LLM_CONTEXT_CACHE,
+            "async_mode": LLM_ASYNC_MODE,
+            "max_threads": LLM_MAX_THREADS
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+# Global instance
+llm_registry = LLMClientRegistry()
@@ -0,0 +1,377 @@
+"""
+Process-wide admission control for LLM calls
+Every Gemini call GeminiService makes waits here before it is sent:
+  - at most LLM_MAX_IN_FLIGHT calls run at once, across all models
+  - each model has token buckets for requests and tokens per minute, sized
+    to the provider quota (LLM_RPM / LLM_TPM, overridable per model)
+  - waiting calls are admitted first come, first served per model, so a
+    throttled model doesn't hold up calls to the others, and give up with
+    LLMQueueTimeout after LLM_QUEUE_TIMEOUT_SECONDS
+  - a 429 from the provider pauses the model with exponential backoff and
+    halves its admission rate, which recovers step by step as calls succeed;
+    the throttled call is queued again up to LLM_MAX_RETRIES times
+A burst of requests therefore queues and drains at the rate the provider
+accepts instead of failing together. Queue waits are recorded per model, and
+a caller can pass a trace dict to learn its own call's wait and retries.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Deque
+
+from long_transcript import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+# Default per-model quota; LLM_MODEL_LIMITS overrides it per model, e.g.
+# {"gemini-2.5-flash": {"rpm": 600, "tpm": 2000000}}
+LLM_RPM = float(os.getenv("LLM_RPM", "300"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_MODEL_LIMITS = json.loads(os.getenv("LLM_MODEL_LIMITS") or "{}")
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+
+# Output tokens reserved for a call whose config doesn't cap them
+DEFAULT_OUTPUT_TOKENS = 1024
+# Admission rate after repeated 429s never drops below this share of the quota,
+# and each successful call restores this share of it
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+# Buckets hold this many seconds of quota, the largest burst admitted at once
+BURST_SECONDS = 10
+# Queue waits kept per model for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+
+class LLMQueueTimeout(RuntimeError):
+    """Raised when a call waited longer than its deadline for admission"""
+
+    def __init__(self, model_name: str, waited_seconds: float):
+        super().__init__(f"{model_name} is busy: no capacity after waiting {waited_seconds:.1f}s, try again shortly")
+        self.model_name = model_name
+        self.waited_seconds = waited_seconds
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether the provider refused a call for quota (HTTP 429 / RESOURCE_EXHAUSTED)"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 429
+    text = str(error).lower()
+    return "429" in text or "resource exhausted" in text or "resource_exhausted" in text
+
+
+def estimate_call_tokens(prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> int:
+    """Tokens to reserve for a call: the prompt plus the most the model may write"""
+    output_tokens = (generation_config or {}).get("max_output_tokens") or DEFAULT_OUTPUT_TOKENS
+    return estimate_tokens(prompt) + int(output_tokens)
+
+
+class RateBucket:
+    """Refills at per_minute (scaled by the model's rate factor) up to BURST_SECONDS worth"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute * BURST_SECONDS / 60.0)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, factor: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * factor)
+        self.updated = now
+
+    def seconds_until(self, amount: float, factor: float) -> float:
+        missing = amount - self.level
+        return 0.0 if missing <= 0 else missing / (self.rate * factor)
+
+
+class ModelLimiter:
+    def __init__(self, model_name: str, rpm: float, tpm: float):
+        self.model_name = model_name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = RateBucket(rpm)
+        self.tokens = RateBucket(tpm)
+        self.rate_factor = 1.0
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.last_throttled_at = 0.0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.counters = {"admitted": 0, "timed_out": 0, "throttled": 0, "retried": 0}
+
+    def clamp(self, tokens: int) -> int:
+        """A call larger than the whole bucket would never be admitted; charge it a full bucket"""
+        return min(tokens, int(self.tokens.capacity))
+
+    def seconds_until_admissible(self, tokens: int, now: float) -> float:
+        self.requests.refill(now, self.rate_factor)
+        self.tokens.refill(now, self.rate_factor)
+        return max(
+            0.0,
+            self.cooldown_until - now,
+            self.requests.seconds_until(1, self.rate_factor),
+            self.tokens.seconds_until(tokens, self.rate_factor)
+        )
+
+    def take(self, tokens: int) -> None:
+        self.requests.level -= 1
+        self.tokens.level -= tokens
+
+    def refund(self, tokens: int) -> None:
+        self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+
+    def throttled(self, admitted_at: float, now: float, base_seconds: float, max_seconds: float) -> float:
+        """Back off after a 429; returns the pause before the model is called again"""
+        self.counters["throttled"] += 1
+        # Calls sent before the last 429 are the same overload, not a new one
+        if admitted_at >= self.last_throttled_at:
+            self.consecutive_throttles += 1
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor / 2)
+            self.last_throttled_at = now
+            # Spend the saved-up burst so calls resume at the reduced rate
+            self.requests.level = min(self.requests.level, 0.0)
+            self.tokens.level = min(self.tokens.level, 0.0)
+        ceiling = min(max_seconds, base_seconds * (2 ** (self.consecutive_throttles - 1)))
+        # Equal jitter: always pause at least half the ceiling so the quota can recover
+        pause = random.uniform(ceiling / 2, ceiling)
+        self.cooldown_until = max(self.cooldown_until, now + pause)
+        return pause
+
+    def succeeded(self) -> None:
+        self.consecutive_throttles = 0
+        self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY_STEP)
+
+
+class _Waiter:
+    __slots__ = ("model_name", "tokens", "future", "enqueued_at")
+
+    def __init__(self, model_name: str, tokens: int, future: asyncio.Future):
+        self.model_name = model_name
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class LLMGovernor:
+    def __init__(
+        self,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base_seconds: float = LLM_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds: float = LLM_BACKOFF_MAX_SECONDS,
+        model_limits: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.model_limits = LLM_MODEL_LIMITS if model_limits is None else model_limits
+        self.in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def limiter(self, model_name: str) -> ModelLimiter:
+        limiter = self._limiters.get(model_name)
+        if limiter is None:
+            limits = self.model_limits.get(model_name, {})
+            limiter = ModelLimiter(model_name, float(limits.get("rpm", LLM_RPM)), float(limits.get("tpm", LLM_TPM)))
+            self._limiters[model_name] = limiter
+        return limiter
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls in order while there are free slots and their model has quota"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        blocked: Dict[str, float] = {}  # model -> seconds until its first waiter fits
+        remaining: Deque[_Waiter] = deque()
+        while self._waiters:
+            if self.in_flight >= self.max_in_flight:
+                remaining.extend(self._waiters)
+                break
+            waiter = self._waiters.popleft()
+            if waiter.future.done():
+                continue
+            if waiter.model_name in blocked:
+                remaining.append(waiter)
+                continue
+            limiter = self._limiters[waiter.model_name]
+            delay = limiter.seconds_until_admissible(waiter.tokens, now)
+            if delay > 0:
+                blocked[waiter.model_name] = delay
+                remaining.append(waiter)
+                continue
+            limiter.take(waiter.tokens)
+            self.in_flight += 1
+            waiter.future.set_result(now)
+        self._waiters = remaining
+
+        if blocked and self.in_flight < self.max_in_flight:
+            self._timer = asyncio.get_running_loop().call_later(min(blocked.values()), self._dispatch)
+
+    async def acquire(self, model_name: str, tokens: int) -> float:
+        """Wait for admission; returns when (monotonic) the call was admitted. Pair with release()."""
+        limiter = self.limiter(model_name)
+        waiter = _Waiter(model_name, limiter.clamp(tokens), asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait({waiter.future}, timeout=self.queue_timeout)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        if not done:
+            waited = time.monotonic() - waiter.enqueued_at
+            self._abandon(waiter)
+            limiter.counters["timed_out"] += 1
+            logger.warning(f"LLM call to {model_name} gave up after {waited:.1f}s in queue ({len(self._waiters)} waiting)")
+            raise LLMQueueTimeout(model_name, waited)
+
+        admitted_at = waiter.future.result()
+        waited = admitted_at - waiter.enqueued_at
+        limiter.waits.append(waited)
+        limiter.counters["admitted"] += 1
+        if waited > 1:
+            logger.info(f"LLM call to {model_name} admitted after {waited:.1f}s in queue")
+        return admitted_at
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if waiter.future.done() and not waiter.future.cancelled():
+            # Admitted just as the caller gave up
+            self.release()
+            return
+        waiter.future.cancel()
+        self._dispatch()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _retry_after_throttle(self, limiter: ModelLimiter, error: Exception, attempt: int, admitted_at: float) -> bool:
+        """Record a 429 and say whether the call should queue again"""
+        pause = limiter.throttled(admitted_at, time.monotonic(), self.backoff_base_seconds, self.backoff_max_seconds)
+        retry = attempt <= self.max_retries and pause < self.queue_timeout
+        logger.warning(
+            f"{limiter.model_name} rate limited (attempt {attempt}); pausing {pause:.1f}s at "
+            f"{limiter.rate_factor:.0%} of quota{', retrying' if retry else ''}: {str(error)}"
+        )
+        if retry:
+            limiter.counters["retried"] += 1
+        return retry
+
+    @staticmethod
+    def _trace_admission(trace: Optional[Dict[str, Any]], attempt: int, enqueued_at: float, admitted_at: float) -> None:
+        if trace is not None:
+            trace["queue_wait_seconds"] = trace.get("queue_wait_seconds", 0.0) + max(0.0, admitted_at - enqueued_at)
+            trace["retries"] = attempt - 1
+
+    async def call(self, model_name: str, tokens: int, send: Callable[[], Awaitable[Any]], trace: Optional[Dict[str, Any]] = None):
+        """
+        Run send() once admitted, queueing again after a 429. trace, if given,
+        receives the total queue wait and the number of retries.
+        """
+        limiter = self.limiter(model_name)
+        attempt = 0
+        while True:
+            attempt += 1
+            enqueued_at = time.monotonic()
+            admitted_at = await self.acquire(model_name, tokens)
+            self._trace_admission(trace, attempt, enqueued_at, admitted_at)
+            try:
+                response = await send()
+            except Exception as e:
+                if is_rate_limited(e) and self._retry_after_throttle(limiter, e, attempt, admitted_at):
+                    continue
+                raise
+            finally:
+                self.release()
+
+            limiter.succeeded()
+            # The reservation assumed the longest answer; give back what wasn't used
+            used = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+            if isinstance(used, int) and used < tokens:
+                limiter.refund(tokens - used)
+            return response
+
+    async def stream(
+        self,
+        model_name: str,
+        tokens: int,
+        open_stream: Callable[[], AsyncIterator[str]],
+        trace: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield from open_stream() once admitted, holding the slot until the
+        stream ends. A 429 before the first chunk queues again; after it the
+        error is raised, since part of the answer has been delivered.
+        """
+        limiter = self.limiter(model_name)
+        attempt = 0
+        while True:
+            attempt += 1
+            enqueued_at = time.monotonic()
+            admitted_at = await self.acquire(model_name, tokens)
+            self._trace_admission(trace, attempt, enqueued_at, admitted_at)
+            started = False
+            try:
+                async for chunk in open_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if not started and is_rate_limited(e) and self._retry_after_throttle(limiter, e, attempt, admitted_at):
+                    continue
+                raise
+            finally:
+                self.release()
+            limiter.succeeded()
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        queued: Dict[str, int] = {}
+        for waiter in self._waiters:
+            if not waiter.future.done():
+                queued[waiter.model_name] = queued.get(waiter.model_name, 0) + 1
+        models = {}
+        for name, limiter in self._limiters.items():
+            limiter.seconds_until_admissible(0, now)
+            waits = sorted(limiter.waits)
+            models[name] = {
+                "rpm": limiter.rpm,
+                "tpm": limiter.tpm,
+                "rate_factor": round(limiter.rate_factor, 3),
+                "cooldown_seconds": round(max(0.0, limiter.cooldown_until - now), 1),
+                "requests_available": int(limiter.requests.level),
+                "tokens_available": int(limiter.tokens.level),
+                "queued": queued.get(name, 0),
+                "queue_wait_seconds": {
+                    "count": len(waits),
+                    "avg": round(sum(waits) / len(waits), 3),
+                    "p50": round(waits[int(0.50 * (len(waits) - 1))], 3),
+                    "p95": round(waits[int(0.95 * (len(waits) - 1))], 3),
+                    "max": round(waits[-1], 3)
+                } if waits else {"count": 0},
+                **limiter.counters
+            }
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queued": sum(queued.values()),
+            "queue_timeout_seconds": self.queue_timeout,
+            "models": models
+        }
+
+# Global instance
+llm_governor = LLMGovernor()
@@ -0,0 +1,370 @@
+"""
+LLM call instrumentation for Pawscribed
+Every Gemini call GeminiService makes is recorded with its model, prompt and
+output token counts, wall time, queue wait, retries, finish reason and the
+endpoint (and team) it was made for. Two views of the data:
+  prometheus - counters and histograms per endpoint and model, served as
+               text exposition format by GET /metrics
+  rollups    - per-team daily totals in llm_usage_daily, buffered in memory
+               and flushed every LLM_USAGE_FLUSH_SECONDS, queried through
+               GET /analytics/llm-usage
+Teams are left out of the Prometheus labels to keep series counts bounded.
+The calling endpoint and team are tagged on the request context (see
+tag_llm_caller); calls made outside a request are counted as "background".
+Costs are estimates from per-model prices in USD per million tokens.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import LLMUsageDaily
+from llm_governor import LLMQueueTimeout, is_rate_limited
+from long_transcript import estimate_tokens
+from transcription_scheduler import tenant_for_user, UNASSIGNED_TENANT
+
+logger = logging.getLogger(__name__)
+
+LLM_USAGE_FLUSH_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_SECONDS", "60"))
+# USD per million tokens, e.g. {"gemini-2.5-flash": {"input": 0.30, "cached_input": 0.075, "output": 2.50}};
+# a model without an entry is priced as the longest listed name it starts with
+LLM_PRICING = json.loads(os.getenv("LLM_PRICING") or "{}")
+
+DEFAULT_PRICING = {
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.075, "output": 2.50},
+    "gemini-2.5-pro": {"input": 1.25, "cached_input": 0.31, "output": 10.00},
+}
+
+BACKGROUND_ENDPOINT = "background"
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30)
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+
+# Daily rollup columns added up on each flush
+ROLLUP_FIELDS = (
+    "calls", "errors", "cached_calls", "retries", "prompt_tokens", "cached_prompt_tokens", "output_tokens",
+    "cost_usd", "latency_seconds", "queue_wait_seconds"
+)
+
+_caller: ContextVar[Dict[str, str]] = ContextVar("llm_caller", default={})
+
+
+def tag_llm_caller(endpoint: Optional[str] = None, user=None) -> None:
+    """
+    Attribute LLM calls made from here on in this request (and tasks it
+    starts) to an endpoint and the user's team
+    """
+    caller = dict(_caller.get())
+    if endpoint:
+        caller["endpoint"] = endpoint
+    if user is not None:
+        caller["team_id"] = tenant_for_user(user)
+    _caller.set(caller)
+
+
+def current_caller() -> Tuple[str, str]:
+    """(endpoint, team) the current LLM call is made for"""
+    caller = _caller.get()
+    return caller.get("endpoint", BACKGROUND_ENDPOINT), caller.get("team_id", UNASSIGNED_TENANT)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Counter:
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class _Histogram:
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> (count per bucket, sum, count)
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        series = self.values.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (bucket_counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                bucket_labels = _labels(self.label_names, labels, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            bucket_labels = _labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+def _usage_counts(usage) -> Tuple[Optional[int], Optional[int], int]:
+    """(prompt, output, of the prompt served from the provider's context cache) tokens"""
+    if usage is None:
+        return None, None, 0
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    cached_tokens = getattr(usage, "cached_content_token_count", None)
+    return (
+        prompt_tokens if isinstance(prompt_tokens, int) else None,
+        output_tokens if isinstance(output_tokens, int) else None,
+        cached_tokens if isinstance(cached_tokens, int) else 0
+    )
+
+
+def _finish_reason(response) -> Optional[str]:
+    try:
+        finish_reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return None
+    return getattr(finish_reason, "name", str(finish_reason)) if finish_reason else None
+
+
+def _error_status(error: Exception) -> str:
+    if isinstance(error, LLMQueueTimeout):
+        return "queue_timeout"
+    if is_rate_limited(error):
+        return "rate_limited"
+    return "error"
+
+
+class LLMMetrics:
+    def __init__(self, flush_seconds: float = LLM_USAGE_FLUSH_SECONDS, pricing: Optional[Dict[str, Dict[str, float]]] = None):
+        self.flush_seconds = flush_seconds
+        self.pricing = {**DEFAULT_PRICING, **(LLM_PRICING if pricing is None else pricing)}
+        self._lock = threading.Lock()
+        # (day, team, endpoint, model) -> ROLLUP_FIELDS totals not yet written
+        self._pending: Dict[Tuple[Any, str, str, str], Dict[str, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+        labels = ("endpoint", "model")
+        self.calls = _Counter("pawscribed_llm_calls_total", "LLM calls by outcome and finish reason", labels + ("status", "finish_reason"))
+        self.tokens = _Counter("pawscribed_llm_tokens_total", "Tokens sent to and generated by the model", labels + ("direction",))
+        self.cost = _Counter("pawscribed_llm_cost_usd_total", "Estimated LLM spend in USD", labels)
+        self.retries = _Counter("pawscribed_llm_retries_total", "Calls queued again after a 429", labels)
+        self.duration = _Histogram("pawscribed_llm_call_duration_seconds", "Wall time of LLM calls, queueing included", labels, DURATION_BUCKETS)
+        self.queue_wait = _Histogram("pawscribed_llm_queue_wait_seconds", "Time LLM calls waited for admission", labels, QUEUE_WAIT_BUCKETS)
+        self.prompt_tokens = _Histogram("pawscribed_llm_prompt_tokens", "Prompt tokens per LLM call", labels, TOKEN_BUCKETS)
+        self.output_tokens = _Histogram("pawscribed_llm_output_tokens", "Output tokens per LLM call", labels, TOKEN_BUCKETS)
+
+    def price(self, model_name: str) -> Dict[str, float]:
+        if model_name in self.pricing:
+            return self.pricing[model_name]
+        prefixes = [name for name in self.pricing if model_name.startswith(name)]
+        return self.pricing[max(prefixes, key=len)] if prefixes else {"input": 0.0, "output": 0.0}
+
+    def cost_of(self, model_name: str, prompt_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+        price = self.price(model_name)
+        input_price = price.get("input", 0.0)
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        return (
+            (prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * price.get("cached_input", input_price)
+            + output_tokens * price.get("output", 0.0)
+        ) / 1_000_000
+
+    def _roll_up(self, team_id: str, endpoint: str, model_name: str, **amounts: float) -> None:
+        key = (datetime.utcnow().date(), team_id, endpoint, model_name)
+        totals = self._pending.setdefault(key, dict.fromkeys(ROLLUP_FIELDS, 0))
+        for field, amount in amounts.items():
+            totals[field] += amount
+
+    def record_call(
+        self,
+        model_name: str,
+        prompt: str,
+        output_text: Optional[str],
+        seconds: float,
+        trace: Optional[Dict[str, Any]] = None,
+        response=None,
+        error: Optional[Exception] = None
+    ) -> None:
+        """
+        Record one call to the model. Token counts come from the response's
+        usage metadata (or the stream's, via trace) and are estimated from the
+        text when the provider didn't report them; a call that failed without
+        usage is counted with no tokens, as it isn't billed.
+        """
+        trace = trace or {}
+        endpoint, team_id = current_caller()
+        usage = getattr(response, "usage_metadata", None) or trace.get("usage_metadata")
+        prompt_tokens, output_tokens, cached_tokens = _usage_counts(usage)
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt) if error is None or output_text else 0
+        if output_tokens is None:
+            output_tokens = estimate_tokens(output_text) if output_text else 0
+        finish_reason = _finish_reason(response) or trace.get("finish_reason") or "none"
+        status = _error_status(error) if error is not None else "ok"
+        queue_wait = float(trace.get("queue_wait_seconds", 0.0))
+        retries = int(trace.get("retries", 0))
+        cost = self.cost_of(model_name, prompt_tokens, output_tokens, cached_tokens)
+
+        labels = (endpoint, model_name)
+        with self._lock:
+            self.calls.inc(labels + (status, finish_reason))
+            self.tokens.inc(labels + ("prompt",), prompt_tokens)
+            if cached_tokens:
+                self.tokens.inc(labels + ("cached_prompt",), cached_tokens)
+            self.tokens.inc(labels + ("output",), output_tokens)
+            self.cost.inc(labels, cost)
+            if retries:
+                self.retries.inc(labels, retries)
+            self.duration.observe(labels, seconds)
+            self.queue_wait.observe(labels, queue_wait)
+            self.prompt_tokens.observe(labels, prompt_tokens)
+            self.output_tokens.observe(labels, output_tokens)
+            self._roll_up(
+                team_id, endpoint, model_name,
+                calls=1, errors=1 if error is not None else 0, retries=retries,
+                prompt_tokens=prompt_tokens, cached_prompt_tokens=cached_tokens, output_tokens=output_tokens, cost_usd=cost,
+                latency_seconds=seconds, queue_wait_seconds=queue_wait
+            )
+
+        logger.debug(
+            f"LLM call {model_name} for {endpoint} ({team_id}): {status}/{finish_reason} in {seconds:.2f}s "
+            f"(queued {queue_wait:.2f}s, {retries} retries), {prompt_tokens}+{output_tokens} tokens, ${cost:.5f}"
+        )
+
+    def record_cache_hit(self, model_name: str) -> None:
+        """A call answered from the LLM cache: counted, but no tokens or cost"""
+        endpoint, team_id = current_caller()
+        with self._lock:
+            self.calls.inc((endpoint, model_name, "cached", "none"))
+            self._roll_up(team_id, endpoint, model_name, cached_calls=1)
+
+    def prometheus(self) -> str:
+        """All series in Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for metric in (self.calls, self.tokens, self.cost, self.retries,
+                           self.duration, self.queue_wait, self.prompt_tokens, self.output_tokens):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> int:
+        """Add buffered totals to llm_usage_daily; returns the rows written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        db = SessionLocal()
+        try:
+            for (day, team_id, endpoint, model_name), totals in pending.items():
+                row = db.query(LLMUsageDaily).filter(
+                    LLMUsageDaily.day == day,
+                    LLMUsageDaily.team_id == team_id,
+                    LLMUsageDaily.endpoint == endpoint,
+                    LLMUsageDaily.model_name == model_name
+                ).with_for_update().first()
+                if row is None:
+                    row = LLMUsageDaily(day=day, team_id=team_id, endpoint=endpoint, model_name=model_name,
+                                        **dict.fromkeys(ROLLUP_FIELDS, 0))
+                    db.add(row)
+                for field, amount in totals.items():
+                    setattr(row, field, (getattr(row, field) or 0) + amount)
+                db.flush()
+            db.commit()
+            return len(pending)
+        except Exception as e:
+            db.rollback()
+            # Another process may have inserted the same row; keep the totals for the next flush
+            with self._lock:
+                for key, totals in pending.items():
+                    merged = self._pending.setdefault(key, dict.fromkeys(ROLLUP_FIELDS, 0))
+                    for field, amount in totals.items():
+                        merged[field] += amount
+            if not isinstance(e, IntegrityError):
+                logger.warning(f"Could not write LLM usage rollups: {str(e)}")
+            return 0
+        finally:
+            db.close()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await asyncio.to_thread(self.flush)
+
+    async def start(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await asyncio.to_thread(self.flush)
+
+    def usage(self, team_id: str, db, days: int = 30) -> Dict[str, Any]:
+        """A team's daily LLM usage over the last days, with totals per endpoint"""
+        self.flush()
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        rows = db.query(LLMUsageDaily).filter(
+            LLMUsageDaily.team_id == team_id,
+            LLMUsageDaily.day >= since
+        ).order_by(LLMUsageDaily.day, LLMUsageDaily.endpoint, LLMUsageDaily.model_name).all()
+
+        daily = []
+        by_endpoint: Dict[str, Dict[str, float]] = {}
+        totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+        for row in rows:
+            values = {field: getattr(row, field) or 0 for field in ROLLUP_FIELDS}
+            daily.append({
+                "day": row.day.isoformat(),
+                "endpoint": row.endpoint,
+                "model": row.model_name,
+                **values,
+                "avg_latency_seconds": round(values["latency_seconds"] / values["calls"], 3) if values["calls"] else None
+            })
+            endpoint_totals = by_endpoint.setdefault(row.endpoint, dict.fromkeys(ROLLUP_FIELDS, 0))
+            for field, value in values.items():
+                endpoint_totals[field] += value
+                totals[field] += value
+
+        return {
+            "team_id": team_id,
+            "since": since.isoformat(),
+            "daily": daily,
+            "by_endpoint": by_endpoint,
+            "totals": {**totals, "cost_usd": round(totals["cost_usd"], 4)}
+        }
+
+# Global instance
+llm_metrics = LLMMetrics()
@@ -0,0 +1,93 @@
+"""
+Long transcript handling for SOAP generation
+A long recording doesn't fit comfortably in one prompt: calls get slow and
+the JSON answer can be cut off at the output limit. Such transcripts are
+split on sentence boundaries into chunks, section facts are extracted from
+each chunk (map), and the merged facts are written up as one SOAP note
+(reduce). The choice is made from a token estimate of the transcript.
+"""
+
+import os
+import re
+from typing import Dict, Any, List
+
+from soap_stream import SOAP_SECTIONS
+
+# Rough size of a token in English text; close enough to pick a strategy
+CHARS_PER_TOKEN = 4
+
+# Transcripts estimated above this many tokens are generated map-reduce
+SOAP_MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("SOAP_MAP_REDUCE_THRESHOLD_TOKENS", "6000"))
+# Target chunk size for the map step, and how many chunks are extracted at once
+SOAP_CHUNK_TOKENS = int(os.getenv("SOAP_CHUNK_TOKENS", "2000"))
+SOAP_MAP_CONCURRENCY = int(os.getenv("SOAP_MAP_CONCURRENCY", "4"))
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def needs_map_reduce(transcript: str, threshold_tokens: int = SOAP_MAP_REDUCE_THRESHOLD_TOKENS) -> bool:
+    return estimate_tokens(transcript or "") > threshold_tokens
+
+
+def split_sentences(text: str, max_tokens: int = SOAP_CHUNK_TOKENS) -> List[str]:
+    """Sentences of the text; unpunctuated runs longer than a chunk are split between words"""
+    sentences = []
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            sentences.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def chunk_transcript(text: str, max_tokens: int = SOAP_CHUNK_TOKENS, overlap_sentences: int = 1) -> List[str]:
+    """
+    Group sentences into chunks of about max_tokens. Each chunk repeats the
+    last overlap_sentences of the previous one so a finding that straddles
+    the boundary is seen whole.
+    """
+    sentences = split_sentences(text, max_tokens)
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for sentence in sentences:
+        tokens = estimate_tokens(sentence) + 1
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current = current[-overlap_sentences:] if overlap_sentences else []
+            current_tokens = sum(estimate_tokens(s) + 1 for s in current)
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def merge_section_facts(partials: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    Combine per-chunk facts into one list per SOAP section, in transcript
+    order, dropping repeats (the chunk overlap produces some)
+    """
+    merged: Dict[str, List[str]] = {section: [] for section in SOAP_SECTIONS}
+    seen = {section: set() for section in SOAP_SECTIONS}
+    for partial in partials:
+        for section in SOAP_SECTIONS:
+            facts = partial.get(section) or []
+            if isinstance(facts, str):
+                facts = [facts]
+            for fact in facts:
+                fact = str(fact).strip()
+                key = " ".join(fact.lower().split()).rstrip(".")
+                if fact and key not in seen[section]:
+                    seen[section].add(key)
+                    merged[section].append(fact)
+    return merged
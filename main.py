@@ -1,8 +1,13 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from starlette.requests import HTTPConnection
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
+import hmac
 import json
 from typing import List, Optional
 import os
@@ -18,8 +23,8 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Import our modules
-from database import get_db, create_database
-from models import User, Owner, Pet, Visit, Template, AudioFile, TranscriptionJob, Note, UserRole, SOAPSection, ExportHistory, ExportType, ExportStatus
+from database import get_db, get_async_db, create_database, SessionLocal, async_engine
+from models import User, Owner, Pet, Visit, Template, AudioFile, TranscriptionJob, Note, UserRole, SOAPSection, ExportHistory, ExportType, ExportStatus, TranscriptionPriority, SOAPBatch, ChartJob
 from schemas import (
     UserCreate, UserLogin, User as UserSchema, Token,
     OwnerCreate, Owner as OwnerSchema,
@@ -30,30 +35,55 @@ from schemas import (
     ValidationResult, MedicalCoding,
     RefreshTokenRequest, AudioFile as AudioFileSchema,
     AudioFileUploadResponse, TranscriptionJob as TranscriptionJobSchema,
-    Note as NoteSchema, NoteCreate, NoteStatus
+    Note as NoteSchema, NoteCreate, NoteStatus, SOAPBatchRequest
 )
 from auth import (
     authenticate_user, create_access_token, get_current_active_user,
     get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES,
-    create_refresh_token, verify_refresh_token, get_user_by_email
+    create_refresh_token, verify_refresh_token, get_user_by_email, get_user_from_token
+)
+from gemini_service import gemini_service
+from llm_client import llm_registry
+from llm_governor import llm_governor
+from llm_cache import llm_cache
+from llm_metrics import llm_metrics, tag_llm_caller
+from prompt_compiler import prompt_compiler
+from chart_pipeline import chart_pipeline, PIPELINE_MODES
+from chart_job_service import (
+    chart_job_service, chart_clinical_data, save_generated_chart, clinical_text_length, CHART_SYNC_MAX_CHARS
 )
-from gemini_service import GeminiService
 from transcription_service import transcription_service
+from transcription_scheduler import transcription_scheduler, tenant_for_user
+from speech_resilience import speech_circuit_breaker
+from audio_upload_service import audio_upload_service
+from live_transcription_service import live_transcription_service
 from background_tasks import task_manager
 from template_service import template_service
 from soap_generation_service import soap_generation_service
+from soap_batch_service import soap_batch_service, SOAP_BATCH_MAX_ITEMS
 from pdf_export_service import pdf_export_service
 from email_service import email_service
 from analytics_service import analytics_service
 from team_service import team_service
+from event_hub import event_hub, HEARTBEAT_SECONDS
 
 load_dotenv()
 
+# Bearer token Prometheus must send to scrape /metrics; unset disables the endpoint
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+async def tag_llm_endpoint(connection: HTTPConnection):
+    """Attribute LLM calls made while handling a request to its route"""
+    route = connection.scope.get("route")
+    method = connection.scope.get("method", "WS")
+    tag_llm_caller(endpoint=f"{method} {getattr(route, 'path', connection.url.path)}")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Pawscribed - Veterinary Documentation Assistant",
     description="HIPAA-compliant veterinary documentation system with AI assistance",
-    version="1.0.0"
+    version="1.0.0",
+    dependencies=[Depends(tag_llm_endpoint)]
 )
 
 # CORS configuration - use environment variables for production
@@ -68,7 +98,6 @@ app.add_middleware(
 )
 
 # Initialize services
-gemini_service = GeminiService()
 security = HTTPBearer()
 
 # Create database tables on startup
@@ -77,17 +106,36 @@ async def startup_event():
     create_database()
     # Start background task processing
     await task_manager.start()
+    await event_hub.start()
+    await llm_metrics.start()
+    gemini_service.warm_up()
+    await soap_batch_service.resume_incomplete()
+    await chart_job_service.resume_incomplete()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # Stop background task processing
     await task_manager.stop()
+    await event_hub.stop()
+    await llm_metrics.stop()
+    llm_registry.shutdown()
+    await async_engine.dispose()
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "Pawscribed API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(request: Request):
+    """LLM call counters and histograms in Prometheus text format"""
+    if not METRICS_TOKEN:
+        # Unconfigured: call volumes, token counts and estimated spend per endpoint and model stay off the public port
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(llm_metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
 # Temporary migration endpoint
 @app.post("/admin/migrate")
 async def run_migration(db: Session = Depends(get_db)):
@@ -186,7 +234,7 @@ async def test_gemini():
             "clinical_notes": "Cat has been sneezing for 2 days"
         }
         
-        result = await gemini_service.generate_soap_note(test_data, "detailed")
+        result = await gemini_service.generate_soap_note(test_data, "detailed", use_cache=False)
         return {
             "test": "Gemini API Test",
             "success": result["success"],
@@ -330,23 +378,30 @@ async def read_owner(
     return owner
 
 # Pet endpoints (Enhanced with search and filtering)
+async def load_pet(db: AsyncSession, pet_id: int) -> Optional[Pet]:
+    """An active pet with its owner loaded, as PetSchema serializes it"""
+    result = await db.execute(
+        select(Pet).options(selectinload(Pet.owner))
+        .where(Pet.id == pet_id, Pet.is_active.is_(True))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 @app.post("/pets", response_model=PetSchema)
 async def create_pet(
     pet: PetCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Verify owner exists
-    owner = db.query(Owner).filter(Owner.id == pet.owner_id).first()
+    owner = await db.get(Owner, pet.owner_id)
     if not owner:
         raise HTTPException(status_code=404, detail="Owner not found")
     
     db_pet = Pet(**pet.dict())
-    db.add(db_pet)
-    db.commit()
-    db.refresh(db_pet)
-    # Load owner relationship
     db_pet.owner = owner
+    db.add(db_pet)
+    await db.commit()
     return db_pet
 
 @app.get("/pets", response_model=List[PetSchema])
@@ -356,32 +411,26 @@ async def read_pets(
     search: str = None,
     owner_id: int = None,
     species: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
-        query = db.query(Pet)
-        
-        # Only filter by is_active if the column exists
-        try:
-            query = query.filter(Pet.is_active.is_(True))
-        except:
-            pass
+        query = select(Pet).options(selectinload(Pet.owner)).where(Pet.is_active.is_(True))
         
         # Search by name
         if search:
-            query = query.filter(Pet.name.ilike(f"%{search}%"))
+            query = query.where(Pet.name.ilike(f"%{search}%"))
         
         # Filter by owner
         if owner_id:
-            query = query.filter(Pet.owner_id == owner_id)
+            query = query.where(Pet.owner_id == owner_id)
         
         # Filter by species
         if species:
-            query = query.filter(Pet.species == species)
+            query = query.where(Pet.species == species)
         
-        pets = query.offset(skip).limit(limit).all()
-        return pets
+        result = await db.execute(query.offset(skip).limit(limit))
+        return result.scalars().all()
     except Exception as e:
         logger.error(f"Error fetching pets: {e}")
         return []
@@ -389,10 +438,10 @@ async def read_pets(
 @app.get("/pets/{pet_id}", response_model=PetSchema)
 async def read_pet(
     pet_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    pet = db.query(Pet).filter(Pet.id == pet_id, Pet.is_active.is_(True)).first()
+    pet = await load_pet(db, pet_id)
     if pet is None:
         raise HTTPException(status_code=404, detail="Pet not found")
     return pet
@@ -401,10 +450,10 @@ async def read_pet(
 async def update_pet(
     pet_id: int,
     pet_update: PetCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_pet = db.query(Pet).filter(Pet.id == pet_id, Pet.is_active.is_(True)).first()
+    db_pet = await load_pet(db, pet_id)
     if not db_pet:
         raise HTTPException(status_code=404, detail="Pet not found")
     
@@ -412,23 +461,22 @@ async def update_pet(
     for field, value in pet_update.dict(exclude_unset=True).items():
         setattr(db_pet, field, value)
     
-    db.commit()
-    db.refresh(db_pet)
-    return db_pet
+    await db.commit()
+    return await load_pet(db, pet_id)
 
 @app.delete("/pets/{pet_id}")
 async def delete_pet(
     pet_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    db_pet = db.query(Pet).filter(Pet.id == pet_id).first()
+    db_pet = await db.get(Pet, pet_id)
     if not db_pet:
         raise HTTPException(status_code=404, detail="Pet not found")
     
     # Soft delete
     db_pet.is_active = False
-    db.commit()
+    await db.commit()
     return {"message": "Pet deleted successfully"}
 
 # Visit endpoints
@@ -481,6 +529,14 @@ async def generate_chart(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    if request.pipeline_mode and request.pipeline_mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid pipeline_mode. Use: {', '.join(PIPELINE_MODES)}")
+    if CHART_SYNC_MAX_CHARS and clinical_text_length(request) > CHART_SYNC_MAX_CHARS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Clinical text over {CHART_SYNC_MAX_CHARS} characters; submit it to POST /generate-chart/jobs"
+        )
+    
     try:
         logger.debug(f"Received chart generation request: {request}")
         
@@ -492,98 +548,14 @@ async def generate_chart(
         
         logger.debug(f"Found pet: {pet.name}, species: {pet.species}, age: {pet.age}")
         
-        # Prepare clinical data for AI processing
-        clinical_data = {
-            "age": pet.age,
-            "species": pet.species,
-            "sex": pet.sex,
-            "weight": pet.weight,
-            "chief_complaint": request.chief_complaint,
-            "symptoms": request.symptoms,
-            "physical_exam": request.physical_exam,
-            "diagnostic_findings": request.diagnostic_findings,
-            "clinical_notes": request.clinical_notes
-        }
-        
-        # Generate SOAP note using Gemini (PII-protected)
-        soap_result = await gemini_service.generate_soap_note(clinical_data, request.style or "detailed")
-        
-        logger.debug(f"SOAP generation result: success={soap_result['success']}")
-        
-        if not soap_result["success"]:
-            logger.error(f"SOAP generation failed: {soap_result['error']}")
-            return ChartGenerationResponse(
-                success=False,
-                error=soap_result["error"],
-                soap={
-                    "subjective": "Error generating SOAP note. Please try again.",
-                    "objective": "",
-                    "assessment": "",
-                    "plan": ""
-                }
-            )
+        clinical_data = chart_clinical_data(request, pet)
         
-        soap_data = soap_result["soap"]
-        logger.debug(f"Generated SOAP sections: {list(soap_data.keys())}")
-        
-        # Create visit record in database
-        db_visit = Visit(
-            pet_id=request.pet_id,
-            veterinarian_id=current_user.id,
-            visit_type=request.visit_type,
-            chief_complaint=request.chief_complaint,
-            subjective=soap_data.get("subjective"),
-            objective=soap_data.get("objective"),
-            assessment=soap_data.get("assessment"),
-            plan=soap_data.get("plan"),
-            original_notes=request.clinical_notes
-        )
-        
-        db.add(db_visit)
-        db.commit()
-        db.refresh(db_visit)
-        
-        # Generate client summary
-        logger.debug(f"Generating client summary for pet: {pet.name}")
-        client_summary_result = await gemini_service.generate_client_summary(
-            soap_data, pet.name
+        # Generate SOAP note, client summary and validation using Gemini (PII-protected)
+        chart_result = await chart_pipeline.run(
+            gemini_service, clinical_data, request.style or "detailed", pet.name, request.pipeline_mode,
+            deep_validation=bool(request.deep_validation)
         )
-        
-        if client_summary_result["success"]:
-            db_visit.client_summary = client_summary_result["summary"]
-            logger.debug("Client summary generated successfully")
-        else:
-            logger.warning(f"Client summary generation failed: {client_summary_result['error']}")
-            # Provide a default summary
-            db_visit.client_summary = f"Visit summary for {pet.name}: {soap_data.get('assessment', 'Assessment pending')}. Please see the detailed SOAP note for complete information."
-        
-        # Validate completeness
-        validation_result = await gemini_service.validate_completeness(soap_data)
-        
-        if validation_result["success"]:
-            validation_data = validation_result["validation"]
-            db_visit.completeness_score = validation_data.get("completeness_score")
-            db_visit.missing_elements = json.dumps(validation_data.get("missing_elements", []))
-        
-        db.commit()
-        
-        # Ensure we always return valid data
-        response_data = ChartGenerationResponse(
-            success=True,
-            visit_id=db_visit.id,
-            soap=soap_data,
-            client_summary=db_visit.client_summary or client_summary_result.get("summary", ""),
-            validation=validation_result.get("validation", {
-                "completeness_score": 0.8,
-                "missing_elements": [],
-                "suggestions": []
-            })
-        )
-        
-        logger.debug(f"Returning response with SOAP sections: {list(soap_data.keys())}")
-        logger.debug(f"Client summary length: {len(response_data.client_summary)}")
-        
-        return response_data
+        return save_generated_chart(request, pet, chart_result, current_user, db)
         
     except Exception as e:
         logger.error(f"Exception in generate_chart: {str(e)}", exc_info=True)
@@ -598,6 +570,98 @@ async def generate_chart(
             }
         )
 
+@app.post("/generate-chart/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_chart_job(
+    request: ChartGenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    /generate-chart without waiting for it: returns the job at once and saves
+    the visit when generation finishes. Follow it with GET
+    /generate-chart/jobs/{job_id} or the "chart_job.updated" events. Send an
+    Idempotency-Key header so a retried submission returns the same job.
+    """
+    if request.pipeline_mode and request.pipeline_mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid pipeline_mode. Use: {', '.join(PIPELINE_MODES)}")
+    idempotency_key = http_request.headers.get("idempotency-key")
+    if idempotency_key and len(idempotency_key) > 128:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 128 characters")
+    if not db.query(Pet.id).filter(Pet.id == request.pet_id).first():
+        raise HTTPException(status_code=404, detail="Pet not found")
+    
+    job = chart_job_service.create_job(current_user, request, idempotency_key, db)
+    chart_job_service.start(job.id)
+    return chart_job_service.job_summary(job)
+
+@app.get("/generate-chart/jobs/{job_id}")
+async def get_chart_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Status of a chart job, with the generated chart once it has finished"""
+    job = db.query(ChartJob).filter(
+        ChartJob.id == job_id,
+        ChartJob.user_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Chart job not found")
+    return chart_job_service.job_summary(job)
+
+@app.post("/generate-chart/stream")
+async def generate_chart_stream(
+    request: ChartGenerationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    /generate-chart as server-sent events: a "section" event as each SOAP
+    section is generated, then "complete" with the same body /generate-chart
+    returns once the summary and validation are done and the visit is saved
+    """
+    pet = db.query(Pet).filter(Pet.id == request.pet_id).first()
+    if not pet:
+        raise HTTPException(status_code=404, detail="Pet not found")
+    clinical_data = chart_clinical_data(request, pet)
+    
+    async def event_stream():
+        try:
+            async for event in chart_pipeline.stream(
+                gemini_service, clinical_data, request.style or "detailed", pet.name, deep_validation=bool(request.deep_validation)
+            ):
+                if event["type"] == "section":
+                    yield f"event: section\ndata: {json.dumps(event)}\n\n"
+                else:
+                    response_data = save_generated_chart(request, pet, event["result"], current_user, db)
+                    yield f"event: complete\ndata: {response_data.model_dump_json()}\n\n"
+        except Exception as e:
+            logger.error(f"Exception in generate_chart_stream: {str(e)}", exc_info=True)
+            response_data = ChartGenerationResponse(
+                success=False,
+                error=str(e),
+                soap={"subjective": "", "objective": "", "assessment": "", "plan": ""}
+            )
+            yield f"event: complete\ndata: {response_data.model_dump_json()}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/generate-chart/metrics")
+async def get_chart_generation_metrics(current_user: User = Depends(get_current_active_user)):
+    """Chart generation latency per pipeline mode and stage (this process, recent requests)"""
+    return {
+        **chart_pipeline.metrics(),
+        "llm_client": llm_registry.stats(),
+        "llm_cache": llm_cache.metrics(),
+        "llm_governor": llm_governor.stats(),
+        "prompt_compiler": prompt_compiler.stats()
+    }
+
 # Template endpoints
 @app.get("/templates")
 async def get_templates(
@@ -680,6 +744,7 @@ async def create_custom_template(
 @app.post("/validate-chart/{visit_id}", response_model=ValidationResult)  
 async def validate_chart(
     visit_id: int,
+    deep: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -698,7 +763,8 @@ async def validate_chart(
         "plan": visit.plan or ""
     }
     
-    validation_result = await gemini_service.validate_completeness(soap_data)
+    # Reviewed locally unless the note is unclear to the rules or deep=true asks for Gemini's review
+    validation_result = await gemini_service.validate_completeness(soap_data, cache_scope=f"visit:{visit.id}", deep=deep)
     
     if not validation_result["success"]:
         raise HTTPException(status_code=500, detail="Validation failed")
@@ -710,69 +776,60 @@ async def validate_chart(
 async def upload_audio(
     file: UploadFile = File(...),
     patient_id: Optional[int] = Form(None),
+    priority: str = Form("normal"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    # Validate file type
-    allowed_types = ["audio/wav", "audio/mpeg", "audio/mp3", "audio/m4a", "audio/x-m4a"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed types: {', '.join(allowed_types)}"
-        )
-    
-    # Validate file size (100MB limit)
-    file_size = 0
-    contents = await file.read()
-    file_size = len(contents)
-    await file.seek(0)  # Reset file pointer
-    
-    if file_size > 100 * 1024 * 1024:  # 100MB
-        raise HTTPException(status_code=400, detail="File size exceeds 100MB limit")
-    
-    # Create upload directory if it doesn't exist
-    upload_dir = Path("uploads/audio")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Generate unique filename
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    filename = f"{current_user.id}_{timestamp}_{file.filename}"
-    file_path = upload_dir / filename
-    
-    # Save file
-    with open(file_path, 'wb') as f:
-        f.write(contents)
-    
-    # Create database record
-    db_audio = AudioFile(
-        user_id=current_user.id,
-        filename=file.filename,
-        file_path=str(file_path),
-        file_size=file_size,
-        mime_type=file.content_type
+    # live = recorded during a consult, backlog = bulk import of past recordings
+    try:
+        job_priority = TranscriptionPriority[priority.upper()]
+    except KeyError:
+        raise HTTPException(status_code=400, detail="Invalid priority. Use: live, normal, backlog")
+    
+    # Stream file to disk (validates type, size and content as it goes)
+    upload_result = await audio_upload_service.save_upload(file, current_user.id)
+    if not upload_result["success"]:
+        raise HTTPException(status_code=400, detail=upload_result["error"])
+    
+    # Record the upload; identical content is stored once and shared
+    db_audio, _ = audio_upload_service.register_upload(
+        upload_result, current_user.id, file.filename, file.content_type, db
     )
-    db.add(db_audio)
-    db.commit()
-    db.refresh(db_audio)
+    await audio_upload_service.record_audio_properties(db_audio, db)
     
-    # Create transcription job
-    db_job = TranscriptionJob(
-        audio_file_id=db_audio.id,
-        status="pending"
-    )
-    db.add(db_job)
-    db.commit()
-    db.refresh(db_job)
+    # Create transcription job, reusing work already done on identical audio
+    db_job, reuse = transcription_service.create_job_for_audio(db_audio, db, job_priority)
     
-    # Transcription will be processed by background task manager
-    logger.info(f"Created transcription job {db_job.id} for audio file {db_audio.id}")
+    if reuse == "transcript":
+        message = "Audio file uploaded successfully. Transcript reused from identical recording."
+    elif reuse == "in_flight":
+        message = "Audio file already uploaded. Transcription in progress."
+    else:
+        # Wake the background processor so transcription starts immediately
+        task_manager.notify_transcription_job()
+        message = "Audio file uploaded successfully. Transcription started."
+    logger.info(f"Transcription job {db_job.id} for audio file {db_audio.id} (reuse={reuse})")
     
     return {
         "audio_file_id": db_audio.id,
         "transcription_job_id": db_job.id,
-        "message": "Audio file uploaded successfully. Transcription started."
+        "message": message,
+        "deduplicated": upload_result["deduplicated"],
+        "transcript_reused": reuse == "transcript"
     }
 
+@app.websocket("/ws/transcribe")
+async def live_transcription(websocket: WebSocket, token: Optional[str] = None):
+    # Browsers cannot set headers on WebSockets, so the access token comes as a query parameter.
+    # A recording can run for minutes, so no session is held while it does.
+    current_user = resolve_socket_user(token)
+    if not current_user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    await live_transcription_service.handle(websocket, current_user)
+
 @app.get("/audio/files", response_model=List[AudioFileSchema])
 async def list_audio_files(
     skip: int = 0,
@@ -786,32 +843,209 @@ async def list_audio_files(
     return files
 
 # Transcription endpoints
+@app.get("/transcriptions/queue/metrics")
+async def get_transcription_queue_metrics(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Queue depth, wait times and retries per tenant (admins see every tenant,
+    others their own), plus this process's speech circuit breaker state
+    """
+    if current_user.role in [UserRole.ADMIN, UserRole.PRACTICE_OWNER]:
+        metrics = transcription_scheduler.queue_metrics(db)
+    else:
+        metrics = transcription_scheduler.queue_metrics(db, tenant_id=tenant_for_user(current_user))
+    metrics["speech_circuit"] = speech_circuit_breaker.snapshot()
+    metrics["retries"]["process_counts"] = dict(transcription_service.failure_counts)
+    return metrics
+
 @app.get("/transcriptions/{job_id}", response_model=TranscriptionJobSchema)
 async def get_transcription_status(
     job_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    job = db.query(TranscriptionJob).join(AudioFile).filter(
-        TranscriptionJob.id == job_id,
-        AudioFile.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(TranscriptionJob).join(AudioFile).where(
+            TranscriptionJob.id == job_id,
+            AudioFile.user_id == current_user.id
+        )
+    )
+    job = result.scalars().first()
     
     if not job:
         raise HTTPException(status_code=404, detail="Transcription job not found")
     
     return job
 
+# Event stream endpoints
+def workflow_stats_query(user_id: int):
+    return select(Note.status, func.count(Note.id)).where(Note.user_id == user_id).group_by(Note.status)
+
+def workflow_stats_from_rows(rows) -> dict:
+    stats = {s.value: 0 for s in NoteStatus}
+    for note_status, count in rows:
+        if note_status is not None:
+            stats[getattr(note_status, "value", note_status)] = count
+    return stats
+
+def workflow_stats(user_id: int, db: Session) -> dict:
+    """Count of a user's notes in each workflow stage"""
+    return workflow_stats_from_rows(db.execute(workflow_stats_query(user_id)).all())
+
+async def workflow_stats_async(user_id: int, db: AsyncSession) -> dict:
+    result = await db.execute(workflow_stats_query(user_id))
+    return workflow_stats_from_rows(result.all())
+
+def note_event_summary(note: Note) -> dict:
+    """Board fields of a note; full content is fetched on demand"""
+    return {
+        "id": note.id,
+        "user_id": note.user_id,
+        "title": note.title,
+        "note_type": note.note_type,
+        "status": getattr(note.status, "value", note.status),
+        "patient_id": note.patient_id,
+        "created_at": note.created_at.isoformat() if note.created_at else None,
+        "updated_at": note.updated_at.isoformat() if note.updated_at else None,
+        "patient": {
+            "id": note.patient.id,
+            "name": note.patient.name,
+            "species": note.patient.species
+        } if note.patient else None
+    }
+
+def _publish_notes(event_type: str, user: User, stats: dict, notes: List[Note], note_ids: List[int], extra: dict) -> None:
+    # Owner only: notes are scoped to their user and the summaries carry patient names
+    data = {
+        "user_id": user.id,
+        "notes": [note_event_summary(note) for note in notes],
+        "note_ids": list(note_ids) or [note.id for note in notes],
+        "stats": stats,
+        **extra
+    }
+    event_hub.publish(event_type, data, user_id=user.id)
+
+def publish_note_event(event_type: str, user: User, db: Session, notes: List[Note] = (), note_ids: List[int] = (), **extra) -> None:
+    """Publish note changes (after commit) with the owner's refreshed workflow counts"""
+    _publish_notes(event_type, user, workflow_stats(user.id, db), notes, note_ids, extra)
+
+async def publish_note_event_async(event_type: str, user: User, db: AsyncSession, notes: List[Note] = (), note_ids: List[int] = (), **extra) -> None:
+    """publish_note_event for handlers on an async session; notes need their patient loaded"""
+    _publish_notes(event_type, user, await workflow_stats_async(user.id, db), notes, note_ids, extra)
+
+def publish_export_event(export_record: ExportHistory, user: User) -> None:
+    """Tell the exporting user an export finished; exports are not shared with the team"""
+    completed = export_record.status == ExportStatus.COMPLETED
+    event_hub.publish("export.completed", {
+        "user_id": user.id,
+        "export_id": export_record.id,
+        "export_type": getattr(export_record.export_type, "value", export_record.export_type),
+        "status": getattr(export_record.status, "value", export_record.status),
+        "note_ids": json.loads(export_record.note_ids or "[]"),
+        "error_message": export_record.error_message,
+        "download_url": f"/export/download/{export_record.id}" if completed and export_record.file_path else None
+    }, user_id=user.id)
+
+def resolve_socket_user(token: Optional[str]) -> Optional[User]:
+    """
+    The user for a connection's token, loaded in a session that is closed
+    again, so a long-lived connection does not hold a pooled connection
+    """
+    db = SessionLocal()
+    try:
+        return get_user_from_token(db, token)
+    finally:
+        db.close()
+
+def resolve_event_subscriber(token: Optional[str]) -> Optional[tuple]:
+    """(user_id, team_id) for a stream token"""
+    user = resolve_socket_user(token)
+    return (user.id, user.team_id) if user else None
+
+@app.get("/events/stream")
+async def stream_events(request: Request, token: Optional[str] = None):
+    """
+    Server-sent events for the current user and their team. EventSource cannot
+    send headers, so the access token comes as a query parameter.
+    """
+    subscriber = resolve_event_subscriber(token)
+    if not subscriber:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    subscription = event_hub.subscribe(*subscriber)
+    
+    async def event_stream():
+        try:
+            yield f"retry: 5000\nevent: connected\ndata: {json.dumps({'user_id': subscriber[0]})}\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.next_event(HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            event_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket, token: Optional[str] = None):
+    """The same event stream over a WebSocket, for clients that already hold one open"""
+    subscriber = resolve_event_subscriber(token)
+    if not subscriber:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = event_hub.subscribe(*subscriber)
+    
+    async def watch_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+    
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await websocket.send_json({"type": "connected", "data": {"user_id": subscriber[0]}})
+        while True:
+            next_event = asyncio.ensure_future(subscription.next_event(HEARTBEAT_SECONDS))
+            await asyncio.wait([next_event, watcher], return_when=asyncio.FIRST_COMPLETED)
+            if watcher.done():
+                next_event.cancel()
+                break
+            await websocket.send_json(next_event.result() or {"type": "heartbeat"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        watcher.cancel()
+        event_hub.unsubscribe(subscription)
+
 # Note management endpoints
+def note_query(user_id: int):
+    """A user's notes with the patient (and its owner) loaded, as NoteSchema serializes them"""
+    return select(Note).options(selectinload(Note.patient).selectinload(Pet.owner)).where(Note.user_id == user_id)
+
+async def load_note(db: AsyncSession, note_id: int, user_id: int) -> Optional[Note]:
+    result = await db.execute(
+        note_query(user_id).where(Note.id == note_id).execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
 @app.post("/notes", response_model=NoteSchema)
 async def create_note(
     note: NoteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Verify patient exists if provided
     if note.patient_id:
-        patient = db.query(Pet).filter(Pet.id == note.patient_id).first()
+        patient = await db.get(Pet, note.patient_id)
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
     
@@ -821,8 +1055,9 @@ async def create_note(
         status=NoteStatus.DRAFT
     )
     db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
+    await db.commit()
+    db_note = await load_note(db, db_note.id, current_user.id)
+    await publish_note_event_async("note.created", current_user, db, notes=[db_note])
     return db_note
 
 @app.get("/notes", response_model=List[NoteSchema])
@@ -831,22 +1066,22 @@ async def list_notes(
     limit: int = 100,
     status: Optional[str] = None,
     patient_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
-        query = db.query(Note).filter(Note.user_id == current_user.id)
+        query = note_query(current_user.id)
         
         if status:
             # Convert string to enum value if needed
             if status in [s.value for s in NoteStatus]:
-                query = query.filter(Note.status == status)
+                query = query.where(Note.status == status)
         
         if patient_id:
-            query = query.filter(Note.patient_id == patient_id)
+            query = query.where(Note.patient_id == patient_id)
         
-        notes = query.order_by(Note.created_at.desc()).offset(skip).limit(limit).all()
-        return notes
+        result = await db.execute(query.order_by(Note.created_at.desc()).offset(skip).limit(limit))
+        return result.scalars().all()
     except Exception as e:
         logger.error(f"Error fetching notes: {e}")
         return []
@@ -854,13 +1089,10 @@ async def list_notes(
 @app.get("/notes/{note_id}", response_model=NoteSchema)
 async def get_note(
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    note = db.query(Note).filter(
-        Note.id == note_id,
-        Note.user_id == current_user.id
-    ).first()
+    note = await load_note(db, note_id, current_user.id)
     
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
@@ -871,13 +1103,10 @@ async def get_note(
 async def update_note_status(
     note_id: int,
     status: NoteStatus,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    note = db.query(Note).filter(
-        Note.id == note_id,
-        Note.user_id == current_user.id
-    ).first()
+    note = await load_note(db, note_id, current_user.id)
     
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
@@ -888,7 +1117,8 @@ async def update_note_status(
     if status == NoteStatus.EXPORTED:
         note.exported_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
+    await publish_note_event_async("note.updated", current_user, db, notes=[note])
     return {"message": f"Note status updated to {status}"}
 
 # SOAP Note Generation endpoints
@@ -911,6 +1141,13 @@ async def generate_soap_from_transcription(
         )
         
         if result["success"]:
+            note = db.query(Note).filter(Note.id == result["note_id"]).first()
+            publish_note_event(
+                "soap.generated", current_user, db,
+                notes=[note] if note else [],
+                note_ids=[result["note_id"]],
+                transcription_job_id=transcription_job_id
+            )
             return {
                 "success": True,
                 "note_id": result["note_id"],
@@ -925,6 +1162,92 @@ async def generate_soap_from_transcription(
         logger.error(f"SOAP generation failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to generate SOAP note")
 
+@app.post("/notes/generate-from-transcription/stream")
+async def stream_soap_from_transcription(
+    transcription_job_id: int,
+    patient_id: int,
+    template_type: str = "soap_standard",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    /notes/generate-from-transcription as server-sent events: a "section"
+    event as each SOAP section is generated, then "complete" once the note is saved
+    """
+    async def event_stream():
+        result = {"success": False, "error": "Failed to generate SOAP note"}
+        async for event in soap_generation_service.stream_soap_from_transcription(
+            transcription_job_id=transcription_job_id,
+            patient_id=patient_id,
+            template_type=template_type,
+            user_id=current_user.id,
+            db=db
+        ):
+            if event["type"] == "section":
+                yield f"event: section\ndata: {json.dumps(event)}\n\n"
+            else:
+                result = event["result"]
+        
+        if result["success"]:
+            note = db.query(Note).filter(Note.id == result["note_id"]).first()
+            publish_note_event(
+                "soap.generated", current_user, db,
+                notes=[note] if note else [],
+                note_ids=[result["note_id"]],
+                transcription_job_id=transcription_job_id
+            )
+            payload = {
+                "success": True,
+                "note_id": result["note_id"],
+                "message": "SOAP note generated successfully",
+                "confidence_score": result.get("confidence_score"),
+                "sections_created": result.get("sections_created")
+            }
+        else:
+            payload = {"success": False, "error": result["error"]}
+        yield f"event: complete\ndata: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/notes/batch/generate", status_code=status.HTTP_202_ACCEPTED)
+async def generate_soap_batch(
+    request: SOAPBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Generate SOAP notes for many completed transcriptions. Returns at once;
+    follow progress with GET /notes/batch/generate/{batch_id} or the
+    "soap_batch.updated" events.
+    """
+    if len(request.items) > SOAP_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {SOAP_BATCH_MAX_ITEMS} items")
+    
+    batch = soap_batch_service.create_batch(
+        current_user, [item.model_dump() for item in request.items], request.template_type, db
+    )
+    soap_batch_service.start(batch.id, current_user.id)
+    return soap_batch_service.batch_summary(batch)
+
+@app.get("/notes/batch/generate/{batch_id}")
+async def get_soap_batch(
+    batch_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Progress and per-item results of a bulk SOAP generation"""
+    batch = db.query(SOAPBatch).filter(
+        SOAPBatch.id == batch_id,
+        SOAPBatch.user_id == current_user.id
+    ).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return soap_batch_service.batch_summary(batch)
+
 @app.get("/notes/{note_id}/complete")
 async def get_complete_note(
     note_id: int,
@@ -996,19 +1319,11 @@ async def update_soap_section(
 # Workflow statistics endpoint
 @app.get("/workflow/stats")
 async def get_workflow_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
-        stats = {}
-        for status in NoteStatus:
-            count = db.query(Note).filter(
-                Note.user_id == current_user.id,
-                Note.status == status.value
-            ).count()
-            stats[status.value] = count
-        
-        return stats
+        return await workflow_stats_async(current_user.id, db)
     except Exception as e:
         logger.error(f"Error getting workflow stats: {e}")
         # Return empty stats if there's an error
@@ -1048,6 +1363,7 @@ async def batch_update_note_status(
         updated_count += 1
     
     db.commit()
+    publish_note_event("note.updated", current_user, db, notes=notes)
     
     return {
         "message": f"Updated {updated_count} notes to {status.value}",
@@ -1081,6 +1397,7 @@ async def batch_delete_notes(
     ).delete(synchronize_session=False)
     
     db.commit()
+    publish_note_event("note.deleted", current_user, db, note_ids=note_ids)
     
     return {
         "message": f"Deleted {deleted_count} notes",
@@ -1111,6 +1428,7 @@ async def batch_export_notes(
         exported_count += 1
     
     db.commit()
+    publish_note_event("note.updated", current_user, db, notes=notes)
     
     return {
         "message": f"Prepared {exported_count} notes for export",
@@ -1158,6 +1476,7 @@ async def export_note_pdf(
             export_record.file_size = result["file_size"]
             export_record.completed_at = datetime.utcnow()
             db.commit()
+            publish_export_event(export_record, current_user)
             
             return {
                 "success": True,
@@ -1170,6 +1489,7 @@ async def export_note_pdf(
             export_record.status = ExportStatus.FAILED
             export_record.error_message = result["error"]
             db.commit()
+            publish_export_event(export_record, current_user)
             
             raise HTTPException(status_code=500, detail=result["error"])
             
@@ -1220,6 +1540,7 @@ async def export_batch_pdf(
                 export_record.file_size = result["file_size"]
             export_record.completed_at = datetime.utcnow()
             db.commit()
+            publish_export_event(export_record, current_user)
             
             return {
                 "success": True,
@@ -1234,6 +1555,7 @@ async def export_batch_pdf(
             export_record.status = ExportStatus.FAILED
             export_record.error_message = result["error"]
             db.commit()
+            publish_export_event(export_record, current_user)
             
             raise HTTPException(status_code=500, detail=result["error"])
             
@@ -1281,6 +1603,7 @@ async def email_note_pdf(
             export_record.status = ExportStatus.FAILED
             export_record.error_message = pdf_result["error"]
             db.commit()
+            publish_export_event(export_record, current_user)
             raise HTTPException(status_code=500, detail=pdf_result["error"])
         
         # Send email with PDF
@@ -1301,6 +1624,7 @@ async def email_note_pdf(
             export_record.email_sent_at = datetime.utcnow()
             export_record.completed_at = datetime.utcnow()
             db.commit()
+            publish_export_event(export_record, current_user)
             
             return {
                 "success": True,
@@ -1313,6 +1637,7 @@ async def email_note_pdf(
             export_record.status = ExportStatus.FAILED
             export_record.error_message = email_result["error"]
             db.commit()
+            publish_export_event(export_record, current_user)
             
             raise HTTPException(status_code=500, detail=email_result["error"])
             
@@ -1364,6 +1689,7 @@ async def email_batch_notes(
             export_record.status = ExportStatus.FAILED
             export_record.error_message = "No PDFs could be generated"
             db.commit()
+            publish_export_event(export_record, current_user)
             raise HTTPException(status_code=500, detail="No PDFs could be generated")
         
         # Send batch email
@@ -1383,6 +1709,7 @@ async def email_batch_notes(
             export_record.email_sent_at = datetime.utcnow()
             export_record.completed_at = datetime.utcnow()
             db.commit()
+            publish_export_event(export_record, current_user)
             
             return {
                 "success": True,
@@ -1396,6 +1723,7 @@ async def email_batch_notes(
             export_record.status = ExportStatus.FAILED
             export_record.error_message = email_result["error"]
             db.commit()
+            publish_export_event(export_record, current_user)
             
             raise HTTPException(status_code=500, detail=email_result["error"])
             
@@ -1525,6 +1853,17 @@ async def get_performance_summary(
         logger.error(f"Performance summary request failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve performance summary")
 
+@app.get("/analytics/llm-usage")
+async def get_llm_usage(
+    days: int = 30,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Daily LLM calls, tokens, cost and latency for the user's team, per endpoint and model"""
+    if days < 1 or days > 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    return llm_metrics.usage(tenant_for_user(current_user), db, days)
+
 # Team Management endpoints
 @app.post("/team/members")
 async def create_team_member(
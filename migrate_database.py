@@ -124,6 +124,79 @@ def migrate_database():
             conn.execute(text("ALTER TABLE pets ADD COLUMN is_active BOOLEAN DEFAULT true"))
             conn.commit()
     
+        # Check and add new columns to audio_files
+        audio_columns = [col['name'] for col in inspector.get_columns('audio_files')]
+        if 'content_hash' not in audio_columns:
+            print("Adding 'content_hash' column to audio_files table...")
+            conn.execute(text("ALTER TABLE audio_files ADD COLUMN content_hash VARCHAR(64)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_audio_files_content_hash ON audio_files (content_hash)"))
+            conn.commit()
+        
+        for column, column_type in [('sample_rate', 'INTEGER'), ('channels', 'INTEGER'), ('codec', 'VARCHAR')]:
+            if column not in audio_columns:
+                print(f"Adding '{column}' column to audio_files table...")
+                conn.execute(text(f"ALTER TABLE audio_files ADD COLUMN {column} {column_type}"))
+                conn.commit()
+        
+        # Check and add job leasing columns to transcription_jobs
+        job_columns = [col['name'] for col in inspector.get_columns('transcription_jobs')]
+        if 'claimed_by' not in job_columns:
+            print("Adding 'claimed_by' column to transcription_jobs table...")
+            conn.execute(text("ALTER TABLE transcription_jobs ADD COLUMN claimed_by VARCHAR"))
+            conn.commit()
+        
+        if 'lease_expires_at' not in job_columns:
+            print("Adding 'lease_expires_at' column to transcription_jobs table...")
+            conn.execute(text("ALTER TABLE transcription_jobs ADD COLUMN lease_expires_at TIMESTAMP"))
+            conn.commit()
+        
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transcription_jobs_status_created_at ON transcription_jobs (status, created_at)"))
+        conn.commit()
+        
+        if 'priority' not in job_columns:
+            print("Adding 'priority' column to transcription_jobs table...")
+            conn.execute(text("ALTER TABLE transcription_jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1"))
+            conn.commit()
+        
+        if 'tenant_id' not in job_columns:
+            print("Adding 'tenant_id' column to transcription_jobs table...")
+            conn.execute(text("ALTER TABLE transcription_jobs ADD COLUMN tenant_id VARCHAR"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transcription_jobs_tenant_id ON transcription_jobs (tenant_id)"))
+            conn.execute(text("""
+                UPDATE transcription_jobs SET tenant_id = (
+                    SELECT COALESCE(users.team_id, 'user:' || users.id)
+                    FROM audio_files JOIN users ON users.id = audio_files.user_id
+                    WHERE audio_files.id = transcription_jobs.audio_file_id
+                )
+                WHERE tenant_id IS NULL
+            """))
+            conn.commit()
+        
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transcription_jobs_status_priority_tenant ON transcription_jobs (status, priority, tenant_id, created_at)"))
+        conn.commit()
+        
+        if 'attempts' not in job_columns:
+            print("Adding 'attempts' column to transcription_jobs table...")
+            conn.execute(text("ALTER TABLE transcription_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"))
+            conn.commit()
+        
+        if 'next_attempt_at' not in job_columns:
+            print("Adding 'next_attempt_at' column to transcription_jobs table...")
+            conn.execute(text("ALTER TABLE transcription_jobs ADD COLUMN next_attempt_at TIMESTAMP"))
+            conn.commit()
+
+        # Register already-hashed uploads as stored audio content
+        print("Backfilling audio_blobs from hashed audio files...")
+        conn.execute(text("""
+            INSERT INTO audio_blobs (content_hash, file_path, file_size, created_at)
+            SELECT content_hash, MIN(file_path), MIN(file_size), MIN(uploaded_at)
+            FROM audio_files
+            WHERE content_hash IS NOT NULL
+              AND content_hash NOT IN (SELECT content_hash FROM audio_blobs)
+            GROUP BY content_hash
+        """))
+        conn.commit()
+    
     print("Database migration completed successfully!")
     
     # Show final table structure
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Float, Boolean, Enum, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
@@ -27,6 +27,11 @@ class TranscriptionStatus(str, enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class TranscriptionPriority(int, enum.Enum):
+    BACKLOG = 0  # bulk imports of past recordings
+    NORMAL = 1
+    LIVE = 2  # recorded during a consult; someone is waiting on it
+
 class ExportType(str, enum.Enum):
     PDF = "pdf"
     EMAIL = "email"
@@ -38,6 +43,18 @@ class ExportStatus(str, enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class SOAPBatchStatus(str, enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class ChartJobStatus(str, enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -145,13 +162,28 @@ class AudioFile(Base):
     file_path = Column(String)
     file_size = Column(Integer)  # in bytes
     duration = Column(Float)  # in seconds
+    sample_rate = Column(Integer)  # in Hz, as uploaded
+    channels = Column(Integer)
+    codec = Column(String)
     mime_type = Column(String)
+    content_hash = Column(String(64), index=True)  # SHA-256 of file contents
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="audio_files")
     transcription_jobs = relationship("TranscriptionJob", back_populates="audio_file")
 
+class AudioBlob(Base):
+    """Audio content stored once on disk under its SHA-256, shared by every upload of it"""
+    __tablename__ = "audio_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)
+    file_path = Column(String)
+    file_size = Column(Integer)  # in bytes
+    audio_format = Column(String)  # wav, mp3, m4a, webm
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class TranscriptionJob(Base):
     __tablename__ = "transcription_jobs"
     
@@ -165,9 +197,26 @@ class TranscriptionJob(Base):
     completed_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Job leasing (which worker holds the job and until when)
+    claimed_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    
+    # Scheduling: higher priority first, then fair share between tenants (team, or user without a team)
+    priority = Column(Integer, default=TranscriptionPriority.NORMAL.value, nullable=False)
+    tenant_id = Column(String, nullable=True, index=True)
+    
+    # Retries: attempts made so far, and when a failed job may next be claimed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=True)
+    
     # Relationships
     audio_file = relationship("AudioFile", back_populates="transcription_jobs")
     notes = relationship("Note", back_populates="transcription_job")
+    
+    __table_args__ = (
+        Index("ix_transcription_jobs_status_created_at", "status", "created_at"),
+        Index("ix_transcription_jobs_status_priority_tenant", "status", "priority", "tenant_id", "created_at"),
+    )
 
 class Note(Base):
     __tablename__ = "notes"
@@ -269,4 +318,106 @@ class ExportHistory(Base):
     completed_at = Column(DateTime)
     
     # Relationships
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class SOAPBatch(Base):
+    """Bulk SOAP generation for many completed transcriptions"""
+    __tablename__ = "soap_batches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    template_type = Column(String, default="soap_standard")
+    status = Column(Enum(SOAPBatchStatus), default=SOAPBatchStatus.PENDING)
+    items_count = Column(Integer, default=0)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    
+    # Relationships
+    user = relationship("User")
+    items = relationship("SOAPBatchItem", back_populates="batch", cascade="all, delete-orphan", order_by="SOAPBatchItem.id")
+
+class SOAPBatchItem(Base):
+    __tablename__ = "soap_batch_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("soap_batches.id"), index=True)
+    transcription_job_id = Column(Integer, ForeignKey("transcription_jobs.id"))
+    patient_id = Column(Integer, ForeignKey("pets.id"))
+    status = Column(Enum(SOAPBatchStatus), default=SOAPBatchStatus.PENDING)
+    
+    # Result
+    note_id = Column(Integer, ForeignKey("notes.id"), nullable=True)
+    error_message = Column(Text)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    
+    # Relationships
+    batch = relationship("SOAPBatch", back_populates="items")
+
+class ChartJob(Base):
+    """A /generate-chart request run in the background"""
+    __tablename__ = "chart_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    pet_id = Column(Integer, ForeignKey("pets.id"))
+    status = Column(Enum(ChartJobStatus), default=ChartJobStatus.PENDING, index=True)
+    # Client-chosen key; a retried submission with the same key gets the same job
+    idempotency_key = Column(String(128), nullable=True)
+    
+    request_payload = Column(Text)  # JSON ChartGenerationRequest
+    visit_id = Column(Integer, ForeignKey("visits.id"), nullable=True)
+    result = Column(Text)  # JSON ChartGenerationResponse
+    error_message = Column(Text)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_chart_jobs_user_idempotency_key"),
+    )
+
+class LLMCacheEntry(Base):
+    """Persistent tier of the LLM response cache, keyed by a hash of model, config and prompt"""
+    __tablename__ = "llm_cache_entries"
+    
+    key = Column(String(64), primary_key=True)
+    model_name = Column(String)
+    # What the prompt was built from (e.g. "visit:12"); changes to it invalidate the entry
+    scope = Column(String, index=True)
+    response_text = Column(Text)
+    hit_count = Column(Integer, default=0)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+    last_hit_at = Column(DateTime)
+
+class LLMUsageDaily(Base):
+    """LLM calls rolled up per day, team, calling endpoint and model"""
+    __tablename__ = "llm_usage_daily"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, index=True)
+    team_id = Column(String, index=True)  # team, or "user:<id>" for users without one
+    endpoint = Column(String)  # e.g. "POST /generate-chart", or "background"
+    model_name = Column(String)
+    
+    calls = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    cached_calls = Column(Integer, default=0)  # answered from the LLM cache, not billed
+    retries = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    cached_prompt_tokens = Column(Integer, default=0)  # of prompt_tokens, served from the provider's context cache
+    output_tokens = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)
+    latency_seconds = Column(Float, default=0.0)  # summed; divide by calls for the mean
+    queue_wait_seconds = Column(Float, default=0.0)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("day", "team_id", "endpoint", "model_name", name="uq_llm_usage_daily_key"),
+    )
@@ -98,7 +98,11 @@ export default function Dashboard() {
     setActiveTab('soap');
 
     try {
-      const result = await chartAPI.generateChart({
+      // Show each SOAP section as soon as it has been generated
+      setGeneratedSOAP(null);
+      setClientSummary('');
+      setValidation(null);
+      const result = await chartAPI.generateChartStream({
         pet_id: Number(data.pet_id),
         visit_type: data.visit_type,
         clinical_notes: data.clinical_notes,
@@ -107,6 +111,11 @@ export default function Dashboard() {
         physical_exam: data.physical_exam,
         diagnostic_findings: data.diagnostic_findings,
         style: data.style,
+      }, (section, content) => {
+        setGeneratedSOAP((current) => ({
+          ...(current || { subjective: '', objective: '', assessment: '', plan: '' }),
+          [section]: content,
+        }));
       });
 
       if (result.success) {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useRouter } from 'next/router';
-import { AudioRecorder } from '../components/AudioRecorder';
+import { AudioRecorder, LiveTranscriptionResult } from '../components/AudioRecorder';
 import { useAuth } from '../contexts/AuthContext';
 import { audioAPI, petsAPI } from '../lib/api';
 import toast from 'react-hot-toast';
@@ -66,7 +66,8 @@ export default function RecordPage() {
       });
 
       // Upload audio file
-      const response = await audioAPI.upload(audioFile, selectedPatient);
+      // Recorded during the consult, so it goes ahead of backlog imports
+      const response = await audioAPI.upload(audioFile, selectedPatient, 'live');
       
       toast.success('Recording uploaded successfully! Processing transcription...');
       
@@ -81,6 +82,11 @@ export default function RecordPage() {
     }
   };
 
+  const handleLiveTranscriptionComplete = (result: LiveTranscriptionResult) => {
+    toast.success(result.transcript ? 'Transcription complete!' : 'Recording saved. Processing transcription...');
+    router.push(`/transcription/${result.transcriptionJobId}`);
+  };
+
   const handleRecordingError = (error: string) => {
     toast.error(error);
   };
@@ -211,6 +217,8 @@ export default function RecordPage() {
                 onRecordingComplete={handleRecordingComplete}
                 onError={handleRecordingError}
                 patientId={selectedPatient}
+                liveTranscription
+                onLiveTranscriptionComplete={handleLiveTranscriptionComplete}
               />
             )}
           </div>
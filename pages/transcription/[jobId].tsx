@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useRouter } from 'next/router';
 import { useAuth } from '../../contexts/AuthContext';
-import { audioAPI } from '../../lib/api';
+import { audioAPI, eventsAPI } from '../../lib/api';
 import toast from 'react-hot-toast';
 
 interface TranscriptionJob {
@@ -21,7 +21,7 @@ export default function TranscriptionStatusPage() {
   const { isAuthenticated } = useAuth();
   const [job, setJob] = useState<TranscriptionJob | null>(null);
   const [loading, setLoading] = useState(true);
-  const [polling, setPolling] = useState(true);
+  const [watching, setWatching] = useState(true);
 
   // Redirect if not authenticated
   useEffect(() => {
@@ -38,36 +38,37 @@ export default function TranscriptionStatusPage() {
       const jobData = await audioAPI.getTranscriptionStatus(parseInt(jobId));
       setJob(jobData);
       
-      // Stop polling if job is complete or failed
+      // Stop listening for updates once the job is complete or failed
       if (jobData.status === 'completed' || jobData.status === 'failed') {
-        setPolling(false);
+        setWatching(false);
       }
     } catch (error) {
       console.error('Failed to fetch transcription status:', error);
       toast.error('Failed to load transcription status');
-      setPolling(false);
+      setWatching(false);
     } finally {
       setLoading(false);
     }
   };
 
-  // Initial load and polling
+  // Status updates are pushed by the server; (re)load on connect in case any were missed
   useEffect(() => {
-    if (jobId && isAuthenticated) {
-      fetchTranscriptionStatus();
-    }
-  }, [jobId, isAuthenticated]);
-
-  // Polling effect
-  useEffect(() => {
-    if (!polling) return;
+    if (!watching || !jobId || Array.isArray(jobId) || !isAuthenticated) return;
 
-    const interval = setInterval(() => {
-      fetchTranscriptionStatus();
-    }, 3000); // Poll every 3 seconds
-
-    return () => clearInterval(interval);
-  }, [polling, jobId]);
+    return eventsAPI.subscribe({
+      connected: () => fetchTranscriptionStatus(),
+      resync: () => fetchTranscriptionStatus(),
+      'transcription.updated': (event) => {
+        if (event.data.job_id !== parseInt(jobId)) return;
+        if (event.data.status === 'completed' || event.data.status === 'failed') {
+          // Fetch once more for the transcript itself
+          fetchTranscriptionStatus();
+        } else {
+          setJob(current => current ? { ...current, status: event.data.status } : current);
+        }
+      }
+    });
+  }, [watching, jobId, isAuthenticated]);
 
   // Auto-redirect when completed
   useEffect(() => {
@@ -0,0 +1,151 @@
+"""
+Template prompt compiler for SOAP generation
+Each template, built-in or custom, is compiled once into the static part of
+its generation prompt (instructions, the template's sections and fields, the
+JSON shape to return) and the output schema that answer is read with.
+Compiled prompts are cached by template id and version, so a request only
+appends the patient line and the transcript, or for long transcripts the
+facts extracted from it. Everything that varies comes last, which lets the
+provider reuse the prefix: Gemini caches repeated prompt prefixes on its own,
+and llm_client creates an explicit context cache for prefixes long enough
+to qualify.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from structured_output import SOAP_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+PROMPT_COMPILER_CACHE_SIZE = int(os.getenv("PROMPT_COMPILER_CACHE_SIZE", "256"))
+
+# What a SOAP section holds, for templates that don't describe it
+SECTION_DESCRIPTIONS = {
+    "subjective": "Patient history and owner observations",
+    "objective": "Physical examination findings and vital signs",
+    "assessment": "Clinical assessment and diagnosis",
+    "plan": "Treatment plan and follow-up"
+}
+
+
+class CompiledPrompt:
+    """The static prompt prefix and output schema of one template version"""
+
+    def __init__(self, template_id: str, version: str, prefix: str, schema: Dict[str, type], titles: Dict[str, str]):
+        self.template_id = template_id
+        self.version = version
+        self.prefix = prefix
+        self.schema = schema
+        self.titles = titles  # section type -> the template's title for it
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.template_id}:{self.version}"
+
+    def for_transcript(self, patient_line: str, transcript: str) -> str:
+        return f"{self.prefix}\nPATIENT: {patient_line}\n\nTRANSCRIPT:\n{transcript}\n"
+
+    def for_facts(self, patient_line: str, facts_text: str) -> str:
+        return (
+            f"{self.prefix}\nPATIENT: {patient_line}\n\n"
+            f"EXTRACTED FACTS (in the order they came up in a long transcription of the visit):\n{facts_text}\n"
+        )
+
+
+def _field_line(field: Dict[str, Any]) -> str:
+    notes = ["required" if field.get("required") else "optional"]
+    if field.get("unit") and field["unit"] not in str(field.get("label", "")):
+        notes.append(f"in {field['unit']}")
+    if field.get("options"):
+        notes.append("one of: " + "; ".join(str(option) for option in field["options"]))
+    return f"- {field.get('label') or field.get('name')} ({', '.join(notes)})"
+
+
+class PromptCompiler:
+    def __init__(self, max_entries: int = PROMPT_COMPILER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._compiled: "OrderedDict[Tuple[str, str], CompiledPrompt]" = OrderedDict()
+        self.counts = {"compiled": 0, "hits": 0}
+
+    def compile(self, template: Dict[str, Any]) -> CompiledPrompt:
+        """The compiled prompt for a template from template_service.get_template"""
+        key = (str(template.get("id", "")), str(template.get("version", "")))
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                self.counts["hits"] += 1
+                return compiled
+
+        compiled = self._render(key[0], key[1], template)
+        with self._lock:
+            self._compiled[key] = compiled
+            self.counts["compiled"] += 1
+            while len(self._compiled) > self.max_entries:
+                self._compiled.popitem(last=False)
+        logger.debug(f"Compiled prompt for template {compiled.cache_key} (~{len(compiled.prefix) // 4} tokens)")
+        return compiled
+
+    def _sections(self, template: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The template's SOAP sections in order; the note is always written as SOAP sections"""
+        sections = sorted(
+            (section for section in template.get("sections") or [] if isinstance(section, dict)),
+            key=lambda section: section.get("order") or 0
+        )
+        soap_sections = [section for section in sections if section.get("type") in SOAP_SCHEMA]
+        if len(soap_sections) < len(sections):
+            skipped = [str(section.get("type")) for section in sections if section.get("type") not in SOAP_SCHEMA]
+            logger.warning(f"Template {template.get('id')} has non-SOAP sections, left out of the prompt: {', '.join(skipped)}")
+        return soap_sections or [{"type": section_type, "title": section_type.title()} for section_type in SOAP_SCHEMA]
+
+    def _render(self, template_id: str, version: str, template: Dict[str, Any]) -> CompiledPrompt:
+        sections = self._sections(template)
+        titles = {section["type"]: section.get("title") or section["type"].title() for section in sections}
+        schema = {section["type"]: str for section in sections}
+
+        lines = [
+            "You are a veterinary AI assistant. Write a structured SOAP note"
+            + (f" using the \"{template['name']}\" template" if template.get("name") else "")
+            + " from the visit record at the end of this prompt: a voice transcription of the visit,"
+            " or clinical facts extracted in order from one.",
+            "",
+            "TEMPLATE SECTIONS:"
+        ]
+        for section in sections:
+            section_type = section["type"]
+            description = section.get("description") or SECTION_DESCRIPTIONS[section_type]
+            lines.append("")
+            lines.append(f"{section_type.upper()} - \"{titles[section_type]}\": {description}")
+            fields = [field for field in section.get("fields") or [] if isinstance(field, dict)]
+            if fields:
+                lines.append("Cover, where stated:")
+                lines.extend(_field_line(field) for field in fields)
+
+        lines += [
+            "",
+            "INSTRUCTIONS:",
+            "1. Use ONLY information stated in the visit record",
+            "2. If a required item is not mentioned, write \"Not enough data provided\" for it; leave out optional items that are not mentioned",
+            "3. Do NOT hallucinate or infer information",
+            "4. Use proper veterinary terminology",
+            "5. Write each section as prose covering its items in the order listed; keep every value, dose and unit",
+            "6. Record vital signs in the objective section with their units",
+            "",
+            "Return ONLY a JSON object with this structure:",
+            json.dumps({section_type: f"{titles[section_type]}..." for section_type in schema}, indent=2),
+            ""
+        ]
+        return CompiledPrompt(template_id, version, "\n".join(lines), schema, titles)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"templates": len(self._compiled), "capacity": self.max_entries, **self.counts}
+
+# Global instance
+prompt_compiler = PromptCompiler()
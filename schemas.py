@@ -146,6 +146,8 @@ class ChartGenerationRequest(BaseModel):
     physical_exam: Optional[str] = None
     diagnostic_findings: Optional[str] = None
     style: Optional[str] = "detailed"  # concise, detailed, legal-ready
+    pipeline_mode: Optional[str] = None  # sequential, concurrent, combined (default: CHART_PIPELINE_MODE)
+    deep_validation: Optional[bool] = False  # always have Gemini review completeness
 
 class ChartGenerationResponse(BaseModel):
     success: bool
@@ -153,6 +155,7 @@ class ChartGenerationResponse(BaseModel):
     soap: Optional[SOAPNote] = None
     client_summary: Optional[str] = None
     validation: Optional[Dict[str, Any]] = None
+    pipeline: Optional[Dict[str, Any]] = None  # mode used and per-stage latency
     error: Optional[str] = None
 
 # Audio File schemas
@@ -169,6 +172,10 @@ class AudioFile(AudioFileBase):
     id: int
     user_id: int
     file_path: str
+    content_hash: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    codec: Optional[str] = None
     uploaded_at: datetime
     
     class Config:
@@ -178,6 +185,8 @@ class AudioFileUploadResponse(BaseModel):
     audio_file_id: int
     transcription_job_id: int
     message: str
+    deduplicated: bool = False
+    transcript_reused: bool = False
 
 # Transcription schemas
 class TranscriptionJobBase(BaseModel):
@@ -195,6 +204,9 @@ class TranscriptionJob(TranscriptionJobBase):
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     created_at: datetime
+    priority: int = 1
+    attempts: int = 0
+    next_attempt_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -223,6 +235,15 @@ class Note(NoteBase):
     class Config:
         from_attributes = True
 
+# Bulk SOAP generation schemas
+class SOAPBatchItemRequest(BaseModel):
+    transcription_job_id: int
+    patient_id: int
+
+class SOAPBatchRequest(BaseModel):
+    items: List[SOAPBatchItemRequest] = Field(..., min_length=1)
+    template_type: str = "soap_standard"
+
 # SOAP Section schemas
 class SOAPSectionBase(BaseModel):
     section_type: str  # subjective, objective, assessment, plan
@@ -284,6 +305,8 @@ class ValidationResult(BaseModel):
     completeness_score: float
     missing_elements: List[str]
     suggestions: List[str]
+    source: Optional[str] = None  # local (rule-based) or llm
+    confidence: Optional[float] = None  # local review only
 
 # Medical coding schemas
 class MedicalCoding(BaseModel):
@@ -0,0 +1,258 @@
+"""
+Bulk SOAP generation for Pawscribed
+A batch is a list of (transcription job, patient) pairs. Items are generated
+through SOAPGenerationService concurrently, bounded by a semaphore, and
+started no faster than a token bucket allows, so a batch of fifty takes
+roughly as long as a few single generations without flooding the model
+quota. Each item's status and resulting note are stored and pushed to the
+owner as "soap_batch.updated" events.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import SOAPBatch, SOAPBatchItem, SOAPBatchStatus, TranscriptionJob, AudioFile, User
+from soap_generation_service import soap_generation_service
+from event_hub import event_hub
+
+logger = logging.getLogger(__name__)
+
+# Items generated at once across all batches in this process
+SOAP_BATCH_CONCURRENCY = int(os.getenv("SOAP_BATCH_CONCURRENCY", "8"))
+# Item starts allowed per minute, with bursts of up to SOAP_BATCH_BURST
+SOAP_BATCH_RATE_PER_MINUTE = float(os.getenv("SOAP_BATCH_RATE_PER_MINUTE", "120"))
+SOAP_BATCH_BURST = int(os.getenv("SOAP_BATCH_BURST", "10"))
+SOAP_BATCH_MAX_ITEMS = int(os.getenv("SOAP_BATCH_MAX_ITEMS", "200"))
+
+
+class TokenBucket:
+    """Async token bucket: acquire() waits until a token is available (first come, first served)"""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class SOAPBatchService:
+    def __init__(
+        self,
+        concurrency: int = SOAP_BATCH_CONCURRENCY,
+        rate_per_minute: float = SOAP_BATCH_RATE_PER_MINUTE,
+        burst: int = SOAP_BATCH_BURST
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def create_batch(self, user: User, items: List[Dict[str, int]], template_type: str, db: Session) -> SOAPBatch:
+        """
+        Record a batch. Items whose transcription job doesn't belong to the
+        user fail straight away; the rest are queued.
+        """
+        job_ids = {item["transcription_job_id"] for item in items}
+        owned_jobs = {
+            job_id for (job_id,) in db.query(TranscriptionJob.id)
+            .join(AudioFile, TranscriptionJob.audio_file_id == AudioFile.id)
+            .filter(TranscriptionJob.id.in_(job_ids), AudioFile.user_id == user.id)
+        }
+
+        batch = SOAPBatch(
+            user_id=user.id,
+            template_type=template_type,
+            status=SOAPBatchStatus.PENDING,
+            items_count=len(items)
+        )
+        for item in items:
+            batch_item = SOAPBatchItem(
+                transcription_job_id=item["transcription_job_id"],
+                patient_id=item["patient_id"],
+                status=SOAPBatchStatus.PENDING
+            )
+            if item["transcription_job_id"] not in owned_jobs:
+                batch_item.status = SOAPBatchStatus.FAILED
+                batch_item.error_message = "Transcription job not found"
+                batch_item.completed_at = datetime.utcnow()
+            batch.items.append(batch_item)
+
+        db.add(batch)
+        db.commit()
+        db.refresh(batch)
+        logger.info(f"Created SOAP batch {batch.id} with {len(items)} items for user {user.id}")
+        return batch
+
+    def start(self, batch_id: int, user_id: int) -> None:
+        """Run a batch in the background on the current event loop"""
+        if batch_id in self.tasks:
+            return
+        task = asyncio.create_task(self._run_batch(batch_id, user_id))
+        self.tasks[batch_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(batch_id, None))
+
+    async def resume_incomplete(self) -> None:
+        """Restart batches interrupted by a restart; items that were mid-generation run again"""
+        db = SessionLocal()
+        try:
+            batches = db.query(SOAPBatch).filter(
+                SOAPBatch.status.in_([SOAPBatchStatus.PENDING, SOAPBatchStatus.PROCESSING])
+            ).all()
+            for batch in batches:
+                for item in batch.items:
+                    if item.status == SOAPBatchStatus.PROCESSING:
+                        item.status = SOAPBatchStatus.PENDING
+                        item.started_at = None
+                db.commit()
+                self.start(batch.id, batch.user_id)
+            if batches:
+                logger.info(f"Resumed {len(batches)} SOAP batches")
+        finally:
+            db.close()
+
+    async def _run_batch(self, batch_id: int, user_id: int) -> None:
+        db = SessionLocal()
+        try:
+            batch = db.get(SOAPBatch, batch_id)
+            batch.status = SOAPBatchStatus.PROCESSING
+            batch.started_at = batch.started_at or datetime.utcnow()
+            db.commit()
+            pending = [
+                (item.id, item.transcription_job_id, item.patient_id)
+                for item in batch.items if item.status == SOAPBatchStatus.PENDING
+            ]
+            template_type = batch.template_type
+            self._publish(batch, user_id)
+        finally:
+            db.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            self._run_item(batch_id, item_id, job_id, patient_id, template_type, user_id)
+            for item_id, job_id, patient_id in pending
+        ])
+
+        db = SessionLocal()
+        try:
+            batch = db.get(SOAPBatch, batch_id)
+            succeeded = sum(1 for item in batch.items if item.status == SOAPBatchStatus.COMPLETED)
+            batch.status = SOAPBatchStatus.COMPLETED if succeeded or not batch.items else SOAPBatchStatus.FAILED
+            batch.completed_at = datetime.utcnow()
+            db.commit()
+            self._publish(batch, user_id)
+            logger.info(
+                f"SOAP batch {batch_id} finished: {succeeded}/{len(batch.items)} notes "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        finally:
+            db.close()
+
+    async def _run_item(
+        self,
+        batch_id: int,
+        item_id: int,
+        transcription_job_id: int,
+        patient_id: int,
+        template_type: str,
+        user_id: int
+    ) -> None:
+        async with self.semaphore:
+            await self.bucket.acquire()
+            # No session is held while the model runs; items interleave at every await
+            db = SessionLocal()
+            try:
+                item = db.get(SOAPBatchItem, item_id)
+                item.status = SOAPBatchStatus.PROCESSING
+                item.started_at = datetime.utcnow()
+                db.commit()
+                self._publish(item.batch, user_id, item)
+            except Exception as e:
+                logger.error(f"SOAP batch {batch_id} item {item_id} could not be started: {str(e)}", exc_info=True)
+                return
+            finally:
+                db.close()
+
+            result = await soap_generation_service.generate_soap_detached(
+                transcription_job_id=transcription_job_id,
+                patient_id=patient_id,
+                template_type=template_type,
+                user_id=user_id
+            )
+
+            db = SessionLocal()
+            try:
+                item = db.get(SOAPBatchItem, item_id)
+                if result["success"]:
+                    item.status = SOAPBatchStatus.COMPLETED
+                    item.note_id = result["note_id"]
+                    item.error_message = None
+                else:
+                    item.status = SOAPBatchStatus.FAILED
+                    item.error_message = result["error"]
+                    logger.warning(f"SOAP batch {batch_id} item {item_id} failed: {result['error']}")
+                item.completed_at = datetime.utcnow()
+                db.commit()
+                self._publish(item.batch, user_id, item)
+            except Exception as e:
+                logger.error(f"SOAP batch {batch_id} item {item_id} could not be processed: {str(e)}", exc_info=True)
+            finally:
+                db.close()
+
+    def item_summary(self, item: SOAPBatchItem) -> Dict[str, Any]:
+        return {
+            "id": item.id,
+            "transcription_job_id": item.transcription_job_id,
+            "patient_id": item.patient_id,
+            "status": item.status.value if isinstance(item.status, SOAPBatchStatus) else item.status,
+            "note_id": item.note_id,
+            "error_message": item.error_message,
+            "started_at": item.started_at.isoformat() if item.started_at else None,
+            "completed_at": item.completed_at.isoformat() if item.completed_at else None
+        }
+
+    def batch_summary(self, batch: SOAPBatch, include_items: bool = True) -> Dict[str, Any]:
+        counts = {status.value: 0 for status in SOAPBatchStatus}
+        for item in batch.items:
+            counts[item.status.value if isinstance(item.status, SOAPBatchStatus) else item.status] += 1
+        summary = {
+            "batch_id": batch.id,
+            "status": batch.status.value if isinstance(batch.status, SOAPBatchStatus) else batch.status,
+            "template_type": batch.template_type,
+            "items_count": batch.items_count,
+            "progress": counts,
+            "created_at": batch.created_at.isoformat() if batch.created_at else None,
+            "started_at": batch.started_at.isoformat() if batch.started_at else None,
+            "completed_at": batch.completed_at.isoformat() if batch.completed_at else None
+        }
+        if include_items:
+            summary["items"] = [self.item_summary(item) for item in batch.items]
+        return summary
+
+    def _publish(self, batch: SOAPBatch, user_id: int, item: Optional[SOAPBatchItem] = None) -> None:
+        data = self.batch_summary(batch, include_items=False)
+        if item is not None:
+            data["item"] = self.item_summary(item)
+        event_hub.publish("soap_batch.updated", data, user_id=user_id)
+
+# Global instance
+soap_batch_service = SOAPBatchService()
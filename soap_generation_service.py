@@ -1,19 +1,123 @@
 import json
-import re
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Optional, Union
 from datetime import datetime
 from sqlalchemy.orm import Session
 
+from database import SessionLocal
 from models import Note, SOAPSection, Pet, TranscriptionJob, NoteStatus, Template
-from gemini_service import GeminiService
+from gemini_service import gemini_service
 from template_service import template_service
+from structured_output import extract_json_object, validate, parse_sections, SOAP_SCHEMA
+from vitals_extraction import vitals_extractor
+from soap_validator import soap_validator
 
 logger = logging.getLogger(__name__)
 
 class SOAPGenerationService:
     def __init__(self):
-        self.gemini_service = GeminiService()
+        self.gemini_service = gemini_service
+    
+    def _load_context(self, transcription_job_id: int, patient_id: int, template_type: str, user_id: int, db: Session) -> Dict[str, Any]:
+        """The generation context for a job, or {"success": False, "error"} if it can't be built"""
+        # Get transcription job
+        transcription_job = db.query(TranscriptionJob).filter(
+            TranscriptionJob.id == transcription_job_id
+        ).first()
+        
+        if not transcription_job:
+            return {"success": False, "error": "Transcription job not found"}
+        
+        if transcription_job.status != "completed":
+            return {"success": False, "error": "Transcription not completed yet"}
+        
+        # Get patient information
+        patient = db.query(Pet).filter(Pet.id == patient_id).first()
+        if not patient:
+            return {"success": False, "error": "Patient not found"}
+        
+        # Get template (built-in, or one of the user's custom templates)
+        template = template_service.get_template(template_type, db, user_id)
+        if not template:
+            return {"success": False, "error": f"Template '{template_type}' not found"}
+        
+        logger.info(f"Generating SOAP note for patient {patient.name} using template {template_type}")
+        
+        # Prepare context for AI generation
+        return {
+            "success": True,
+            "transcript": transcription_job.transcript,
+            "patient": {
+                "name": patient.name,
+                "species": patient.species,
+                "breed": patient.breed,
+                "age": patient.age,
+                "sex": patient.sex,
+                "weight": patient.weight
+            },
+            "template": template,
+            "confidence_score": transcription_job.confidence_score,
+            "transcription_job_id": transcription_job.id
+        }
+    
+    def _save_note(
+        self,
+        context: Dict[str, Any],
+        soap_result: Dict[str, Any],
+        patient_id: int,
+        template_type: str,
+        user_id: int,
+        db: Session
+    ) -> Dict[str, Any]:
+        """Create the note and its SOAP sections from generated content"""
+        # Create note record
+        note = Note(
+            user_id=user_id,
+            patient_id=patient_id,
+            transcription_job_id=context["transcription_job_id"],
+            title=f"SOAP Note - {context['patient']['name']} - {datetime.utcnow().strftime('%Y-%m-%d')}",
+            note_type=template_type,
+            status=NoteStatus.AVAILABLE_FOR_REVIEW,
+            original_transcript=context["transcript"],
+            generated_content=json.dumps(soap_result["soap_data"])
+        )
+        
+        db.add(note)
+        db.commit()
+        db.refresh(note)
+        
+        # Create SOAP section records
+        sections_created = []
+        for section_data in soap_result["soap_data"]["sections"]:
+            soap_section = SOAPSection(
+                note_id=note.id,
+                section_type=section_data["type"],
+                content=section_data["content"],
+                order_index=section_data["order"],
+                temperature=section_data.get("vitals", {}).get("temperature"),
+                heart_rate=section_data.get("vitals", {}).get("heart_rate"),
+                respiratory_rate=section_data.get("vitals", {}).get("respiratory_rate"),
+                weight=section_data.get("vitals", {}).get("weight")
+            )
+            
+            db.add(soap_section)
+            sections_created.append(soap_section)
+        
+        db.commit()
+        
+        # Refresh sections to get IDs
+        for section in sections_created:
+            db.refresh(section)
+        
+        logger.info(f"Created SOAP note {note.id} with {len(sections_created)} sections")
+        
+        return {
+            "success": True,
+            "note_id": note.id,
+            "soap_data": soap_result["soap_data"],
+            "confidence_score": context["confidence_score"],
+            "sections_created": len(sections_created)
+        }
     
     async def generate_soap_from_transcription(
         self,
@@ -25,43 +129,9 @@ class SOAPGenerationService:
     ) -> Dict[str, Any]:
         """Generate a complete SOAP note from a transcription job"""
         try:
-            # Get transcription job
-            transcription_job = db.query(TranscriptionJob).filter(
-                TranscriptionJob.id == transcription_job_id
-            ).first()
-            
-            if not transcription_job:
-                return {"success": False, "error": "Transcription job not found"}
-            
-            if transcription_job.status != "completed":
-                return {"success": False, "error": "Transcription not completed yet"}
-            
-            # Get patient information
-            patient = db.query(Pet).filter(Pet.id == patient_id).first()
-            if not patient:
-                return {"success": False, "error": "Patient not found"}
-            
-            # Get template
-            template = template_service.get_template(template_type)
-            if not template:
-                return {"success": False, "error": f"Template '{template_type}' not found"}
-            
-            logger.info(f"Generating SOAP note for patient {patient.name} using template {template_type}")
-            
-            # Prepare context for AI generation
-            context = {
-                "transcript": transcription_job.transcript,
-                "patient": {
-                    "name": patient.name,
-                    "species": patient.species,
-                    "breed": patient.breed,
-                    "age": patient.age,
-                    "sex": patient.sex,
-                    "weight": patient.weight
-                },
-                "template": template,
-                "confidence_score": transcription_job.confidence_score
-            }
+            context = self._load_context(transcription_job_id, patient_id, template_type, user_id, db)
+            if not context["success"]:
+                return context
             
             # Generate SOAP sections using AI
             soap_result = await self._generate_soap_with_ai(context)
@@ -69,266 +139,194 @@ class SOAPGenerationService:
             if not soap_result["success"]:
                 return soap_result
             
-            # Create note record
-            note = Note(
-                user_id=user_id,
-                patient_id=patient_id,
-                transcription_job_id=transcription_job_id,
-                title=f"SOAP Note - {patient.name} - {datetime.utcnow().strftime('%Y-%m-%d')}",
-                note_type=template_type,
-                status=NoteStatus.AVAILABLE_FOR_REVIEW,
-                original_transcript=transcription_job.transcript,
-                generated_content=json.dumps(soap_result["soap_data"])
-            )
+            return self._save_note(context, soap_result, patient_id, template_type, user_id, db)
             
-            db.add(note)
-            db.commit()
-            db.refresh(note)
+        except Exception as e:
+            logger.error(f"SOAP generation failed: {str(e)}", exc_info=True)
+            return {"success": False, "error": str(e)}
+    
+    async def generate_soap_detached(
+        self,
+        transcription_job_id: int,
+        patient_id: int,
+        template_type: str,
+        user_id: int
+    ) -> Dict[str, Any]:
+        """
+        generate_soap_from_transcription for background work: sessions are open
+        to load the context and to save the note, not while the model runs
+        """
+        try:
+            db = SessionLocal()
+            try:
+                context = self._load_context(transcription_job_id, patient_id, template_type, user_id, db)
+            finally:
+                db.close()
+            if not context["success"]:
+                return context
             
-            # Create SOAP section records
-            sections_created = []
-            for section_data in soap_result["soap_data"]["sections"]:
-                soap_section = SOAPSection(
-                    note_id=note.id,
-                    section_type=section_data["type"],
-                    content=section_data["content"],
-                    order_index=section_data["order"],
-                    temperature=section_data.get("vitals", {}).get("temperature"),
-                    heart_rate=section_data.get("vitals", {}).get("heart_rate"),
-                    respiratory_rate=section_data.get("vitals", {}).get("respiratory_rate"),
-                    weight=section_data.get("vitals", {}).get("weight")
-                )
-                
-                db.add(soap_section)
-                sections_created.append(soap_section)
+            soap_result = await self._generate_soap_with_ai(context)
+            if not soap_result["success"]:
+                return soap_result
             
-            db.commit()
+            db = SessionLocal()
+            try:
+                return self._save_note(context, soap_result, patient_id, template_type, user_id, db)
+            finally:
+                db.close()
             
-            # Refresh sections to get IDs
-            for section in sections_created:
-                db.refresh(section)
+        except Exception as e:
+            logger.error(f"SOAP generation failed: {str(e)}", exc_info=True)
+            return {"success": False, "error": str(e)}
+    
+    async def stream_soap_from_transcription(
+        self,
+        transcription_job_id: int,
+        patient_id: int,
+        template_type: str,
+        user_id: int,
+        db: Session
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        generate_soap_from_transcription with the model output streamed: yields
+        {"type": "section", "section", "content"} as each SOAP section is
+        generated, then {"type": "result", "result"} with what
+        generate_soap_from_transcription would have returned
+        """
+        try:
+            context = self._load_context(transcription_job_id, patient_id, template_type, user_id, db)
+            if not context["success"]:
+                yield {"type": "result", "result": context}
+                return
             
-            logger.info(f"Created SOAP note {note.id} with {len(sections_created)} sections")
+            response = None
+            async for event in self.gemini_service.stream_soap_from_transcript(
+                context["transcript"],
+                context["patient"],
+                context["template"],
+                cache_scope=f"transcription:{context['transcription_job_id']}"
+            ):
+                if event["type"] == "section":
+                    yield event
+                else:
+                    response = event["result"]
             
-            return {
-                "success": True,
-                "note_id": note.id,
-                "soap_data": soap_result["soap_data"],
-                "confidence_score": transcription_job.confidence_score,
-                "sections_created": len(sections_created)
-            }
+            soap_result = self._structure_ai_response(response, context)
+            if not soap_result["success"]:
+                yield {"type": "result", "result": soap_result}
+                return
+            
+            yield {"type": "result", "result": self._save_note(context, soap_result, patient_id, template_type, user_id, db)}
             
         except Exception as e:
             logger.error(f"SOAP generation failed: {str(e)}", exc_info=True)
-            return {"success": False, "error": str(e)}
+            yield {"type": "result", "result": {"success": False, "error": str(e)}}
     
     async def _generate_soap_with_ai(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """Use AI to generate structured SOAP content"""
         try:
-            # Create specialized prompt for SOAP generation
-            prompt = self._create_soap_generation_prompt(context)
-            
             # Call Gemini API
             response = await self.gemini_service.generate_soap_from_transcript(
                 context["transcript"],
                 context["patient"],
-                context["template"]
-            )
-            
-            if not response["success"]:
-                return response
-            
-            # Parse and structure the AI response
-            soap_data = self._parse_ai_soap_response(
-                response["soap_content"],
-                context["template"]
+                context["template"],
+                cache_scope=f"transcription:{context['transcription_job_id']}"
             )
             
-            # Validate generated content
-            validation_result = self._validate_soap_content(soap_data, context)
-            
-            return {
-                "success": True,
-                "soap_data": soap_data,
-                "validation": validation_result
-            }
+            return self._structure_ai_response(response, context)
             
         except Exception as e:
             logger.error(f"AI SOAP generation failed: {str(e)}", exc_info=True)
             return {"success": False, "error": str(e)}
     
-    def _create_soap_generation_prompt(self, context: Dict[str, Any]) -> str:
-        """Create a specialized prompt for SOAP note generation"""
-        patient = context["patient"]
-        template = context["template"]
-        transcript = context["transcript"]
+    def _structure_ai_response(self, response: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse, structure and validate Gemini's SOAP content"""
+        if not response or not response["success"]:
+            return response or {"success": False, "error": "No response from model"}
         
-        prompt = f"""
-You are a veterinary AI assistant specializing in creating structured SOAP notes from voice transcriptions.
-
-PATIENT INFORMATION:
-- Name: {patient["name"]}
-- Species: {patient["species"]}
-- Breed: {patient.get("breed", "Unknown")}
-- Age: {patient.get("age", "Unknown")} years
-- Sex: {patient.get("sex", "Unknown")}
-- Weight: {patient.get("weight", "Unknown")} lbs
-
-TRANSCRIPT TO ANALYZE:
-{transcript}
-
-TEMPLATE STRUCTURE:
-Create a SOAP note following this structure:
-"""
+        # Parse and structure the AI response
+        soap_data = self._parse_ai_soap_response(
+            response["soap_content"],
+            context["template"],
+            species=context["patient"].get("species")
+        )
         
-        # Add template sections to prompt
-        for section in template["sections"]:
-            prompt += f"\n\n{section['title'].upper()} ({section['type']}):"
-            prompt += f"\n{section.get('description', '')}"
-            
-            # Add expected fields
-            if "fields" in section:
-                prompt += "\nExpected information:"
-                for field in section["fields"]:
-                    if field.get("required", False):
-                        prompt += f"\n- {field['label']} (REQUIRED)"
+        # Same ValidationResult checks as chart validation, on the sections' text
+        soap_text: Dict[str, str] = {}
+        for section in soap_data.get("sections", []):
+            if isinstance(section, dict) and section.get("type") and section.get("content"):
+                section_type = section["type"]
+                content = str(section["content"])
+                soap_text[section_type] = f"{soap_text[section_type]}\n{content}" if section_type in soap_text else content
+        validation_result = soap_validator.validate(soap_text)
+        
+        return {
+            "success": True,
+            "soap_data": soap_data,
+            "validation": validation_result
+        }
+    
+    def _parse_ai_soap_response(self, ai_response: Union[str, Dict[str, Any]], template: Dict[str, Any],
+                                species: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Parse AI response into structured SOAP data. Accepts the flat SOAP
+        object Gemini returns, a {"sections": [...]} object, or raw text.
+        """
+        if isinstance(ai_response, dict):
+            data = ai_response
+        else:
+            data, method = extract_json_object(ai_response)
+            if data is not None and method != "json":
+                logger.info(f"Recovered SOAP JSON from malformed response ({method})")
+        
+        if isinstance(data, dict) and isinstance(data.get("sections"), list):
+            for section in data["sections"]:
+                if isinstance(section, dict) and section.get("type") == "objective":
+                    # Model-reported vitals are range-checked; missing ones are read from the text
+                    vitals = self._extract_vitals_from_text(str(section.get("content") or ""), species)
+                    vitals.update(vitals_extractor.filter_plausible(section.get("vitals") or {}, species))
+                    if vitals:
+                        section["vitals"] = vitals
                     else:
-                        prompt += f"\n- {field['label']} (optional)"
+                        section.pop("vitals", None)
+            return data
         
-        prompt += """
-
-IMPORTANT INSTRUCTIONS:
-1. Extract ONLY information that is clearly stated in the transcript
-2. If information is not provided, write "Not enough data provided" or "Not mentioned"
-3. DO NOT hallucinate or infer information not present in the transcript
-4. Use proper veterinary terminology
-5. Organize information logically within each SOAP section
-6. Include vital signs in the Objective section if mentioned
-7. Be concise but comprehensive
-8. Maintain professional medical language
-
-Return the SOAP note in this JSON format:
-{
-  "sections": [
-    {
-      "type": "subjective",
-      "title": "Subjective",
-      "content": "Patient history and owner observations...",
-      "order": 1
-    },
-    {
-      "type": "objective",
-      "title": "Objective",
-      "content": "Physical examination findings...",
-      "order": 2,
-      "vitals": {
-        "temperature": 101.5,
-        "heart_rate": 120,
-        "respiratory_rate": 24,
-        "weight": 45.2
-      }
-    },
-    {
-      "type": "assessment",
-      "title": "Assessment",
-      "content": "Clinical assessment and diagnosis...",
-      "order": 3
-    },
-    {
-      "type": "plan",
-      "title": "Plan",
-      "content": "Treatment plan and follow-up...",
-      "order": 4
-    }
-  ],
-  "summary": "Brief summary of the case",
-  "completeness_score": 0.85
-}
-"""
+        if isinstance(data, dict):
+            soap, _ = validate(data, SOAP_SCHEMA)
+            if soap and any(str(soap.get(section, "")).strip() for section in SOAP_SCHEMA):
+                return self._sections_from_soap(soap, species, template)
         
-        return prompt
+        # Fallback: parse structured text
+        logger.warning("No SOAP JSON in response, using text parsing")
+        return self._parse_structured_text_response(ai_response if isinstance(ai_response, str) else "", template, species)
     
-    def _parse_ai_soap_response(self, ai_response: str, template: Dict[str, Any]) -> Dict[str, Any]:
-        """Parse AI response into structured SOAP data"""
-        try:
-            # Try to extract JSON from response
-            json_match = re.search(r'{.*}', ai_response, re.DOTALL)
-            if json_match:
-                soap_data = json.loads(json_match.group())
-                return soap_data
-            
-            # Fallback: parse structured text
-            return self._parse_structured_text_response(ai_response, template)
-            
-        except json.JSONDecodeError:
-            logger.warning("Failed to parse JSON response, using text parsing")
-            return self._parse_structured_text_response(ai_response, template)
-    
-    def _parse_structured_text_response(self, response: str, template: Dict[str, Any]) -> Dict[str, Any]:
+    def _parse_structured_text_response(self, response: str, template: Dict[str, Any],
+                                        species: Optional[str] = None) -> Dict[str, Any]:
         """Parse structured text response into SOAP sections"""
+        return self._sections_from_soap(parse_sections(response), species, template)
+    
+    def _sections_from_soap(self, soap: Dict[str, str], species: Optional[str] = None,
+                            template: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Section records, in SOAP order and titled as in the template, for the sections that have content"""
+        titles = {section.get("type"): section.get("title") for section in (template or {}).get("sections") or []
+                  if isinstance(section, dict)}
         sections = []
-        
-        # Common section headers to look for
-        section_patterns = {
-            "subjective": ["SUBJECTIVE", "S:", "History", "Chief Complaint"],
-            "objective": ["OBJECTIVE", "O:", "Physical Exam", "Examination"],
-            "assessment": ["ASSESSMENT", "A:", "Diagnosis", "Assessment"],
-            "plan": ["PLAN", "P:", "Treatment", "Recommendations"]
-        }
-        
-        current_section = None
-        current_content = []
-        
-        lines = response.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
+        for section_type in SOAP_SCHEMA:
+            content = (soap.get(section_type) or "").strip()
+            if not content:
                 continue
-            
-            # Check if line is a section header
-            section_found = None
-            for section_type, patterns in section_patterns.items():
-                for pattern in patterns:
-                    if pattern.lower() in line.lower():
-                        section_found = section_type
-                        break
-                if section_found:
-                    break
-            
-            if section_found:
-                # Save previous section
-                if current_section and current_content:
-                    sections.append({
-                        "type": current_section,
-                        "title": current_section.title(),
-                        "content": "\n".join(current_content).strip(),
-                        "order": len(sections) + 1
-                    })
-                
-                # Start new section
-                current_section = section_found
-                current_content = []
-            else:
-                # Add to current section content
-                if current_section:
-                    current_content.append(line)
-        
-        # Don't forget the last section
-        if current_section and current_content:
-            sections.append({
-                "type": current_section,
-                "title": current_section.title(),
-                "content": "\n".join(current_content).strip(),
+            section = {
+                "type": section_type,
+                "title": titles.get(section_type) or section_type.title(),
+                "content": content,
                 "order": len(sections) + 1
-            })
-        
-        # Extract vital signs from objective section
-        for section in sections:
-            if section["type"] == "objective":
-                vitals = self._extract_vitals_from_text(section["content"])
+            }
+            # Extract vital signs from objective section
+            if section_type == "objective":
+                vitals = self._extract_vitals_from_text(content, species)
                 if vitals:
                     section["vitals"] = vitals
+            sections.append(section)
         
         return {
             "sections": sections,
@@ -336,122 +334,9 @@ Return the SOAP note in this JSON format:
             "completeness_score": len(sections) / 4.0  # Simple completeness based on sections
         }
     
-    def _extract_vitals_from_text(self, text: str) -> Dict[str, float]:
-        """Extract vital signs from text using regex patterns"""
-        vitals = {}
-        
-        # Temperature patterns
-        temp_patterns = [
-            r'temperature[^\d]*([0-9.]+)(?:\s*[°f])',
-            r'temp[^\d]*([0-9.]+)(?:\s*[°f])',
-            r'([0-9.]+)\s*[°f]'
-        ]
-        
-        for pattern in temp_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                try:
-                    vitals["temperature"] = float(match.group(1))
-                    break
-                except ValueError:
-                    continue
-        
-        # Heart rate patterns
-        hr_patterns = [
-            r'heart\s+rate[^\d]*([0-9]+)',
-            r'hr[^\d]*([0-9]+)',
-            r'pulse[^\d]*([0-9]+)'
-        ]
-        
-        for pattern in hr_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                try:
-                    vitals["heart_rate"] = int(match.group(1))
-                    break
-                except ValueError:
-                    continue
-        
-        # Respiratory rate patterns
-        rr_patterns = [
-            r'respiratory\s+rate[^\d]*([0-9]+)',
-            r'respiration[^\d]*([0-9]+)',
-            r'rr[^\d]*([0-9]+)',
-            r'breathing[^\d]*([0-9]+)'
-        ]
-        
-        for pattern in rr_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                try:
-                    vitals["respiratory_rate"] = int(match.group(1))
-                    break
-                except ValueError:
-                    continue
-        
-        # Weight patterns
-        weight_patterns = [
-            r'weight[^\d]*([0-9.]+)(?:\s*(?:lbs?|pounds?))?',
-            r'weighs[^\d]*([0-9.]+)(?:\s*(?:lbs?|pounds?))?',
-            r'([0-9.]+)\s*(?:lbs?|pounds?)'
-        ]
-        
-        for pattern in weight_patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                try:
-                    vitals["weight"] = float(match.group(1))
-                    break
-                except ValueError:
-                    continue
-        
-        return vitals
-    
-    def _validate_soap_content(self, soap_data: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate generated SOAP content"""
-        validation = {
-            "completeness_score": 0.0,
-            "missing_sections": [],
-            "quality_issues": [],
-            "suggestions": []
-        }
-        
-        required_sections = ["subjective", "objective", "assessment", "plan"]
-        found_sections = [s["type"] for s in soap_data.get("sections", [])]
-        
-        # Check for missing sections
-        for section in required_sections:
-            if section not in found_sections:
-                validation["missing_sections"].append(section)
-        
-        # Calculate completeness score
-        section_score = len(found_sections) / len(required_sections)
-        
-        # Check content quality
-        total_content_length = 0
-        for section in soap_data.get("sections", []):
-            content = section.get("content", "")
-            total_content_length += len(content)
-            
-            # Check for placeholder text
-            if "not enough data" in content.lower() or "not mentioned" in content.lower():
-                validation["quality_issues"].append(f"Limited information in {section['type']} section")
-        
-        # Content quality score based on length and completeness
-        content_score = min(1.0, total_content_length / 500)  # Expect at least 500 chars total
-        
-        validation["completeness_score"] = (section_score + content_score) / 2
-        
-        # Add suggestions
-        if validation["completeness_score"] < 0.7:
-            validation["suggestions"].append("Consider recording additional clinical information")
-        
-        if "objective" in found_sections:
-            obj_section = next(s for s in soap_data["sections"] if s["type"] == "objective")
-            if not obj_section.get("vitals"):
-                validation["suggestions"].append("Include vital signs in the objective section")
-        
-        return validation
+    def _extract_vitals_from_text(self, text: str, species: Optional[str] = None) -> Dict[str, float]:
+        """Vital signs in stored units (°F, bpm, breaths/min, lb), plausible for the species"""
+        return vitals_extractor.extract(text, species)
     
     def get_note_with_sections(self, note_id: int, db: Session) -> Dict[str, Any]:
         """Get a complete note with all its SOAP sections"""
@@ -0,0 +1,88 @@
+"""
+Incremental SOAP parsing for streamed model output
+The model answers with a JSON object of SOAP sections. SOAPStreamParser reads
+the response as it arrives and reports each top-level string field the moment
+its closing quote is seen, so a section can be shown before the rest of the
+note has been generated. Anything outside the outermost braces (code fences,
+preamble) is ignored; the complete text is still parsed the usual way at the end.
+"""
+
+import json
+from typing import List, Tuple, Iterable, Optional
+
+SOAP_SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+
+class SOAPStreamParser:
+    def __init__(self, fields: Iterable[str] = SOAP_SECTIONS):
+        self.fields = set(fields)
+        self.emitted: List[str] = []
+        self._chunks: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string: List[str] = []
+        self._key: Optional[str] = None
+        self._awaiting_value = False
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Consume a chunk; returns the (field, value) pairs it completed"""
+        self._chunks.append(chunk)
+        completed = []
+        for char in chunk:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    field = self._end_string()
+                    if field:
+                        completed.append(field)
+                    continue
+                if self._depth == 1:
+                    self._string.append(char)
+            elif self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+                self._escaped = False
+                self._string = []
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    # A nested value: not a section we can show on its own
+                    self._awaiting_value = False
+            elif char in "}]":
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == ":":
+                    self._awaiting_value = True
+                elif char == ",":
+                    self._awaiting_value = False
+                    self._key = None
+        return completed
+
+    def _end_string(self) -> Optional[Tuple[str, str]]:
+        if self._depth != 1:
+            return None
+        try:
+            value = json.loads('"' + "".join(self._string) + '"')
+        except json.JSONDecodeError:
+            value = "".join(self._string)
+        if not self._awaiting_value:
+            self._key = value.lower()
+            return None
+
+        self._awaiting_value = False
+        if self._key in self.fields and self._key not in self.emitted:
+            self.emitted.append(self._key)
+            return self._key, value
+        return None
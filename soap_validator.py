@@ -0,0 +1,160 @@
+"""
+Local completeness review for SOAP notes
+Checks the same things the Gemini review is asked about (vital signs, a
+diagnosis or differentials, medication dosages, follow-up instructions and
+owner communication) with precompiled patterns, in microseconds. Each check
+is "present", "absent" (the section is empty or a placeholder, or clearly
+lacks it) or "unclear" (there is text the patterns don't recognize). The
+share of checks that aren't unclear is the confidence; below
+SOAP_LOCAL_VALIDATION_MIN_CONFIDENCE the note is worth a Gemini review.
+Results have the ValidationResult shape, like the Gemini review's.
+"""
+
+import os
+import re
+from typing import Dict, Any, List, Tuple
+
+from vitals_extraction import vitals_extractor
+
+SOAP_LOCAL_VALIDATION_MIN_CONFIDENCE = float(os.getenv("SOAP_LOCAL_VALIDATION_MIN_CONFIDENCE", "0.8"))
+
+PRESENT, ABSENT, UNCLEAR = "present", "absent", "unclear"
+
+# Sections longer than this that don't match a check are "unclear" rather than "absent"
+UNCLEAR_MIN_CHARS = 200
+
+PLACEHOLDER = re.compile(
+    r"^\W*(?:not (?:documented|mentioned|provided|recorded|assessed)|not enough data(?: provided)?|"
+    r"none(?: noted| documented)?|n/?a|no \w+(?: \w+)? (?:documented|provided|recorded))\W*$",
+    re.IGNORECASE
+)
+
+# Vitals the note should record, by the names the extractor stores them under
+VITAL_NAMES = {
+    "temperature": "temperature",
+    "heart_rate": "heart rate",
+    "respiratory_rate": "respiratory rate",
+    "weight": "weight",
+}
+DIAGNOSIS = re.compile(
+    r"\b(?:diagnos\w*|dx|ddx|differentials?|r/o|rule[sd]? out|suspect\w*|consistent with|likely|probabl[ey]|"
+    r"presumptive|tentative|healthy|normal (?:exam|examination)|rupture|fracture|injury|infection|infestation|disease|"
+    r"syndrome|disorder|deficiency|failure|mass|tumou?r|laceration|abscess|obstruction|allerg\w*|parasit\w*|"
+    r"\w+(?:itis|osis|emia|pathy|oma|algia))\b",
+    re.IGNORECASE
+)
+DOSAGE = re.compile(
+    r"\b\d+(?:\.\d+)?\s*(?:mg|mcg|µg|ug|g|ml|cc|units?|iu|tabs?|tablets?|caps?|capsules?)(?:\s*/\s*(?:kg|lb))?\b",
+    re.IGNORECASE
+)
+FREQUENCY = re.compile(
+    r"\b(?:sid|bid|tid|qid|eod|prn|q\s?\d{1,2}\s?h(?:rs?|ours?)?|once|twice|three times|daily|every \d+ hours?|"
+    r"(?:once|single) dose|x\s?\d+\s?d(?:ays?)?)\b",
+    re.IGNORECASE
+)
+MEDICATION = re.compile(
+    r"\b(?:prescrib\w*|dispens\w*|administer\w*|medications?|meds|antibiotics?|nsaids?|injections?|"
+    r"\w+(?:cillin|cycline|floxacin|profen|oxicam|coxib|pitant|olone|sone|azole|mycin|prazole|setron|pam|tidine|"
+    r"mectin|pentin|adol|micin|ulfa))\b",
+    re.IGNORECASE
+)
+FOLLOW_UP = re.compile(
+    r"\b(?:re-?check|follow[- ]?up|return (?:in|if|for|to)|revisit|re-?evaluat\w*|re-?assess\w*|call (?:if|us|the clinic|back)|"
+    r"monitor\w*|schedul\w*|in \d+\s*(?:days?|weeks?|months?)|next visit|suture removal)\b",
+    re.IGNORECASE
+)
+OWNER = re.compile(r"\b(?:owners?|clients?)\b", re.IGNORECASE)
+OWNER_COMMUNICATION = re.compile(
+    r"\b(?:owners?|clients?)\b[^.\n]{0,60}?\b(?:discuss|advis|inform|instruct|educat|explain|consent|agree|understood|"
+    r"understands|declin|elect|call)\w*|\b(?:discuss|advis|inform|instruct|educat|explain|review)\w*\b[^.\n]{0,40}?"
+    r"\b(?:owners?|clients?)\b",
+    re.IGNORECASE
+)
+
+
+def _has_content(text: str) -> bool:
+    text = (text or "").strip()
+    return bool(text) and not PLACEHOLDER.match(text)
+
+
+class LocalSOAPValidator:
+    def __init__(self, min_confidence: float = SOAP_LOCAL_VALIDATION_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+
+    def _vitals(self, objective: str) -> Tuple[str, float, List[str], List[str]]:
+        if not _has_content(objective):
+            return ABSENT, 0.0, ["vital signs"], ["Record temperature, heart rate, respiratory rate and weight"]
+        found = vitals_extractor.extract(objective)
+        missing = [name for vital, name in VITAL_NAMES.items() if vital not in found]
+        if not missing:
+            return PRESENT, 1.0, [], []
+        if len(missing) == len(VITAL_NAMES):
+            status = UNCLEAR if len(objective) >= UNCLEAR_MIN_CHARS else ABSENT
+            return status, 0.0, ["vital signs"], ["Record temperature, heart rate, respiratory rate and weight"]
+        # Some vitals recorded: a partial credit, and say which are missing
+        return PRESENT, 0.5, missing, [f"Add {', '.join(missing)} to the objective section"]
+
+    def _diagnosis(self, assessment: str) -> Tuple[str, float, List[str], List[str]]:
+        if not _has_content(assessment):
+            return ABSENT, 0.0, ["diagnosis"], ["State a diagnosis or list differential diagnoses"]
+        if DIAGNOSIS.search(assessment):
+            return PRESENT, 1.0, [], []
+        # An assessment without the usual wording may still name the problem
+        return UNCLEAR, 0.5, [], ["Make the diagnosis or differentials explicit in the assessment"]
+
+    def _dosages(self, plan: str) -> Tuple[str, float, List[str], List[str]]:
+        if not _has_content(plan):
+            return ABSENT, 0.0, ["treatment plan"], ["Document the treatment plan"]
+        if DOSAGE.search(plan):
+            if FREQUENCY.search(plan):
+                return PRESENT, 1.0, [], []
+            return PRESENT, 0.5, ["medication frequency"], ["Specify how often each medication is given"]
+        if MEDICATION.search(plan):
+            return ABSENT, 0.0, ["medication dosages"], ["Specify medication dosages and frequency"]
+        # No medication in the plan: nothing to dose
+        return PRESENT, 1.0, [], []
+
+    def _follow_up(self, plan: str) -> Tuple[str, float, List[str], List[str]]:
+        if _has_content(plan) and FOLLOW_UP.search(plan):
+            return PRESENT, 1.0, [], []
+        status = UNCLEAR if len(plan or "") >= UNCLEAR_MIN_CHARS else ABSENT
+        return status, 0.0, ["follow-up instructions"], ["Add recheck timing or when the owner should return"]
+
+    def _owner_communication(self, text: str) -> Tuple[str, float, List[str], List[str]]:
+        if OWNER_COMMUNICATION.search(text):
+            return PRESENT, 1.0, [], []
+        status = UNCLEAR if OWNER.search(text) else ABSENT
+        return status, 0.0, ["owner communication"], ["Document what was discussed with the owner"]
+
+    def validate(self, soap_data: Dict[str, Any]) -> Dict[str, Any]:
+        """ValidationResult for a note, with source "local" and the checks' confidence"""
+        subjective, objective, assessment, plan = (
+            str(soap_data.get(section) or "") for section in ("subjective", "objective", "assessment", "plan")
+        )
+        checks = [
+            self._vitals(objective),
+            self._diagnosis(assessment),
+            self._dosages(plan),
+            self._follow_up(plan),
+            self._owner_communication("\n".join((subjective, assessment, plan)))
+        ]
+        missing_elements: List[str] = []
+        suggestions: List[str] = []
+        for _, _, missing, suggested in checks:
+            missing_elements.extend(missing)
+            suggestions.extend(suggested)
+        unclear = sum(1 for status, _, _, _ in checks if status == UNCLEAR)
+        return {
+            "completeness_score": round(sum(score for _, score, _, _ in checks) / len(checks), 2),
+            "missing_elements": missing_elements,
+            "suggestions": suggestions,
+            "source": "local",
+            "confidence": round(1 - unclear / len(checks), 2)
+        }
+
+    def needs_review(self, result: Dict[str, Any]) -> bool:
+        """Whether the local result is too uncertain to stand without a Gemini review"""
+        return result.get("confidence", 0.0) < self.min_confidence
+
+# Global instance
+soap_validator = LocalSOAPValidator()
@@ -0,0 +1,281 @@
+"""
+Speech recognition backends for Pawscribed
+Lets the transcription pipeline run against Google Cloud Speech-to-Text or an
+in-process simulated recognizer (for load tests and local development)
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from typing import Dict, Any, Optional, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Google closes a streaming request after ~305s of audio; reopen before that
+STREAM_RESTART_SECONDS = int(os.getenv("SPEECH_STREAM_RESTART_SECONDS", "280"))
+
+# Common veterinary terms used as recognition hints
+VETERINARY_PHRASES = [
+    "SOAP", "subjective", "objective", "assessment", "plan",
+    "temperature", "heart rate", "respiratory rate", "weight",
+    "vaccination", "spay", "neuter", "anesthesia",
+    "CBC", "chemistry panel", "radiograph", "ultrasound",
+    "prescription", "medication", "dosage", "treatment",
+    "examination", "palpation", "auscultation",
+    "canine", "feline", "dog", "cat", "puppy", "kitten",
+    "abdomen", "thorax", "lymph nodes", "mucous membranes",
+    "capillary refill time", "body condition score"
+]
+
+
+class SpeechBackend:
+    """
+    Interface for speech recognizers.
+    recognize() is blocking and is always called off the event loop. It returns
+    {"transcript": str, "confidence": float, "words": [{"word", "start", "end", "confidence"}]}
+    with word times in seconds relative to the start of the supplied audio.
+    """
+
+    name = "base"
+
+    def recognize(self, content: bytes, encoding: str, sample_rate: int, channels: int = 1) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def streaming_recognize(self, chunks: Iterable[bytes], sample_rate: int, channels: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        Recognize raw 16-bit PCM as it arrives. Blocking; consumes chunks until
+        the iterable ends and yields {"transcript", "is_final", "confidence"}.
+        Interim results replace each other until a final result for that
+        stretch of speech is yielded.
+        """
+        raise NotImplementedError
+
+
+class GoogleSpeechBackend(SpeechBackend):
+    name = "google"
+
+    def __init__(self):
+        from google.cloud import speech
+        from google.oauth2 import service_account
+
+        self.speech = speech
+        self.credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        self.project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
+
+        # Initialize Google Cloud Speech client
+        if self.credentials_path and os.path.exists(self.credentials_path):
+            credentials = service_account.Credentials.from_service_account_file(
+                self.credentials_path
+            )
+            self.client = speech.SpeechClient(credentials=credentials)
+        else:
+            logger.warning("Google Cloud credentials not found. Using default credentials.")
+            self.client = speech.SpeechClient()
+
+    def _build_recognition_config(self, encoding: str, sample_rate: int, channels: int):
+        """Recognition settings optimized for veterinary speech"""
+        speech = self.speech
+        return speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+            sample_rate_hertz=sample_rate,
+            audio_channel_count=channels,
+            language_code="en-US",
+            enable_automatic_punctuation=True,
+            enable_word_confidence=True,
+            enable_word_time_offsets=True,
+            enable_spoken_punctuation=True,
+            model="medical_conversation",  # Use medical model if available
+            use_enhanced=True,
+            # Add medical terminology hints
+            speech_contexts=[speech.SpeechContext(phrases=VETERINARY_PHRASES)]
+        )
+
+    def recognize(self, content: bytes, encoding: str, sample_rate: int, channels: int = 1) -> Dict[str, Any]:
+        config = self._build_recognition_config(encoding, sample_rate, channels)
+        response = self.client.recognize(config=config, audio=self.speech.RecognitionAudio(content=content))
+
+        # Combine all transcription results
+        transcript_parts = []
+        words = []
+        total_confidence = 0
+        confidence_count = 0
+
+        for result in response.results:
+            if result.alternatives:
+                alternative = result.alternatives[0]
+                transcript_parts.append(alternative.transcript)
+
+                # Calculate average confidence
+                if hasattr(alternative, 'confidence'):
+                    total_confidence += alternative.confidence
+                    confidence_count += 1
+
+                for word in alternative.words:
+                    words.append({
+                        "word": word.word,
+                        "start": word.start_time.total_seconds(),
+                        "end": word.end_time.total_seconds(),
+                        "confidence": word.confidence
+                    })
+
+        return {
+            "transcript": " ".join(transcript_parts).strip(),
+            "confidence": total_confidence / confidence_count if confidence_count > 0 else 0.0,
+            "words": words
+        }
+
+
+    def streaming_recognize(self, chunks: Iterable[bytes], sample_rate: int, channels: int = 1) -> Iterator[Dict[str, Any]]:
+        speech = self.speech
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=self._build_recognition_config("LINEAR16", sample_rate, channels),
+            interim_results=True
+        )
+        bytes_per_stream = STREAM_RESTART_SECONDS * sample_rate * 2 * channels
+        chunk_iter = iter(chunks)
+
+        # Each pass opens a new stream that carries at most STREAM_RESTART_SECONDS of audio
+        while True:
+            first_chunk = next(chunk_iter, None)
+            if first_chunk is None:
+                return
+
+            def requests(first_chunk=first_chunk):
+                sent = len(first_chunk)
+                yield speech.StreamingRecognizeRequest(audio_content=first_chunk)
+                if sent >= bytes_per_stream:
+                    return
+                for chunk in chunk_iter:
+                    sent += len(chunk)
+                    yield speech.StreamingRecognizeRequest(audio_content=chunk)
+                    if sent >= bytes_per_stream:
+                        return
+
+            for response in self.client.streaming_recognize(config=streaming_config, requests=requests()):
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    alternative = result.alternatives[0]
+                    yield {
+                        "transcript": alternative.transcript.strip(),
+                        "is_final": result.is_final,
+                        "confidence": alternative.confidence if result.is_final else 0.0
+                    }
+
+
+class SimulatedSpeechError(RuntimeError):
+    """Raised by the simulated backend to emulate provider failures"""
+
+    code = 503  # Service unavailable, like a provider brownout
+
+
+class SimulatedSpeechBackend(SpeechBackend):
+    """
+    In-process recognizer that sleeps instead of calling a provider.
+    Latency is base_latency plus realtime_factor seconds per second of audio,
+    and calls fail with probability error_rate.
+    """
+
+    name = "simulated"
+
+    WORDS = ["patient", "presented", "with", "mild", "lethargy", "temperature",
+             "normal", "heart", "rate", "steady", "plan", "recheck", "in", "two", "weeks"]
+
+    def __init__(
+        self,
+        base_latency: Optional[float] = None,
+        realtime_factor: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        words_per_second: float = 2.5,
+        seed: Optional[int] = None
+    ):
+        self.base_latency = base_latency if base_latency is not None else float(os.getenv("SIMULATED_SPEECH_LATENCY", "0.5"))
+        self.realtime_factor = realtime_factor if realtime_factor is not None else float(os.getenv("SIMULATED_SPEECH_REALTIME_FACTOR", "0"))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("SIMULATED_SPEECH_ERROR_RATE", "0"))
+        self.words_per_second = words_per_second
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _estimate_duration(self, content: bytes, encoding: str, sample_rate: int, channels: int) -> float:
+        if encoding == "LINEAR16":
+            return max(0, len(content) - 44) / float(sample_rate * 2 * channels)
+        if encoding == "FLAC":
+            # Speech compresses to roughly half of 16-bit PCM
+            return len(content) / float(sample_rate * channels)
+        # Compressed audio: assume ~32kbps
+        return len(content) / 4000.0
+
+    def recognize(self, content: bytes, encoding: str, sample_rate: int, channels: int = 1) -> Dict[str, Any]:
+        duration = self._estimate_duration(content, encoding, sample_rate, channels)
+
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+            jitter = self._random.uniform(0.9, 1.1)
+
+        time.sleep((self.base_latency + self.realtime_factor * duration) * jitter)
+        if fail:
+            raise SimulatedSpeechError("Simulated speech backend failure")
+
+        words = []
+        step = 1.0 / self.words_per_second
+        for i in range(int(duration * self.words_per_second)):
+            words.append({
+                "word": self.WORDS[i % len(self.WORDS)],
+                "start": i * step,
+                "end": i * step + step * 0.8,
+                "confidence": 0.92
+            })
+
+        return {
+            "transcript": " ".join(w["word"] for w in words),
+            "confidence": 0.92 if words else 0.0,
+            "words": words
+        }
+
+
+    def streaming_recognize(self, chunks: Iterable[bytes], sample_rate: int, channels: int = 1) -> Iterator[Dict[str, Any]]:
+        """Emit an interim result per chunk and a final result every utterance_seconds of audio"""
+        utterance_seconds = 5.0
+        bytes_per_second = float(sample_rate * 2 * channels)
+        elapsed = 0.0
+        utterance_start = 0.0
+        word_index = 0
+
+        def utterance(until: float) -> str:
+            count = int((until - utterance_start) * self.words_per_second)
+            return " ".join(self.WORDS[(word_index + i) % len(self.WORDS)] for i in range(count))
+
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+        if fail:
+            raise SimulatedSpeechError("Simulated speech stream failure")
+
+        for chunk in chunks:
+            elapsed += len(chunk) / bytes_per_second
+
+            if elapsed - utterance_start >= utterance_seconds:
+                text = utterance(elapsed)
+                word_index += len(text.split())
+                utterance_start = elapsed
+                if text:
+                    yield {"transcript": text, "is_final": True, "confidence": 0.92}
+            else:
+                text = utterance(elapsed)
+                if text:
+                    yield {"transcript": text, "is_final": False, "confidence": 0.0}
+
+        text = utterance(elapsed)
+        if text:
+            yield {"transcript": text, "is_final": True, "confidence": 0.92}
+
+
+def get_speech_backend(name: Optional[str] = None) -> SpeechBackend:
+    """Create the speech backend selected by name or the SPEECH_BACKEND setting"""
+    name = (name or os.getenv("SPEECH_BACKEND", "google")).lower()
+    if name == "google":
+        return GoogleSpeechBackend()
+    if name == "simulated":
+        return SimulatedSpeechBackend()
+    raise ValueError(f"Unknown speech backend: {name}")
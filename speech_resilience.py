@@ -0,0 +1,232 @@
+"""
+Failure handling for speech recognition in Pawscribed
+Classifies recognition errors as retryable or permanent, schedules retries
+with exponential backoff and jitter, and trips a circuit breaker when the
+speech provider's error rate spikes so workers stop dispatching until a
+probe succeeds.
+
+The breaker is per process: each worker observes its own calls to the provider.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for transcription jobs
+MAX_ATTEMPTS = int(os.getenv("TRANSCRIPTION_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("TRANSCRIPTION_RETRY_BASE_SECONDS", "15"))
+RETRY_MAX_SECONDS = float(os.getenv("TRANSCRIPTION_RETRY_MAX_SECONDS", "900"))
+
+# Circuit breaker: open when at least BREAKER_MIN_CALLS calls in the last
+# BREAKER_WINDOW_SECONDS failed at BREAKER_FAILURE_RATE or more
+BREAKER_FAILURE_RATE = float(os.getenv("SPEECH_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("SPEECH_BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("SPEECH_BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_OPEN_SECONDS = float(os.getenv("SPEECH_BREAKER_OPEN_SECONDS", "30"))
+
+# HTTP status codes (as carried by google.api_core exceptions) worth retrying:
+# timeouts, throttling and server-side failures
+RETRYABLE_STATUS_CODES = {408, 429, 499, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the circuit is open"""
+
+    def __init__(self, retry_at: datetime):
+        super().__init__("Speech provider circuit is open; call not attempted")
+        self.retry_at = retry_at
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Whether a recognition failure is transient. Provider errors are judged by
+    their status code; connection problems and timeouts are retried; anything
+    else (bad audio, bad credentials, bad request) is permanent.
+    """
+    if isinstance(error, CircuitOpenError):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, base_seconds: float = RETRY_BASE_SECONDS, max_seconds: float = RETRY_MAX_SECONDS):
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+
+    def should_retry(self, error: Exception, attempts: int) -> bool:
+        """attempts is the number of attempts made so far, including the one that failed"""
+        return attempts < self.max_attempts and is_retryable_error(error)
+
+    def backoff_seconds(self, attempts: int) -> float:
+        """Full jitter: uniform between zero and the exponential ceiling, so retries spread out"""
+        ceiling = min(self.max_seconds, self.base_seconds * (2 ** max(0, attempts - 1)))
+        return random.uniform(0, ceiling)
+
+    def next_attempt_at(self, attempts: int, now: Optional[datetime] = None) -> datetime:
+        return (now or datetime.utcnow()) + timedelta(seconds=self.backoff_seconds(attempts))
+
+
+class CircuitBreaker:
+    """
+    closed    - calls flow; outcomes are tracked over a sliding window
+    open      - calls are refused until open_seconds pass
+    half_open - a single probe call is let through (other calls wait for
+                its outcome); success closes the circuit, failure opens it again
+    Only retryable failures count against the provider.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        min_calls: int = BREAKER_MIN_CALLS,
+        window_seconds: float = BREAKER_WINDOW_SECONDS,
+        open_seconds: float = BREAKER_OPEN_SECONDS
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._probe_done = threading.Condition(self._lock)
+        self._state = self.CLOSED
+        self._outcomes: deque = deque()  # (monotonic time, succeeded)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._rejected_calls = 0
+        self._last_error: Optional[str] = None
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _refresh(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("Speech circuit half-open; probing provider")
+
+    def _open(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        self._times_opened += 1
+        self._probe_done.notify_all()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def retry_at(self) -> datetime:
+        """When an open circuit will next let a probe through"""
+        with self._lock:
+            remaining = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)) if self._state == self.OPEN else 0.0
+        return datetime.utcnow() + timedelta(seconds=remaining)
+
+    def dispatch_capacity(self, free_slots: int) -> int:
+        """How many new jobs a dispatcher may start: none while open, one probe while half-open"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == self.OPEN:
+                return 0
+            if self._state == self.HALF_OPEN:
+                return 0 if self._probe_in_flight else min(1, free_slots)
+            return free_slots
+
+    def before_call(self) -> None:
+        """
+        Reserve permission for one provider call (blocking while a probe is
+        in flight); raises CircuitOpenError if refused
+        """
+        with self._lock:
+            self._refresh(time.monotonic())
+            while self._state == self.HALF_OPEN and self._probe_in_flight:
+                self._probe_done.wait()
+                self._refresh(time.monotonic())
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = True
+                return
+            now = time.monotonic()
+            self._rejected_calls += 1
+            remaining = max(0.0, self.open_seconds - (now - self._opened_at))
+        raise CircuitOpenError(datetime.utcnow() + timedelta(seconds=remaining))
+
+    def record_success(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                self._probe_done.notify_all()
+                logger.info("Speech circuit closed; provider recovered")
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self, error: Exception) -> None:
+        if not is_retryable_error(error) or isinstance(error, CircuitOpenError):
+            # The provider answered; the request itself was bad
+            self.record_success()
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._last_error = str(error)
+            if self._state == self.HALF_OPEN:
+                self._open(now)
+                logger.warning(f"Speech circuit re-opened after failed probe: {str(error)}")
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+                logger.warning(
+                    f"Speech circuit opened: {failures}/{len(self._outcomes)} calls failed "
+                    f"in {self.window_seconds:.0f}s; pausing for {self.open_seconds:.0f}s"
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            self._trim(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                "state": self._state,
+                "window_seconds": self.window_seconds,
+                "window_calls": calls,
+                "window_failures": failures,
+                "window_failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "failure_rate_threshold": self.failure_rate,
+                "open_seconds": self.open_seconds,
+                "seconds_until_probe": round(max(0.0, self.open_seconds - (now - self._opened_at)), 1) if self._state == self.OPEN else 0.0,
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected_calls,
+                "last_error": self._last_error
+            }
+
+# Global instances
+speech_retry_policy = RetryPolicy()
+speech_circuit_breaker = CircuitBreaker()
@@ -0,0 +1,254 @@
+"""
+Structured output parsing for model responses
+One place to turn what Gemini sends back into validated data:
+  extract_json_object  - finds the JSON object in a response in one linear
+                         scan, tolerating code fences, preamble, trailing
+                         text, trailing commas and output cut off mid-object
+  validate             - checks the object against a small field schema,
+                         matching keys case-insensitively and coercing
+                         near-miss types (a list where a string belongs,
+                         "85%" for a score, ...)
+  parse_sections       - single-pass fallback for answers written as
+                         "SUBJECTIVE: ..." style headed sections
+"""
+
+import re
+import json
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+logger = logging.getLogger(__name__)
+
+SOAP_SCHEMA = {"subjective": str, "objective": str, "assessment": str, "plan": str}
+VALIDATION_SCHEMA = {"completeness_score": float, "missing_elements": list, "suggestions": list}
+FACTS_SCHEMA = {"subjective": list, "objective": list, "assessment": list, "plan": list}
+
+# Headers the section parser recognizes, by SOAP section. A header starts a
+# line (optionally after markdown markers) and ends with a colon or the line.
+SECTION_ALIASES = {
+    "subjective": ("subjective", "s", "history", "chief complaint"),
+    "objective": ("objective", "o", "physical exam", "physical examination", "examination"),
+    "assessment": ("assessment", "a", "diagnosis"),
+    "plan": ("plan", "p", "treatment", "treatment plan", "recommendations")
+}
+_ALIAS_TO_SECTION = {alias: section for section, aliases in SECTION_ALIASES.items() for alias in aliases}
+_HEADER = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*|__)?[ \t]*("
+    + "|".join(sorted((re.escape(alias) for alias in _ALIAS_TO_SECTION), key=len, reverse=True))
+    + r")[ \t]*(?:\*\*|__)?[ \t]*(?:\([^)\n]*\))?[ \t]*(?::[ \t]*(?:\*\*|__)?|[ \t]*$)",
+    re.IGNORECASE | re.MULTILINE
+)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+# Where a JSON object can start (so "{pet_name}" in prose isn't one), and
+# inside an object the tokens that matter: whole strings and brackets
+_OBJECT_START = re.compile(r'\{\s*["}]')
+_OBJECT_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*("?)|[{}\[\]]', re.DOTALL)
+_DECODER = json.JSONDecoder()
+_DANGLING_MEMBER = re.compile(r'(?:,\s*"[^"]*"\s*:?|,|:)\s*$')
+
+
+class ParseResult:
+    """data is None when nothing usable was found; method says how it was recovered"""
+
+    def __init__(self, data: Optional[Dict[str, Any]], method: Optional[str], errors: Optional[List[str]] = None):
+        self.data = data
+        self.method = method  # json, repaired, truncated, sections
+        self.errors = errors or []
+
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+
+
+def _scan_objects(text: str, position: int = 0) -> Iterator[Tuple[int, int, List[str], bool]]:
+    """
+    One pass over the text, yielding (start, end, open brackets, in string)
+    for each top-level object: complete objects have no open brackets, and
+    an object the text ends inside comes last with end == len(text).
+    Strings are skipped whole by the token pattern, so only brackets and
+    string boundaries are visited.
+    """
+    while True:
+        start_match = _OBJECT_START.search(text, position)
+        if start_match is None:
+            return
+        start = start_match.start()
+        stack = ["}"]
+        position = start + 1
+        while stack:
+            token = _OBJECT_TOKEN.search(text, position)
+            if token is None:
+                yield start, len(text), stack, False
+                return
+            position = token.end()
+            char = text[token.start()]
+            if char == '"':
+                if not token.group(1):
+                    yield start, len(text), stack, True
+                    return
+            elif char == "{":
+                stack.append("}")
+            elif char == "[":
+                stack.append("]")
+            elif stack[-1] == char:
+                stack.pop()
+        yield start, position, [], False
+
+
+def _loads_object(candidate: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """(object, repaired) for a candidate span, or (None, False)"""
+    try:
+        value = json.loads(candidate)
+        return (value, False) if isinstance(value, dict) else (None, False)
+    except json.JSONDecodeError:
+        pass
+    try:
+        value = json.loads(_TRAILING_COMMA.sub(r"\1", candidate))
+        return (value, True) if isinstance(value, dict) else (None, False)
+    except json.JSONDecodeError:
+        return None, False
+
+
+def _close_truncated(fragment: str, open_brackets: List[str], in_string: bool) -> str:
+    """Best-effort completion of an object cut off by the output limit"""
+    if in_string:
+        # Drop a dangling escape so the closing quote isn't escaped
+        if fragment.endswith("\\") and not fragment.endswith("\\\\"):
+            fragment = fragment[:-1]
+        fragment += '"'
+    fragment = fragment.rstrip()
+    # A key or value that never got started can't be recovered
+    fragment = _DANGLING_MEMBER.sub("", fragment)
+    return fragment + "".join(reversed(open_brackets))
+
+
+def extract_json_object(text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    The first JSON object in a model response, and how it was recovered
+    ("json", "repaired" or "truncated"); (None, None) if there is none.
+    Linear in the length of the text.
+    """
+    first = _OBJECT_START.search(text or "")
+    if first is None:
+        return None, None
+    # Well-formed output, with or without text after it, decodes directly
+    try:
+        value, _ = _DECODER.raw_decode(text, first.start())
+        if isinstance(value, dict):
+            return value, "json"
+    except json.JSONDecodeError:
+        pass
+    for start, end, open_brackets, in_string in _scan_objects(text, first.start()):
+        if open_brackets:
+            value, _ = _loads_object(_close_truncated(text[start:end], open_brackets, in_string))
+            return (value, "truncated") if value is not None else (None, None)
+        value, repaired = _loads_object(text[start:end])
+        if value is not None:
+            return value, "repaired" if repaired else "json"
+    return None, None
+
+
+def _coerce(value: Any, expected: type) -> Tuple[Any, bool]:
+    """(value as the expected type, whether that worked)"""
+    if value is None:
+        # A section the model left null is empty, not malformed
+        if expected is str:
+            return "", True
+        if expected is list:
+            return [], True
+        return None, False
+    if expected is str:
+        if isinstance(value, str):
+            return value, True
+        if isinstance(value, list):
+            return "\n".join(str(item) for item in value if item not in (None, "")), True
+        if isinstance(value, dict):
+            return "\n".join(f"{key}: {item}" for key, item in value.items()), True
+        return str(value), True
+    if expected is float:
+        if isinstance(value, bool):
+            return None, False
+        if isinstance(value, (int, float)):
+            return float(value), True
+        if isinstance(value, str):
+            number = value.strip()
+            percent = number.endswith("%")
+            try:
+                parsed = float(number.rstrip("%").strip())
+            except ValueError:
+                return None, False
+            return (parsed / 100.0 if percent else parsed), True
+        return None, False
+    if expected is list:
+        if isinstance(value, list):
+            return value, True
+        if isinstance(value, str):
+            return ([value] if value.strip() else []), True
+        return None, False
+    return (value, True) if isinstance(value, expected) else (None, False)
+
+
+def validate(data: Dict[str, Any], schema: Dict[str, type], required: Optional[List[str]] = None) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Validate and normalize an object against a field schema. Keys are matched
+    case-insensitively; fields missing from the object are left out unless
+    required, which fails validation. Unknown keys are kept as they are.
+    """
+    errors = []
+    by_lower = {str(key).strip().lower(): key for key in data}
+    result = {key: value for key, value in data.items() if str(key).strip().lower() not in schema}
+    for field, expected in schema.items():
+        key = by_lower.get(field)
+        if key is None:
+            if required and field in required:
+                errors.append(f"missing field '{field}'")
+            continue
+        value, ok = _coerce(data[key], expected)
+        if not ok:
+            errors.append(f"field '{field}' is not a {expected.__name__}")
+            continue
+        result[field] = value
+    return (result if not errors else None), errors
+
+
+def parse_sections(text: str) -> Dict[str, str]:
+    """SOAP sections from headed text in one pass; later repeats of a section are appended"""
+    sections: Dict[str, str] = {}
+    matches = list(_HEADER.finditer(text or ""))
+    for position, match in enumerate(matches):
+        section = _ALIAS_TO_SECTION[match.group(1).lower()]
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(text)
+        content = text[match.end():end].strip().strip("`").strip()
+        if content:
+            sections[section] = f"{sections[section]}\n{content}" if section in sections else content
+    return sections
+
+
+def parse_json_response(text: str, schema: Dict[str, type], required: Optional[List[str]] = None) -> ParseResult:
+    """A schema-checked JSON object from a response"""
+    data, method = extract_json_object(text)
+    if data is None:
+        return ParseResult(None, None, ["no JSON object found"])
+    validated, errors = validate(data, schema, required)
+    if validated is None:
+        return ParseResult(None, None, errors)
+    if method != "json":
+        logger.debug(f"Recovered model JSON ({method})")
+    return ParseResult(validated, method)
+
+
+def parse_soap_response(text: str) -> ParseResult:
+    """
+    SOAP sections from a response: the JSON object if it has any section
+    content, otherwise headed sections from the text
+    """
+    result = parse_json_response(text, SOAP_SCHEMA)
+    if result.ok:
+        soap = {section: result.data.get(section, "") for section in SOAP_SCHEMA}
+        if any(value.strip() for value in soap.values()):
+            return ParseResult(soap, result.method)
+
+    sections = parse_sections(text)
+    if sections:
+        return ParseResult({section: sections.get(section, "") for section in SOAP_SCHEMA}, "sections")
+    return ParseResult(None, None, result.errors or ["no SOAP sections found"])
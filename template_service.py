@@ -4,6 +4,7 @@ Handles built-in and custom templates for veterinary documentation
 """
 
 import json
+import hashlib
 import logging
 from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
@@ -287,6 +288,36 @@ class TemplateService:
             return self.builtin_templates[template_id]
         return None
     
+    @staticmethod
+    def template_version(template_data: Dict[str, Any]) -> str:
+        """Short hash of a template's content; changes whenever the template does"""
+        content = json.dumps(template_data, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    
+    def get_template(self, template_id: str, db: Optional[Session] = None, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        The template to generate with, by built-in id ("soap_standard"),
+        built-in type ("dental") or custom template id (needs db, and is
+        limited to the user's own templates when user_id is given). The
+        structure is returned with its "id" and content "version".
+        """
+        template_data = self.get_template_structure(template_id)
+        if template_data is None:
+            for builtin_id, builtin in self.builtin_templates.items():
+                if builtin["template_type"] == template_id:
+                    template_id, template_data = builtin_id, builtin
+                    break
+        if template_data is None and db is not None and str(template_id).isdigit():
+            query = db.query(Template).filter(Template.id == int(template_id), Template.is_active.is_(True))
+            if user_id is not None:
+                query = query.filter(Template.created_by == user_id)
+            template = query.first()
+            if template:
+                template_data = json.loads(template.template_content)
+        if template_data is None:
+            return None
+        return {**template_data, "id": str(template_id), "version": self.template_version(template_data)}
+    
     def create_custom_template(self, template_data: Dict[str, Any], user_id: int, db: Session) -> Template:
         """Create a custom template"""
         template = Template(
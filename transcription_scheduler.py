@@ -0,0 +1,248 @@
+"""
+Transcription job scheduler for Pawscribed
+Decides which queued jobs are claimed next: strictly by priority (live consults
+before normal uploads before backlog imports), and within a priority by
+weighted fair share between tenants, so one team's bulk upload cannot starve
+everyone else. A global cap bounds how many jobs run at once across all workers.
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from models import TranscriptionJob, TranscriptionStatus, TranscriptionPriority, User
+
+logger = logging.getLogger(__name__)
+
+# Jobs running at once across every worker process
+GLOBAL_MAX_CONCURRENT = int(os.getenv("TRANSCRIPTION_GLOBAL_MAX_CONCURRENT", "20"))
+
+# Relative share of transcription capacity per tenant, e.g. "team-a:3,team-b:2" (default 1)
+TENANT_WEIGHTS = os.getenv("TRANSCRIPTION_TENANT_WEIGHTS", "")
+
+# Window over which wait-time metrics are reported
+METRICS_WINDOW_MINUTES = 60
+
+# Postgres advisory lock key that serializes claiming, keeping the cap and shares exact
+CLAIM_LOCK_KEY = 728201
+
+UNASSIGNED_TENANT = "unassigned"
+
+
+def tenant_for_user(user: Optional[User]) -> Optional[str]:
+    """Tenant a user's jobs are scheduled under: their team, or the user alone"""
+    if user is None:
+        return None
+    return user.team_id or f"user:{user.id}"
+
+
+def parse_tenant_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        if ":" not in item:
+            continue
+        tenant, weight = item.rsplit(":", 1)
+        try:
+            weights[tenant.strip()] = max(0.01, float(weight))
+        except ValueError:
+            logger.warning(f"Ignoring invalid tenant weight '{item}'")
+    return weights
+
+
+class FairShareScheduler:
+    def __init__(self, weights: Optional[Dict[str, float]] = None, global_max_concurrent: int = GLOBAL_MAX_CONCURRENT):
+        self.weights = weights if weights is not None else parse_tenant_weights(TENANT_WEIGHTS)
+        self.global_max_concurrent = global_max_concurrent
+
+    def weight(self, tenant_id: Optional[str]) -> float:
+        return self.weights.get(tenant_id or UNASSIGNED_TENANT, 1.0)
+
+    def plan(
+        self,
+        queued: List[Tuple[Optional[str], int, int, datetime]],
+        running: Dict[Optional[str], int],
+        slots: int
+    ) -> List[Tuple[Optional[str], int, int]]:
+        """
+        Assign free slots to queues.
+        queued holds (tenant_id, priority, job_count, oldest_created_at) per queue;
+        running holds jobs currently running per tenant. Each slot goes to the
+        highest priority with work, and within it to the tenant using the least
+        capacity relative to its weight (oldest job first on ties).
+        Returns (tenant_id, priority, jobs_to_take), highest priority first.
+        """
+        remaining = {(tenant, priority): [count, oldest] for tenant, priority, count, oldest in queued if count > 0}
+        assigned = defaultdict(int)
+        plan: Dict[Tuple[Optional[str], int], int] = {}
+
+        for _ in range(slots):
+            if not remaining:
+                break
+            top_priority = max(priority for _, priority in remaining)
+            tenant, priority = min(
+                (key for key in remaining if key[1] == top_priority),
+                key=lambda key: (
+                    (running.get(key[0], 0) + assigned[key[0]]) / self.weight(key[0]),
+                    remaining[key][1]
+                )
+            )
+            assigned[tenant] += 1
+            plan[(tenant, priority)] = plan.get((tenant, priority), 0) + 1
+            remaining[(tenant, priority)][0] -= 1
+            if remaining[(tenant, priority)][0] == 0:
+                del remaining[(tenant, priority)]
+
+        return [(tenant, priority, count) for (tenant, priority), count in plan.items()]
+
+    def _running_by_tenant(self, db: Session, now: datetime) -> Dict[Optional[str], int]:
+        rows = db.query(TranscriptionJob.tenant_id, func.count(TranscriptionJob.id)).filter(
+            TranscriptionJob.status == TranscriptionStatus.PROCESSING,
+            TranscriptionJob.lease_expires_at >= now
+        ).group_by(TranscriptionJob.tenant_id).all()
+        return {tenant: count for tenant, count in rows}
+
+    def select_jobs(self, db: Session, claimable, now: datetime, limit: int) -> List[int]:
+        """
+        Pick up to `limit` claimable job ids in scheduling order. On Postgres the
+        rows are locked (SKIP LOCKED) and claimers are serialized for the rest of
+        the caller's transaction.
+        """
+        is_postgres = db.get_bind().dialect.name == "postgresql"
+        if is_postgres:
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CLAIM_LOCK_KEY})
+
+        running = self._running_by_tenant(db, now)
+        slots = min(limit, self.global_max_concurrent - sum(running.values()))
+        if slots <= 0:
+            return []
+
+        queued = db.query(
+            TranscriptionJob.tenant_id,
+            TranscriptionJob.priority,
+            func.count(TranscriptionJob.id),
+            func.min(TranscriptionJob.created_at)
+        ).filter(claimable).group_by(TranscriptionJob.tenant_id, TranscriptionJob.priority).all()
+
+        job_ids = []
+        for tenant, priority, count in self.plan(queued, running, slots):
+            tenant_filter = TranscriptionJob.tenant_id == tenant if tenant is not None else TranscriptionJob.tenant_id.is_(None)
+            query = db.query(TranscriptionJob.id).filter(
+                claimable,
+                tenant_filter,
+                TranscriptionJob.priority == priority
+            ).order_by(TranscriptionJob.created_at.asc()).limit(count)
+            if is_postgres:
+                query = query.with_for_update(skip_locked=True)
+            job_ids.extend(job_id for (job_id,) in query.all())
+        return job_ids
+
+    def queue_metrics(self, db: Session, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue depth and waiting times per tenant: jobs queued by priority,
+        jobs running, queued jobs waiting to retry after a failure, age of the
+        oldest queued job, and how long jobs claimed in the last
+        METRICS_WINDOW_MINUTES waited before starting.
+        """
+        now = datetime.utcnow()
+        window_start = now - timedelta(minutes=METRICS_WINDOW_MINUTES)
+        tenants: Dict[str, Dict[str, Any]] = {}
+
+        def tenant_entry(tenant: Optional[str]) -> Dict[str, Any]:
+            key = tenant or UNASSIGNED_TENANT
+            if key not in tenants:
+                tenants[key] = {
+                    "tenant_id": key,
+                    "weight": self.weight(tenant),
+                    "queued": {p.name.lower(): 0 for p in TranscriptionPriority},
+                    "queue_depth": 0,
+                    "retrying": 0,
+                    "running": 0,
+                    "oldest_wait_seconds": 0.0,
+                    "wait_seconds": {"count": 0, "avg": None, "p50": None, "p95": None, "max": None}
+                }
+            return tenants[key]
+
+        def scoped(query):
+            return query.filter(TranscriptionJob.tenant_id == tenant_id) if tenant_id else query
+
+        queued_rows = scoped(db.query(
+            TranscriptionJob.tenant_id,
+            TranscriptionJob.priority,
+            func.count(TranscriptionJob.id),
+            func.min(TranscriptionJob.created_at)
+        ).filter(
+            TranscriptionJob.status == TranscriptionStatus.PENDING
+        )).group_by(TranscriptionJob.tenant_id, TranscriptionJob.priority).all()
+
+        for tenant, priority, count, oldest in queued_rows:
+            entry = tenant_entry(tenant)
+            try:
+                entry["queued"][TranscriptionPriority(priority).name.lower()] += count
+            except ValueError:
+                entry["queued"][str(priority)] = count
+            entry["queue_depth"] += count
+            if oldest:
+                entry["oldest_wait_seconds"] = max(entry["oldest_wait_seconds"], (now - oldest).total_seconds())
+
+        retry_rows = scoped(db.query(
+            TranscriptionJob.tenant_id, func.count(TranscriptionJob.id)
+        ).filter(
+            TranscriptionJob.status == TranscriptionStatus.PENDING,
+            TranscriptionJob.attempts > 0
+        )).group_by(TranscriptionJob.tenant_id).all()
+        for tenant, count in retry_rows:
+            tenant_entry(tenant)["retrying"] = count
+        
+        retried_outcomes = dict(scoped(db.query(
+            TranscriptionJob.status, func.count(TranscriptionJob.id)
+        ).filter(
+            TranscriptionJob.completed_at >= window_start,
+            TranscriptionJob.attempts > 1
+        )).group_by(TranscriptionJob.status).all())
+        
+        for tenant, count in self._running_by_tenant(db, now).items():
+            if tenant_id is None or tenant == tenant_id:
+                tenant_entry(tenant)["running"] = count
+
+        started_rows = scoped(db.query(
+            TranscriptionJob.tenant_id, TranscriptionJob.created_at, TranscriptionJob.started_at
+        ).filter(
+            TranscriptionJob.started_at >= window_start,
+            TranscriptionJob.created_at.isnot(None)
+        )).all()
+
+        waits = defaultdict(list)
+        for tenant, created_at, started_at in started_rows:
+            waits[tenant].append(max(0.0, (started_at - created_at).total_seconds()))
+
+        for tenant, values in waits.items():
+            values.sort()
+            tenant_entry(tenant)["wait_seconds"] = {
+                "count": len(values),
+                "avg": round(sum(values) / len(values), 3),
+                "p50": round(values[int(0.50 * (len(values) - 1))], 3),
+                "p95": round(values[int(0.95 * (len(values) - 1))], 3),
+                "max": round(values[-1], 3)
+            }
+
+        return {
+            "generated_at": now.isoformat(),
+            "window_minutes": METRICS_WINDOW_MINUTES,
+            "global_max_concurrent": self.global_max_concurrent,
+            "running": sum(t["running"] for t in tenants.values()),
+            "queue_depth": sum(t["queue_depth"] for t in tenants.values()),
+            "retries": {
+                "waiting": sum(t["retrying"] for t in tenants.values()),
+                "completed_after_retry": retried_outcomes.get(TranscriptionStatus.COMPLETED, 0),
+                "failed_after_retry": retried_outcomes.get(TranscriptionStatus.FAILED, 0)
+            },
+            "tenants": sorted(tenants.values(), key=lambda t: t["tenant_id"])
+        }
+
+# Global instance
+transcription_scheduler = FairShareScheduler()
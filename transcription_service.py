@@ -1,154 +1,170 @@
 """
 Vertex AI Speech-to-Text transcription service
-Handles audio file transcription using Google Cloud Vertex AI
+Handles audio file transcription through a pluggable speech backend
+(Google Cloud Speech-to-Text by default)
 """
 
 import os
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+import socket
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from pathlib import Path
-from datetime import datetime
-from google.cloud import speech
-from google.oauth2 import service_account
-from sqlalchemy.orm import Session
-from models import TranscriptionJob, AudioFile, TranscriptionStatus
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_, text
+from sqlalchemy.orm import Session, sessionmaker
+from models import TranscriptionJob, AudioFile, TranscriptionStatus, TranscriptionPriority
+from audio_segmentation import WavAudio, plan_segments, stitch_segments
+from audio_preprocessing import audio_preprocessor
+from speech_backends import SpeechBackend, get_speech_backend
+from transcription_scheduler import transcription_scheduler, tenant_for_user
+from speech_resilience import speech_retry_policy, speech_circuit_breaker, CircuitOpenError
+from event_hub import event_hub
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 logger = logging.getLogger(__name__)
 
+# Long recordings are split into overlapping windows below the sync API limit (~60s)
+SEGMENT_SECONDS = float(os.getenv("TRANSCRIPTION_SEGMENT_SECONDS", "50"))
+SEGMENT_OVERLAP_SECONDS = float(os.getenv("TRANSCRIPTION_SEGMENT_OVERLAP_SECONDS", "2"))
+MAX_PARALLEL_SEGMENTS = int(os.getenv("TRANSCRIPTION_MAX_PARALLEL_SEGMENTS", "8"))
+
+# Job leasing: a claimed job must be renewed within LEASE_SECONDS or it is reclaimed
+LEASE_SECONDS = int(os.getenv("TRANSCRIPTION_LEASE_SECONDS", "120"))
+MAX_CONCURRENT_JOBS = int(os.getenv("TRANSCRIPTION_MAX_CONCURRENT_JOBS", "5"))
+POLL_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPTION_POLL_INTERVAL", "10"))
+
+# Postgres channel used to wake workers in other processes when a job is queued
+JOB_NOTIFY_CHANNEL = "transcription_jobs"
+
+def default_worker_id(role: str = "api") -> str:
+    """Identify this process in claimed_by"""
+    return f"{role}:{socket.gethostname()}:{os.getpid()}"
+
 class TranscriptionService:
-    def __init__(self):
-        self.credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        self.project_id = os.getenv("GOOGLE_CLOUD_PROJECT_ID")
-        
-        # Initialize Google Cloud Speech client
-        if self.credentials_path and os.path.exists(self.credentials_path):
-            credentials = service_account.Credentials.from_service_account_file(
-                self.credentials_path
-            )
-            self.client = speech.SpeechClient(credentials=credentials)
-        else:
-            logger.warning("Google Cloud credentials not found. Using default credentials.")
-            self.client = speech.SpeechClient()
+    def __init__(self, backend: Optional[SpeechBackend] = None):
+        # Backend is created on first use so importing this module (e.g. in the
+        # API process when transcription runs in dedicated workers) needs no credentials
+        self._backend = backend
+        
+        # Recognize calls are blocking; run them off the event loop
+        self.segment_executor = ThreadPoolExecutor(
+            max_workers=MAX_PARALLEL_SEGMENTS,
+            thread_name_prefix="speech-segment"
+        )
+        
+        # Outcomes of failed attempts in this process, for the metrics endpoint
+        self.failure_counts = {"retries_scheduled": 0, "failed_permanent": 0, "failed_retries_exhausted": 0}
+    
+    @property
+    def backend(self) -> SpeechBackend:
+        if self._backend is None:
+            self._backend = get_speech_backend()
+            logger.info(f"Using '{self._backend.name}' speech backend")
+        return self._backend
     
-    async def transcribe_audio(self, audio_file_path: str, job_id: int, db: Session) -> Dict[str, Any]:
+    def set_backend(self, backend: SpeechBackend) -> None:
+        """Swap the speech backend (e.g. the simulated backend for load tests)"""
+        self._backend = backend
+    
+    async def transcribe_audio(self, audio_file_path: str, job_id: int, session_factory: Callable[[], Session], worker_id: Optional[str] = None) -> Dict[str, Any]:
         """
-        Transcribe audio file using Google Cloud Speech-to-Text
+        Transcribe audio file using the configured speech backend.
+        Sessions from session_factory are open to update the job before and
+        after recognition, not while the speech backend runs.
+        When worker_id is given the job must still be leased to that worker
+        for results to be written; a worker whose lease was reclaimed discards its result.
         """
         try:
-            # Update job status to processing
-            job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
-            if not job:
-                return {"success": False, "error": "Transcription job not found"}
-            
-            job.status = TranscriptionStatus.PROCESSING
-            job.started_at = datetime.utcnow()
-            db.commit()
-            
-            logger.info(f"Starting transcription for job {job_id}: {audio_file_path}")
-            
-            # Read audio file
-            if not os.path.exists(audio_file_path):
-                error_msg = f"Audio file not found: {audio_file_path}"
-                logger.error(error_msg)
-                job.status = TranscriptionStatus.FAILED
-                job.error_message = error_msg
-                job.completed_at = datetime.utcnow()
+            db = session_factory()
+            try:
+                # Update job status to processing
+                job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
+                if not job:
+                    return {"success": False, "error": "Transcription job not found"}
+                
+                job.status = TranscriptionStatus.PROCESSING
+                if not job.started_at:
+                    job.started_at = datetime.utcnow()
                 db.commit()
-                return {"success": False, "error": error_msg}
-            
-            with open(audio_file_path, "rb") as audio_file:
-                content = audio_file.read()
-            
-            # Configure audio settings
-            audio = speech.RecognitionAudio(content=content)
-            
-            # Determine audio encoding from file extension
-            file_extension = Path(audio_file_path).suffix.lower()
-            if file_extension in ['.wav']:
-                encoding = speech.RecognitionConfig.AudioEncoding.LINEAR16
-            elif file_extension in ['.mp3']:
-                encoding = speech.RecognitionConfig.AudioEncoding.MP3
-            elif file_extension in ['.webm']:
-                encoding = speech.RecognitionConfig.AudioEncoding.WEBM_OPUS
-            elif file_extension in ['.m4a']:
-                encoding = speech.RecognitionConfig.AudioEncoding.MP3  # Fallback
-            else:
-                encoding = speech.RecognitionConfig.AudioEncoding.ENCODING_UNSPECIFIED
+                self.publish_job_update(job)
+                
+                logger.info(f"Starting transcription for job {job_id}: {audio_file_path}")
+                
+                # Read audio file
+                if not os.path.exists(audio_file_path):
+                    error_msg = f"Audio file not found: {audio_file_path}"
+                    logger.error(error_msg)
+                    job.status = TranscriptionStatus.FAILED
+                    job.error_message = error_msg
+                    job.completed_at = datetime.utcnow()
+                    db.commit()
+                    self.publish_job_update(job)
+                    return {"success": False, "error": error_msg}
+                
+                audio_file_id = job.audio_file_id if job.audio_file and job.audio_file.duration is None else None
+            finally:
+                db.close()
             
-            # Configure recognition settings optimized for veterinary speech
-            config = speech.RecognitionConfig(
-                encoding=encoding,
-                sample_rate_hertz=16000,  # Standard rate
-                language_code="en-US",
-                enable_automatic_punctuation=True,
-                enable_word_confidence=True,
-                enable_spoken_punctuation=True,
-                enable_spoken_numbers=True,
-                model="medical_conversation",  # Use medical model if available
-                use_enhanced=True,
-                # Add medical terminology hints
-                speech_contexts=[
-                    speech.SpeechContext(
-                        phrases=[
-                            # Common veterinary terms
-                            "SOAP", "subjective", "objective", "assessment", "plan",
-                            "temperature", "heart rate", "respiratory rate", "weight",
-                            "vaccination", "spay", "neuter", "anesthesia",
-                            "CBC", "chemistry panel", "radiograph", "ultrasound",
-                            "prescription", "medication", "dosage", "treatment",
-                            "examination", "palpation", "auscultation",
-                            "canine", "feline", "dog", "cat", "puppy", "kitten",
-                            "abdomen", "thorax", "lymph nodes", "mucous membranes",
-                            "capillary refill time", "body condition score"
-                        ]
-                    )
-                ]
-            )
+            # Whatever the upload's container, recognize 16 kHz mono PCM
+            loop = asyncio.get_running_loop()
+            normalized_path = await loop.run_in_executor(None, audio_preprocessor.normalize, audio_file_path)
+            try:
+                with WavAudio(normalized_path) as wav_audio:
+                    if audio_file_id is not None:
+                        db = session_factory()
+                        try:
+                            db.query(AudioFile).filter(
+                                AudioFile.id == audio_file_id,
+                                AudioFile.duration.is_(None)
+                            ).update({AudioFile.duration: wav_audio.duration}, synchronize_session=False)
+                            db.commit()
+                        finally:
+                            db.close()
+                    
+                    if wav_audio.duration > SEGMENT_SECONDS:
+                        recognition = await self._transcribe_segmented(wav_audio, job_id)
+                    else:
+                        recognition = await self._transcribe_whole(wav_audio, job_id)
+            finally:
+                audio_preprocessor.discard(normalized_path, audio_file_path)
             
-            # Perform transcription
-            logger.info(f"Sending audio to Google Cloud Speech API for job {job_id}")
-            response = self.client.recognize(config=config, audio=audio)
+            full_transcript = recognition["transcript"]
+            average_confidence = recognition["confidence"]
             
-            # Process results
-            if not response.results:
-                logger.warning(f"No transcription results for job {job_id}")
-                job.status = TranscriptionStatus.FAILED
-                job.error_message = "No speech detected in audio file"
+            db = session_factory()
+            try:
+                job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
+                if not job or not self._owns_job(job, worker_id, db):
+                    logger.warning(f"Lease on job {job_id} was lost by {worker_id}; discarding result")
+                    return {"success": False, "error": "Job lease lost"}
+                
+                # Process results
+                if not full_transcript:
+                    logger.warning(f"No transcription results for job {job_id}")
+                    job.status = TranscriptionStatus.FAILED
+                    job.error_message = "No speech detected in audio file"
+                    job.completed_at = datetime.utcnow()
+                    job.lease_expires_at = None
+                    db.commit()
+                    self.publish_job_update(job)
+                    return {"success": False, "error": "No speech detected in audio file"}
+                
+                logger.info(f"Transcription completed for job {job_id}. Length: {len(full_transcript)} chars")
+                
+                # Update job with results
+                job.status = TranscriptionStatus.COMPLETED
+                job.transcript = full_transcript
+                job.confidence_score = average_confidence
+                job.error_message = None
+                job.next_attempt_at = None
                 job.completed_at = datetime.utcnow()
+                job.lease_expires_at = None
                 db.commit()
-                return {"success": False, "error": "No speech detected in audio file"}
-            
-            # Combine all transcription results
-            transcript_parts = []
-            total_confidence = 0
-            confidence_count = 0
-            
-            for result in response.results:
-                if result.alternatives:
-                    alternative = result.alternatives[0]
-                    transcript_parts.append(alternative.transcript)
-                    
-                    # Calculate average confidence
-                    if hasattr(alternative, 'confidence'):
-                        total_confidence += alternative.confidence
-                        confidence_count += 1
-            
-            # Combine transcript
-            full_transcript = " ".join(transcript_parts).strip()
-            
-            # Calculate average confidence
-            average_confidence = total_confidence / confidence_count if confidence_count > 0 else 0.0
-            
-            logger.info(f"Transcription completed for job {job_id}. Length: {len(full_transcript)} chars")
-            
-            # Update job with results
-            job.status = TranscriptionStatus.COMPLETED
-            job.transcript = full_transcript
-            job.confidence_score = average_confidence
-            job.completed_at = datetime.utcnow()
-            db.commit()
+                self.publish_job_update(job)
+            finally:
+                db.close()
             
             return {
                 "success": True,
@@ -158,79 +174,514 @@ class TranscriptionService:
             }
             
         except Exception as e:
-            logger.error(f"Transcription failed for job {job_id}: {str(e)}", exc_info=True)
+            logger.error(f"Transcription failed for job {job_id}: {str(e)}", exc_info=not isinstance(e, CircuitOpenError))
+            
+            # Retry transient failures later; fail the job on permanent ones
+            db = session_factory()
+            try:
+                job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
+                if job and self._owns_job(job, worker_id, db):
+                    retrying = self._fail_or_retry(job, e)
+                    db.commit()
+                    self.publish_job_update(job)
+                    if retrying:
+                        return {"success": False, "error": str(e), "retry_at": job.next_attempt_at}
+            finally:
+                db.close()
             
-            # Update job with error
+            return {"success": False, "error": str(e)}
+    
+    def _fail_or_retry(self, job: TranscriptionJob, error: Exception) -> bool:
+        """
+        Requeue the job with backoff if the error is transient and attempts
+        remain, otherwise mark it failed. Returns True if a retry was scheduled.
+        The caller commits.
+        """
+        attempts = job.attempts or 0
+        job.claimed_by = None
+        job.lease_expires_at = None
+        
+        if isinstance(error, CircuitOpenError):
+            # The provider was never called; this attempt does not count
+            job.attempts = max(0, attempts - 1)
+            job.next_attempt_at = error.retry_at
+        elif speech_retry_policy.should_retry(error, attempts):
+            job.next_attempt_at = speech_retry_policy.next_attempt_at(attempts)
+        else:
+            exhausted = attempts >= speech_retry_policy.max_attempts
+            self.failure_counts["failed_retries_exhausted" if exhausted else "failed_permanent"] += 1
+            job.status = TranscriptionStatus.FAILED
+            job.error_message = f"{str(error)} (after {attempts} attempts)" if exhausted else str(error)
+            job.completed_at = datetime.utcnow()
+            job.next_attempt_at = None
+            return False
+        
+        self.failure_counts["retries_scheduled"] += 1
+        job.status = TranscriptionStatus.PENDING
+        job.error_message = f"Attempt {attempts} failed, retrying: {str(error)}"
+        logger.info(f"Job {job.id} will be retried at {job.next_attempt_at.isoformat()} (attempt {attempts} failed)")
+        return True
+    
+    def _owns_job(self, job: TranscriptionJob, worker_id: Optional[str], db: Session) -> bool:
+        """Check the job is still leased to worker_id (always true without a worker_id)"""
+        if worker_id is None:
+            return True
+        db.refresh(job)
+        return job.claimed_by == worker_id
+    
+    async def _transcribe_whole(self, wav_audio: WavAudio, job_id: int) -> Dict[str, Any]:
+        """Transcribe a short recording with a single recognize request"""
+        content = wav_audio.segment_bytes(0, wav_audio.duration)
+        
+        logger.info(f"Sending audio to {self.backend.name} speech backend for job {job_id}")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.segment_executor, self._recognize_wav, content, wav_audio.sample_rate, wav_audio.channels
+        )
+    
+    def _recognize_wav(self, content: bytes, sample_rate: int, channels: int) -> Dict[str, Any]:
+        """Compress a WAV payload and recognize it (blocking), through the circuit breaker"""
+        payload, encoding = audio_preprocessor.encode_payload(content)
+        speech_circuit_breaker.before_call()
+        try:
+            result = self.backend.recognize(payload, encoding, sample_rate, channels)
+        except Exception as e:
+            speech_circuit_breaker.record_failure(e)
+            raise
+        speech_circuit_breaker.record_success()
+        return result
+    
+    async def _transcribe_segmented(self, wav_audio: WavAudio, job_id: int) -> Dict[str, Any]:
+        """
+        Transcribe a long recording as overlapping windows in parallel.
+        Windows are sliced from the memory-mapped file as they are dispatched,
+        so at most MAX_PARALLEL_SEGMENTS windows are held in memory at once.
+        """
+        segments = plan_segments(wav_audio.duration, SEGMENT_SECONDS, SEGMENT_OVERLAP_SECONDS)
+        logger.info(
+            f"Transcribing job {job_id} as {len(segments)} segments "
+            f"({wav_audio.duration:.1f}s audio, up to {MAX_PARALLEL_SEGMENTS} in parallel)"
+        )
+        
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_SEGMENTS)
+        
+        async def transcribe_segment(start: float, end: float) -> Dict[str, Any]:
+            async with semaphore:
+                content = wav_audio.segment_bytes(start, end)
+                result = await loop.run_in_executor(
+                    self.segment_executor, self._recognize_wav,
+                    content, wav_audio.sample_rate, wav_audio.channels
+                )
+                result.update({"start": start, "end": end})
+                return result
+        
+        segment_results = await asyncio.gather(*(transcribe_segment(start, end) for start, end in segments))
+        return stitch_segments(segment_results)
+    
+    def _claimable(self, now: datetime):
+        """Pending jobs due for an attempt, plus processing jobs whose worker stopped renewing its lease"""
+        return or_(
+            and_(
+                TranscriptionJob.status == TranscriptionStatus.PENDING,
+                or_(TranscriptionJob.next_attempt_at.is_(None), TranscriptionJob.next_attempt_at <= now)
+            ),
+            and_(
+                TranscriptionJob.status == TranscriptionStatus.PROCESSING,
+                TranscriptionJob.lease_expires_at < now
+            )
+        )
+    
+    def claim_jobs(self, db: Session, worker_id: str, limit: int = 5) -> List[int]:
+        """
+        Atomically lease up to `limit` jobs to worker_id.
+        The scheduler picks candidates by priority and per-tenant fair share
+        within the global concurrency cap. On Postgres the candidate rows are
+        locked with SKIP LOCKED; every dialect then relies on a conditional
+        UPDATE so only one claimer can win a job.
+        """
+        now = datetime.utcnow()
+        claimable = self._claimable(now)
+        
+        candidate_ids = transcription_scheduler.select_jobs(db, claimable, now, limit)
+        
+        claimed_ids = []
+        for job_id in candidate_ids:
+            updated = db.query(TranscriptionJob).filter(
+                TranscriptionJob.id == job_id,
+                claimable
+            ).update(
+                {
+                    TranscriptionJob.status: TranscriptionStatus.PROCESSING,
+                    TranscriptionJob.claimed_by: worker_id,
+                    TranscriptionJob.lease_expires_at: now + timedelta(seconds=LEASE_SECONDS),
+                    TranscriptionJob.started_at: now,
+                    TranscriptionJob.attempts: TranscriptionJob.attempts + 1
+                },
+                synchronize_session=False
+            )
+            if updated == 1:
+                claimed_ids.append(job_id)
+        
+        db.commit()
+        
+        if claimed_ids:
+            logger.info(f"Worker {worker_id} claimed transcription jobs {claimed_ids}")
+        return claimed_ids
+    
+    def renew_leases(self, db: Session, worker_id: str, job_ids: List[int]) -> int:
+        """Extend the lease on jobs this worker is still processing"""
+        if not job_ids:
+            return 0
+        renewed = db.query(TranscriptionJob).filter(
+            TranscriptionJob.id.in_(job_ids),
+            TranscriptionJob.claimed_by == worker_id,
+            TranscriptionJob.status == TranscriptionStatus.PROCESSING
+        ).update(
+            {TranscriptionJob.lease_expires_at: datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)},
+            synchronize_session=False
+        )
+        db.commit()
+        return renewed
+    
+    def release_jobs(self, db: Session, worker_id: str, job_ids: List[int]) -> int:
+        """Hand unfinished jobs back to the queue (e.g. on shutdown)"""
+        if not job_ids:
+            return 0
+        released = db.query(TranscriptionJob).filter(
+            TranscriptionJob.id.in_(job_ids),
+            TranscriptionJob.claimed_by == worker_id,
+            TranscriptionJob.status == TranscriptionStatus.PROCESSING
+        ).update(
+            {
+                TranscriptionJob.status: TranscriptionStatus.PENDING,
+                TranscriptionJob.claimed_by: None,
+                TranscriptionJob.lease_expires_at: None,
+                # Interrupted by shutdown, not by a failure: the attempt does not count
+                TranscriptionJob.attempts: TranscriptionJob.attempts - 1
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        return released
+    
+    async def process_claimed_job(self, job_id: int, session_factory: Callable[[], Session], worker_id: Optional[str] = None) -> Dict[str, Any]:
+        """Transcribe a job that has already been claimed"""
+        db = session_factory()
+        try:
             job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
-            if job:
+            if not job:
+                return {"success": False, "error": "Transcription job not found"}
+            
+            # Get audio file path
+            audio_file = db.query(AudioFile).filter(
+                AudioFile.id == job.audio_file_id
+            ).first()
+            
+            # Identical audio may have finished transcribing since this job was queued
+            if audio_file and audio_file.content_hash:
+                source = self.find_reusable_transcript(audio_file.content_hash, db)
+                if source and self._owns_job(job, worker_id, db):
+                    self._complete_from(job, source)
+                    db.commit()
+                    self.publish_job_update(job)
+                    logger.info(f"Job {job.id} reused transcript of job {source.id}")
+                    return {"success": True, "transcript": job.transcript, "confidence": job.confidence_score, "job_id": job.id}
+            
+            if not audio_file or not os.path.exists(audio_file.file_path):
+                # Mark job as failed if audio file is missing
                 job.status = TranscriptionStatus.FAILED
-                job.error_message = str(e)
+                job.error_message = "Audio file not found"
                 job.completed_at = datetime.utcnow()
+                job.lease_expires_at = None
                 db.commit()
+                self.publish_job_update(job)
+                return {"success": False, "error": "Audio file not found"}
             
-            return {"success": False, "error": str(e)}
+            audio_file_path = audio_file.file_path
+        finally:
+            db.close()
+        
+        return await self.transcribe_audio(audio_file_path, job_id, session_factory, worker_id=worker_id)
     
-    async def process_transcription_queue(self, db: Session) -> None:
+    async def process_transcription_queue(self, db: Session, limit: int = 5, worker_id: Optional[str] = None) -> int:
         """
-        Process pending transcription jobs
+        Claim and process one batch of transcription jobs.
+        Returns the number of jobs this caller claimed.
         """
+        worker_id = worker_id or default_worker_id()
         try:
-            # Get pending jobs
-            pending_jobs = db.query(TranscriptionJob).filter(
-                TranscriptionJob.status == TranscriptionStatus.PENDING
-            ).order_by(TranscriptionJob.created_at.asc()).limit(5).all()
-            
-            if not pending_jobs:
-                return
+            claimed_ids = self.claim_jobs(db, worker_id, limit)
+            if not claimed_ids:
+                return 0
             
-            logger.info(f"Processing {len(pending_jobs)} pending transcription jobs")
+            # Each job gets its own sessions on db's engine; one session can't be shared across tasks
+            session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
             
             # Process jobs concurrently (but limit to avoid API rate limits)
-            tasks = []
-            for job in pending_jobs:
-                # Get audio file path
-                audio_file = db.query(AudioFile).filter(
-                    AudioFile.id == job.audio_file_id
-                ).first()
-                
-                if audio_file and os.path.exists(audio_file.file_path):
-                    task = self.transcribe_audio(audio_file.file_path, job.id, db)
-                    tasks.append(task)
-                else:
-                    # Mark job as failed if audio file is missing
-                    job.status = TranscriptionStatus.FAILED
-                    job.error_message = "Audio file not found"
-                    job.completed_at = datetime.utcnow()
-                    db.commit()
-            
-            # Wait for all transcriptions to complete
-            if tasks:
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                logger.info(f"Completed {len(results)} transcription tasks")
+            results = await asyncio.gather(
+                *(self.process_claimed_job(job_id, session_factory, worker_id) for job_id in claimed_ids),
+                return_exceptions=True
+            )
+            logger.info(f"Completed {len(results)} transcription tasks")
+            return len(claimed_ids)
                 
         except Exception as e:
             logger.error(f"Error processing transcription queue: {str(e)}", exc_info=True)
+            return 0
+    
+    def publish_job_update(self, job: TranscriptionJob) -> None:
+        """Push a job's new status to its owner (the transcript itself is fetched on demand)"""
+        audio_file = job.audio_file
+        if audio_file is None:
+            return
+        event_hub.publish("transcription.updated", {
+            "job_id": job.id,
+            "audio_file_id": job.audio_file_id,
+            "status": job.status.value if isinstance(job.status, TranscriptionStatus) else job.status,
+            "confidence_score": job.confidence_score,
+            "error_message": job.error_message,
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None
+        }, user_id=audio_file.user_id)
     
-    def create_transcription_job(self, audio_file_id: int, db: Session) -> TranscriptionJob:
+    def announce_new_job(self, db: Session) -> None:
+        """
+        Tell listening workers in other processes that a job was queued.
+        Postgres delivers the NOTIFY when the caller's transaction commits.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text(f"NOTIFY {JOB_NOTIFY_CHANNEL}"))
+    
+    def create_transcription_job(
+        self,
+        audio_file_id: int,
+        db: Session,
+        priority: TranscriptionPriority = TranscriptionPriority.NORMAL
+    ) -> TranscriptionJob:
         """
         Create a new transcription job
         """
+        audio_file = db.query(AudioFile).filter(AudioFile.id == audio_file_id).first()
         job = TranscriptionJob(
             audio_file_id=audio_file_id,
-            status=TranscriptionStatus.PENDING
+            status=TranscriptionStatus.PENDING,
+            priority=int(priority),
+            tenant_id=tenant_for_user(audio_file.user) if audio_file else None
         )
         db.add(job)
+        self.announce_new_job(db)
         db.commit()
         db.refresh(job)
         
         logger.info(f"Created transcription job {job.id} for audio file {audio_file_id}")
         return job
     
+    def find_reusable_transcript(self, content_hash: str, db: Session) -> Optional[TranscriptionJob]:
+        """Most recent completed transcription of audio with this content hash"""
+        return db.query(TranscriptionJob).join(AudioFile).filter(
+            AudioFile.content_hash == content_hash,
+            TranscriptionJob.status == TranscriptionStatus.COMPLETED,
+            TranscriptionJob.transcript.isnot(None)
+        ).order_by(TranscriptionJob.completed_at.desc()).first()
+    
+    def _complete_from(self, job: TranscriptionJob, source: TranscriptionJob) -> None:
+        """Finish job with the transcript of an identical recording"""
+        now = datetime.utcnow()
+        job.status = TranscriptionStatus.COMPLETED
+        job.transcript = source.transcript
+        job.confidence_score = source.confidence_score
+        job.error_message = None
+        job.next_attempt_at = None
+        job.started_at = job.started_at or now
+        job.completed_at = now
+        job.lease_expires_at = None
+    
+    def create_job_for_audio(
+        self,
+        audio_file: AudioFile,
+        db: Session,
+        priority: TranscriptionPriority = TranscriptionPriority.NORMAL
+    ) -> Tuple[TranscriptionJob, Optional[str]]:
+        """
+        Create the transcription job for an upload, avoiding repeat recognition of
+        identical audio. Returns (job, reuse) where reuse is:
+          "in_flight"  - the user's earlier job for this audio is still queued or running and is returned as is
+          "transcript" - a completed transcript of the same audio was copied; the new job is already complete
+          None         - a new pending job was queued
+        """
+        in_flight = db.query(TranscriptionJob).filter(
+            TranscriptionJob.audio_file_id == audio_file.id,
+            TranscriptionJob.status.in_([TranscriptionStatus.PENDING, TranscriptionStatus.PROCESSING])
+        ).order_by(TranscriptionJob.created_at.desc()).first()
+        if in_flight:
+            if priority > in_flight.priority:
+                in_flight.priority = int(priority)
+                db.commit()
+            logger.info(f"Audio file {audio_file.id} already has transcription job {in_flight.id} in progress")
+            return in_flight, "in_flight"
+        
+        source = self.find_reusable_transcript(audio_file.content_hash, db) if audio_file.content_hash else None
+        if source:
+            job = TranscriptionJob(
+                audio_file_id=audio_file.id,
+                priority=int(priority),
+                tenant_id=tenant_for_user(audio_file.user)
+            )
+            self._complete_from(job, source)
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            logger.info(f"Created transcription job {job.id} for audio file {audio_file.id} from transcript of job {source.id}")
+            return job, "transcript"
+        
+        return self.create_transcription_job(audio_file.id, db, priority), None
+    
     def get_job_status(self, job_id: int, db: Session) -> Optional[TranscriptionJob]:
         """
         Get transcription job status
         """
         return db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
 
+
+class TranscriptionDispatcher:
+    """
+    Keeps up to max_concurrent leased jobs in flight for one worker.
+    It claims more work as soon as a slot frees up or notify() is called (e.g.
+    right after an upload commits a job). On Postgres it also LISTENs for jobs
+    queued by other processes; polling every poll_interval seconds remains as a
+    fallback. Leases are renewed
+    while jobs run and unfinished jobs are released on shutdown.
+    """
+    
+    def __init__(
+        self,
+        service: "TranscriptionService",
+        session_factory: Callable[[], Session],
+        worker_id: str,
+        max_concurrent: int = MAX_CONCURRENT_JOBS,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+        engine=None
+    ):
+        self.service = service
+        self.engine = engine
+        self.session_factory = session_factory
+        self.worker_id = worker_id
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self.running = False
+        self.in_flight: Dict[int, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+    
+    def notify(self) -> None:
+        """Wake the dispatcher to look for new jobs immediately"""
+        self._wakeup.set()
+    
+    def stop(self) -> None:
+        self.running = False
+        self._wakeup.set()
+    
+    async def run(self) -> None:
+        self.running = True
+        heartbeat = asyncio.create_task(self._renew_leases())
+        listener = self._listen_for_jobs()
+        logger.info(f"Transcription dispatcher {self.worker_id} started (max {self.max_concurrent} concurrent jobs)")
+        
+        try:
+            while self.running:
+                # Clear before claiming so a notify() during the claim is not lost
+                self._wakeup.clear()
+                
+                # While the speech circuit is open nothing new starts; half-open allows one probe job
+                free_slots = speech_circuit_breaker.dispatch_capacity(self.max_concurrent - len(self.in_flight))
+                if free_slots > 0:
+                    try:
+                        self._start_jobs(await self._claim(free_slots))
+                    except Exception as e:
+                        logger.error(f"Failed to claim transcription jobs: {str(e)}", exc_info=True)
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            
+            # Graceful stop: let running jobs finish
+            if self.in_flight:
+                await asyncio.gather(*self.in_flight.values(), return_exceptions=True)
+        
+        finally:
+            heartbeat.cancel()
+            if listener is not None:
+                asyncio.get_running_loop().remove_reader(listener.fileno())
+                listener.close()
+            if self.in_flight:
+                unfinished = list(self.in_flight.keys())
+                for task in self.in_flight.values():
+                    task.cancel()
+                released = self._in_session(self.service.release_jobs, unfinished)
+                logger.info(f"Released {released} unfinished transcription jobs")
+            logger.info(f"Transcription dispatcher {self.worker_id} stopped")
+    
+    def _listen_for_jobs(self):
+        """LISTEN for job notifications on a dedicated Postgres connection"""
+        if self.engine is None or self.engine.dialect.name != "postgresql":
+            return None
+        try:
+            pool_connection = self.engine.raw_connection()
+            pool_connection.detach()  # Never hand a LISTENing connection back to the pool
+            connection = pool_connection.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {JOB_NOTIFY_CHANNEL}")
+            asyncio.get_running_loop().add_reader(connection.fileno(), self._on_notification, connection)
+            return connection
+        except Exception as e:
+            logger.warning(f"Job notifications unavailable, relying on polling: {str(e)}")
+            return None
+    
+    def _on_notification(self, connection) -> None:
+        connection.poll()
+        if connection.notifies:
+            connection.notifies.clear()
+            self.notify()
+    
+    def _in_session(self, method: Callable[..., Any], *args) -> Any:
+        """Call a service method with this worker's id in a session of its own"""
+        db = self.session_factory()
+        try:
+            return method(db, self.worker_id, *args)
+        finally:
+            db.close()
+    
+    async def _claim(self, limit: int) -> List[int]:
+        # Claiming queries and updates several rows; keep it off the event loop
+        return await asyncio.to_thread(self._in_session, self.service.claim_jobs, limit)
+    
+    def _start_jobs(self, job_ids: List[int]) -> None:
+        for job_id in job_ids:
+            task = asyncio.create_task(self._run_job(job_id))
+            self.in_flight[job_id] = task
+            task.add_done_callback(lambda _, job_id=job_id: self._job_done(job_id))
+    
+    def _job_done(self, job_id: int) -> None:
+        self.in_flight.pop(job_id, None)
+        self._wakeup.set()  # A slot is free
+    
+    async def _run_job(self, job_id: int) -> None:
+        try:
+            await self.service.process_claimed_job(job_id, self.session_factory, self.worker_id)
+        except Exception as e:
+            logger.error(f"Transcription job {job_id} crashed: {str(e)}", exc_info=True)
+    
+    async def _renew_leases(self) -> None:
+        interval = max(1.0, LEASE_SECONDS / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not self.in_flight:
+                continue
+            try:
+                await asyncio.to_thread(self._in_session, self.service.renew_leases, list(self.in_flight.keys()))
+            except Exception as e:
+                logger.error(f"Failed to renew transcription leases: {str(e)}", exc_info=True)
+
 # Global instance
 transcription_service = TranscriptionService()
\ No newline at end of file
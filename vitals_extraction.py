@@ -0,0 +1,167 @@
+"""
+Vital sign extraction for SOAP objective sections
+All vital sign phrasings are compiled into one pattern at import and the text
+is scanned once. Each match is converted to the units the SOAP section
+columns store (°F, beats and breaths per minute, lb); temperatures without a
+unit are read as °C when they are in the Celsius range. Values that are not
+physiologically possible for the species are rejected and the scan moves on
+to the next mention; the first plausible mention of each vital is used.
+"""
+
+import os
+import re
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Unit for weights written without one
+VITALS_DEFAULT_WEIGHT_UNIT = os.getenv("VITALS_DEFAULT_WEIGHT_UNIT", "lb").lower()
+
+KG_TO_LB = 2.20462
+G_TO_LB = 1 / 453.592
+# Unitless temperatures at or below this are Celsius
+CELSIUS_MAX = 45.0
+
+# Physiologically possible (not normal) ranges in stored units:
+# temperature °F, heart rate bpm, respiratory rate breaths/min, weight lb
+PLAUSIBLE_RANGES = {
+    "dog": {"temperature": (90, 110), "heart_rate": (30, 300), "respiratory_rate": (5, 150), "weight": (0.5, 250)},
+    "cat": {"temperature": (90, 110), "heart_rate": (60, 350), "respiratory_rate": (5, 150), "weight": (0.5, 40)},
+    "horse": {"temperature": (90, 108), "heart_rate": (15, 200), "respiratory_rate": (4, 120), "weight": (20, 3000)},
+    "cow": {"temperature": (95, 108), "heart_rate": (30, 200), "respiratory_rate": (5, 120), "weight": (20, 3500)},
+    "rabbit": {"temperature": (95, 110), "heart_rate": (100, 400), "respiratory_rate": (10, 200), "weight": (0.2, 25)},
+    "bird": {"temperature": (95, 115), "heart_rate": (100, 1000), "respiratory_rate": (10, 200), "weight": (0.01, 40)},
+}
+DEFAULT_RANGES = {"temperature": (85, 115), "heart_rate": (10, 1000), "respiratory_rate": (2, 250), "weight": (0.01, 3500)}
+SPECIES_ALIASES = {
+    "canine": "dog", "puppy": "dog",
+    "feline": "cat", "kitten": "cat",
+    "equine": "horse", "pony": "horse", "foal": "horse",
+    "bovine": "cow", "cattle": "cow", "calf": "cow",
+    "bunny": "rabbit",
+    "avian": "bird", "parrot": "bird", "budgie": "bird", "chicken": "bird",
+}
+
+_NUMBER = r"\d{1,4}(?:\.\d+)?"
+_LINK = r"[\s:=~]*(?:(?:of|was|is|at|approx\.?|approximately|about)\s+)?"
+_DEGREES = r"(?:°|º|deg(?:rees)?\.?)"
+_TEMP_UNIT = r"(?P<{u}>F|C|fahrenheit|celsius)"
+_WEIGHT_UNIT = r"(?P<{u}>kgs?|kilograms?|lbs?|pounds?|grams?|g)(?![a-z])"
+_PER_MINUTE = r"(?:per|/)\s*min(?:ute)?"
+
+# (vital, pattern) alternatives, tried left to right at each position; {v}
+# is the value group and {u}, {u2} unit groups. Case-sensitive abbreviations
+# (T, HR, RR, BW) keep "rr" in "error" or a stray "t" from reading as a label.
+# Unlabeled values need a unit that says what they are.
+_ALTERNATIVES: List[Tuple[str, str]] = [
+    ("temperature", r"\b(?:temp(?:erature)?|(?-i:T))\b" + _LINK + r"(?P<{v}>" + _NUMBER + r")\s*" + _DEGREES + r"?\s*" + _TEMP_UNIT + r"?(?![a-z])"),
+    ("temperature", r"(?<![\d.])(?P<{v}>\d{2,3}(?:\.\d+)?)\s*(?:" + _DEGREES + r"\s*" + _TEMP_UNIT + r"?|(?P<{u2}>F|C)(?![a-z]))"),
+    ("heart_rate", r"\b(?:(?-i:HR)|heart\s*rate|pulse(?:\s*rate)?)\b" + _LINK + r"(?P<{v}>\d{1,4})(?:\s*(?:bpm|beats\s*" + _PER_MINUTE + r"))?"),
+    ("heart_rate", r"(?<![\d.])(?P<{v}>\d{1,4})\s*(?:bpm|beats\s*" + _PER_MINUTE + r")\b"),
+    ("respiratory_rate", r"\b(?:(?-i:RR)|resp(?:iratory)?\.?\s*rate|respirations?|resp\.?|breathing\s*rate)(?![a-z])" + _LINK
+     + r"(?P<{v}>\d{1,3})(?:\s*(?:brpm|bpm|rpm|breaths\s*" + _PER_MINUTE + r"|/\s*min))?"),
+    ("respiratory_rate", r"(?<![\d.])(?P<{v}>\d{1,3})\s*(?:brpm|breaths\s*" + _PER_MINUTE + r")\b"),
+    ("weight", r"\b(?:weight|weighs|weighing|wt\.?|(?-i:BW))(?![a-z])" + _LINK + r"(?P<{v}>" + _NUMBER + r")\s*" + _WEIGHT_UNIT + "?"),
+    ("weight", r"(?<![\d.])(?P<{v}>" + _NUMBER + r")\s*(?P<{u}>kgs?|kilograms?|lbs?|pounds?)(?![a-z])"),
+]
+
+
+# Characters an alternative can start with (temp/T, heart/HR/pulse, resp/RR/breathing, weight/wt/BW)
+_FIRST_CHARS = r"[\dthprwb]"
+
+
+def _compile() -> Tuple[re.Pattern, Dict[str, str]]:
+    parts = []
+    vital_of = {}
+    for index, (vital, pattern) in enumerate(_ALTERNATIVES):
+        name = f"a{index}"
+        vital_of[name] = vital
+        pattern = pattern.replace("{v}", f"{name}_v").replace("{u2}", f"{name}_u2").replace("{u}", f"{name}_u")
+        parts.append(f"(?P<{name}>{pattern})")
+    # Every alternative starts with a digit or a label's first letter; checking that
+    # first skips the other positions without trying each alternative there
+    return re.compile(f"(?={_FIRST_CHARS})(?:{'|'.join(parts)})", re.IGNORECASE), vital_of
+
+
+VITALS_PATTERN, _VITAL_OF = _compile()
+
+
+def species_key(species: Optional[str]) -> Optional[str]:
+    if not species:
+        return None
+    key = species.strip().lower()
+    key = SPECIES_ALIASES.get(key, key)
+    return key if key in PLAUSIBLE_RANGES else None
+
+
+def plausible_range(vital: str, species: Optional[str] = None) -> Tuple[float, float]:
+    key = species_key(species)
+    return (PLAUSIBLE_RANGES[key] if key else DEFAULT_RANGES)[vital]
+
+
+class VitalsExtractor:
+    def __init__(self, default_weight_unit: str = VITALS_DEFAULT_WEIGHT_UNIT):
+        self.default_weight_unit = default_weight_unit
+
+    @staticmethod
+    def _unit(match: re.Match, name: str) -> str:
+        groups = match.re.groupindex
+        for group in (f"{name}_u", f"{name}_u2"):
+            if group in groups and match.group(group):
+                return match.group(group).lower()
+        return ""
+
+    def _normalize(self, vital: str, raw: str, unit: str) -> float:
+        value = float(raw)
+        if vital == "temperature":
+            celsius = unit in ("c", "celsius") or (not unit and value <= CELSIUS_MAX)
+            return round(value * 9 / 5 + 32, 1) if celsius else round(value, 1)
+        if vital == "weight":
+            unit = unit or self.default_weight_unit
+            if unit.startswith("k"):
+                return round(value * KG_TO_LB, 2)
+            if unit.startswith("g"):
+                return round(value * G_TO_LB, 3)
+            return round(value, 2)
+        return int(value)
+
+    def extract_detailed(self, text: str, species: Optional[str] = None) -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+        """(vitals in stored units, mentions rejected as implausible for the species)"""
+        vitals: Dict[str, float] = {}
+        rejected: List[Dict[str, Any]] = []
+        if not text:
+            return vitals, rejected
+        for match in VITALS_PATTERN.finditer(text):
+            name = match.lastgroup
+            vital = _VITAL_OF[name]
+            if vital in vitals:
+                continue
+            value = self._normalize(vital, match.group(f"{name}_v"), self._unit(match, name))
+            low, high = plausible_range(vital, species)
+            if low <= value <= high:
+                vitals[vital] = value
+            else:
+                rejected.append({"vital": vital, "text": match.group(name).strip(), "value": value})
+            if len(vitals) == len(DEFAULT_RANGES):
+                break
+        if rejected:
+            logger.debug(f"Rejected implausible vitals for {species or 'unknown species'}: {rejected}")
+        return vitals, rejected
+
+    def extract(self, text: str, species: Optional[str] = None) -> Dict[str, float]:
+        return self.extract_detailed(text, species)[0]
+
+    def filter_plausible(self, vitals: Dict[str, Any], species: Optional[str] = None) -> Dict[str, float]:
+        """Drop vitals (e.g. from model output) outside the species' possible range"""
+        kept = {}
+        for vital, value in (vitals or {}).items():
+            if vital not in DEFAULT_RANGES or not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            low, high = plausible_range(vital, species)
+            if low <= value <= high:
+                kept[vital] = value
+        return kept
+
+# Global instance
+vitals_extractor = VitalsExtractor()
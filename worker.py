@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Dedicated transcription worker for Pawscribed
+Runs transcription jobs in separate processes so speech recognition never
+competes with API request handling.
+
+Usage: python worker.py [--processes 2] [--max-concurrent 5] [--poll-interval 10] [--backend google|simulated]
+Set TRANSCRIPTION_MODE=worker on the API so it leaves the queue to these workers.
+"""
+
+import os
+import sys
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(processName)s %(name)s %(levelname)s %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionWorker:
+    def __init__(self, worker_id: str, poll_interval: float = 10.0, max_concurrent: int = 5):
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.max_concurrent = max_concurrent
+        self.dispatcher = None
+        self.stopped = False
+
+    async def run(self):
+        """Claim and process jobs until stopped"""
+        from database import SessionLocal, engine
+        from transcription_service import transcription_service, TranscriptionDispatcher
+
+        self.dispatcher = TranscriptionDispatcher(
+            transcription_service,
+            SessionLocal,
+            self.worker_id,
+            max_concurrent=self.max_concurrent,
+            poll_interval=self.poll_interval,
+            engine=engine
+        )
+        if self.stopped:
+            return
+        logger.info(f"Transcription worker {self.worker_id} started")
+        await self.dispatcher.run()
+        logger.info(f"Transcription worker {self.worker_id} stopped")
+
+    def stop(self):
+        self.stopped = True
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+
+
+def run_worker_process(index: int, poll_interval: float, max_concurrent: int, backend: str = None):
+    """Entry point for a single worker process"""
+    if backend:
+        os.environ["SPEECH_BACKEND"] = backend
+
+    worker_id = f"worker:{socket.gethostname()}:{os.getpid()}:{index}"
+    worker = TranscriptionWorker(worker_id, poll_interval, max_concurrent)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pawscribed transcription worker")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("TRANSCRIPTION_WORKERS", "2")))
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("TRANSCRIPTION_POLL_INTERVAL", "10")))
+    parser.add_argument("--max-concurrent", type=int, default=int(os.getenv("TRANSCRIPTION_MAX_CONCURRENT_JOBS", "5")),
+                        help="Jobs each worker process runs at once")
+    parser.add_argument("--backend", default=None, help="Speech backend: google or simulated")
+    args = parser.parse_args()
+
+    from database import create_database
+    create_database()
+
+    # Spawn (not fork) so each worker builds its own DB engine and speech client
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_worker_process,
+            args=(i, args.poll_interval, args.max_concurrent, args.backend),
+            name=f"transcription-worker-{i}"
+        )
+        for i in range(args.processes)
+    ]
+
+    def shutdown(signum, frame):
+        logger.info("Stopping transcription workers")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} transcription worker processes")
+
+    for process in processes:
+        process.join()
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()